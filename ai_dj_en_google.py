@@ -1,23 +1,38 @@
 import os
 import time
 import random
-import glob
 import re
 import csv
-import pygame
-import pytchat
 import asyncio
-import shutil
-import threading    
 from datetime import datetime, timezone, timedelta
-from google import genai
-from google.cloud import texttospeech
+from dj_lazy import lazy_import
+from dj_comments import CommentQueue, CommentFileTail, rank_comments
+from dj_chat import ChatPoller, YouTubeChatSource, ReplayChatSource
+from dj_duration import DurationIndex, format_duration
+from dj_loudness import LoudnessIndex
+from dj_voice_level import VoiceClips
+from dj_library import scan_library
+from dj_catalog import SongCatalog, parse_last_played
+from dj_selector import SelectionEngine, SessionRotation
+from dj_pipeline import TalkPipeline, remove_quietly
+from dj_tts_cache import TTSCache
+from dj_playlog import PlayLog, read_play_log, compact_csv, PLAY_LOG_PATH
+from dj_songdb import SQLiteSongStore, SONG_DB_PATH
+from dj_voice_stream import StreamingVoicePlayer, iterate_in_thread
+from dj_mixer import MixEngine
+from dj_sink import StreamMixEngine, claim_stdout
+from dj_events import PlaybackEvents
+from dj_prompt import PromptBook, PersonaContextCache, UsageMeter, generate_text, generate_batch
+
+# --- 重いモジュールは実際に使う時まで読み込まない（インポートだけなら音声デバイスもSDKも初期化しない）---
+pygame = lazy_import("pygame")
+genai = lazy_import("google.genai")
+texttospeech = lazy_import("google.cloud.texttospeech")
 
 # ==========================================
 # 1. 基本設定エリア
 # ==========================================
 api_key = os.environ.get("GEMINI_API_KEY")
-tts_client = texttospeech.TextToSpeechClient()
 
 # --- 選曲モード設定 ---
 RANDOM_MODE = False # Trueでランダム選曲    
@@ -28,26 +43,30 @@ BOOST_2 = 3.0 # play_flagに2をつけた場合の重み
 # --- YouTube設定 ----
 USE_YOUTUBE = False         # True（配信用）ならYouTube、Falseならcomment.txtを使用
 VIDEO_ID = "gng8rL2zcu8"   # YouTubeの動画ID（URLの最後にある英数字）ダブルクォーテーションで囲むこと
-comment_buffer = []      # YouTube用バッファ
+COMMENT_QUEUE = CommentQueue()   # YouTube用バッファ（上限・投稿者ごとのレート制限つき）
+CHAT_REPLAY_FILE = None     # ファイル名を入れると、YouTubeの代わりに記録したコメントを再生する（テスト・負荷試験用）
 # --------------------
 
 MUSIC_FOLDER = r"D:/Music"  # 音楽ファイルのフォルダ
 CSV_PATH = "musicdata.csv"  # 音楽データのCSVファイル
+USE_SQLITE = False  # Trueなら曲データを SQLite（musicdata.db）で持ち、時間帯スケールによる絞り込みをSQLで行う
 MODEL_NAME = 'gemini-2.5-flash' # LLMのモデル名（2026年2月現在'gemini-2.5-flash'は存在する）    
+PROMPT_TEMPLATES_PATH = "prompt_templates.json" # 指示文を差し替えたい時のJSON（無ければスクリプト内の既定を使う）
+USE_CONTEXT_CACHE = False # Trueならペルソナ部分をGeminiのコンテキストキャッシュに置き、毎回の入力トークンを減らす
 VOICE_CODE_GOOGLE = "en-GB" #Googleの声の言語コード
 VOICE_NAME_GOOGLE = "en-GB-Neural2-O" #Googleの声 #en-GB-Neural2-O #en-GB-Chirp3-HD-Sadachbia #en-GB-Chirp3-HD-Enceladus
 SPEAK_LANG = "English" #AIの言語設定
 
-if api_key:
-    client = genai.Client(api_key=api_key)
-else:
-    print("【Error】APIキーが設定されていません。")
-    exit()
+client = None       # Geminiクライアント（init() で作成）
+tts_client = None   # Google TTSクライアント（init() で作成）
 
 # --- 安定性のための定数 ---
 MAX_RETRIES = 3     # 最大リトライ回数
 RETRY_DELAY = 2.0   # リトライ待機時間（秒）
 TIMEOUT_SEC = 15.0  # API待機上限（秒）
+TALK_LOOKAHEAD = 2  # 先読みして準備しておく曲間トークの数
+COMMENT_TOP_K = 5  # トークに渡すコメントの件数（重複・スパムを除き、新しさと投稿者のばらけ具合で選ぶ）
+TALK_BATCH = 1  # 2以上にすると、先読みする台本をこの件数ずつ一回のリクエストでまとめて生成する
 DEFAULT_SCRIPT = "The stars are always there. Let the music speak for its essence."     #AIスクリプト生成失敗時のデフォルトスクリプト
 # --------------------
 
@@ -56,57 +75,51 @@ VOICE_LEVEL = 0.9    # DJ音量
 MUSIC_LEVEL = 0.8    # 音楽音量
 MAX_PLAY_TIME = 180  # 最大再生時間
 POST_TALK_WAIT = 3.0 # 話後待機時間
+STREAM_VOICE = False # Trueなら音声合成の完了を待たず、届いた分から話し始める
+USE_MIXER = False    # Trueなら曲と声をメモリ上でミックスし、クロスフェードと「曲の終わりに重ねるトーク」でつなぐ（Falseなら従来のフェードアウト→トーク）。今の曲と次の曲を丸ごとデコードして持つので、1曲あたり約10MB/分のメモリを使う
+CROSSFADE_SEC = 4.0  # 曲と曲のクロスフェードの長さ（秒）
+CROSSFADE_CURVE = "equal_power" # クロスフェードのカーブ（linear / equal_power / s_curve / exponential）
+DUCK_LEVEL = 0.35    # 話している間の音楽の音量（MUSIC_LEVEL に対する倍率）
+LOUDNESS_TARGET = -18.0 # 曲の音量を揃える先のラウドネス（LUFS）。python dj_loudness.py <音楽フォルダ> で解析した曲だけに効く
+VOICE_MATCH_LU = 0.0   # トークの声を、次の曲が鳴る大きさよりこれだけ大きく（LU）揃え、前後の無音も削る。None なら合成したまま流す
+OUTPUT_TARGET = None   # None ならPCのサウンドデバイスで鳴らす。"-"（標準出力）・ファイル名・FIFO を指定すると、ミックスしたPCMを書き出す（.wav ならWAV）
+OUTPUT_REALTIME = True # Falseなら実時間を待たずに書き出す（番組をWAVへレンダリングして確かめる用）
+OUTPUT_SECONDS = 0     # 0より大きいと、番組がこの秒数に達したところでクロージングへ進む
+GOOGLE_STREAM_RATE = 24000 # ストリーミング合成のサンプリング周波数（STREAM_VOICE時はChirp3-HD系の声を指定すること）
 # --------------------
 
 # ==========================================
 # 2. File & Metadata Management
 # ==========================================
 
-def load_persona(): # AIペルソナの読み込み    
-    if os.path.exists("persona.txt"):
-        with open("persona.txt", "r", encoding="utf-8") as f:
-            return f.read().strip() # persona.txtがない場合は、以下のデフォルトのペルソナを使用する
-    return f"You are Silas Requiem, a sophisticated AI DJ for a classical program. Use elegant, philosophical {SPEAK_LANG} only."
+def load_persona(): # ペルソナの読み込み（persona.txt が更新された時だけ読み直す）
+    return PROMPTS.persona()
+
+def track_gain(song_id): # 曲ごとの音量補正の倍率（解析していない曲は 1.0）。MUSIC_LEVEL に掛けて使う
+    return LOUDNESS_INDEX.gain(SONG_FILES[song_id], LOUDNESS_TARGET)
+
+def voice_target(song_id): # トークの声の目標ラウドネス（次の曲が実際に鳴る大きさ + VOICE_MATCH_LU）
+    return LOUDNESS_INDEX.playback_lufs(SONG_FILES[song_id], LOUDNESS_TARGET) + VOICE_MATCH_LU
 
 def get_and_clear_comments(): # 配信スイッチに基づいてコメント取得先を自動で切り替える
     if USE_YOUTUBE: # YouTubeモード：メモリ上のコメントバッファを返す
-        global comment_buffer
-        if not comment_buffer: return ""
-        content = "\n".join(comment_buffer)
-        comment_buffer.clear()
-        return content
-    else: # ローカルモード：既存のcomment.txtを読み込む
-        src = "comment.txt"
-        tmp = "comment_work.txt"
-        content = ""
-        
-        if os.path.exists(src):
-            try:
-                # ファイル名を変更することで、外部ツールからの追記を遮断し、占有権を確保する
-                shutil.move(src, tmp)
-                with open(tmp, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-                    content = "".join(lines[-100:]).strip()  # 最後の100行だけ読み込む
-                os.remove(tmp) # 処理後に削除
-            except Exception as e:
-                print(f"   [System] File sync error: {e}")
-        return content
+        return COMMENT_QUEUE.drain_text()
+    else: # ローカルモード：comment.txt に前回から追記された分だけを読む（ファイルは移動も削除もしない）
+        return COMMENT_TAIL.read_text()
 
-def fetch_comments_sync(video_id):
-    if not USE_YOUTUBE: return
+def load_song_store(): # SQLite版の読み込み（CSVが前回の取り込みより新しければ取り込み直す）
     try:
-        # 信号処理（interruptable）をオフにする。これでエラーを封殺する。
-        chat = pytchat.create(video_id, interruptable=False)
-        while chat.is_alive():
-            for c in chat.get().items:
-                comment_buffer.append(f"{c.author.name}: {c.message}")
-                if len(comment_buffer) > 100: comment_buffer.pop(0)
-            time.sleep(1)
+        SONG_STORE.sync_from_csv(CSV_PATH)
+        SONG_STORE.apply_play_log(read_play_log(PLAY_LOG_PATH))
+        return SONG_STORE.load_song_db()
     except Exception as e:
-        print(f"   [System] YouTube Chat monitor error: {e}")
+        print(f"   [Error] SQLite Load Failed: {e}")
+        return SongCatalog()
 
 def load_song_database(): # 音楽CSVの読み込み
-    song_db = {}
+    if SONG_STORE is not None:
+        return load_song_store()
+    song_db = SongCatalog()
     if not os.path.exists(CSV_PATH): 
         return song_db
     try:
@@ -114,30 +127,29 @@ def load_song_database(): # 音楽CSVの読み込み
             reader = csv.DictReader(f)
             for row in reader:
                 try:
-                    key_id = int(row['id'])
-                    song_db[key_id] = {
-                        'play_flag': int(row.get('play_flag', 0)),
-                        'time_scale': float(row.get('time_scale', 5)), 
-                        'last_played': row.get('last_played', ''),
-                        'title': row.get('title', 'Unknown Title'),
-                        'composer': row.get('composer', 'Unknown Composer'),
-                        'performer': row.get('performer', 'Unknown Performer'),
-                    }
-                except ValueError: continue
+                    song_db.add(
+                        int(row['id']),
+                        play_flag=int(row.get('play_flag', 0)),
+                        time_scale=float(row.get('time_scale', 5)),
+                        last_played=row.get('last_played', ''),
+                        title=row.get('title', 'Unknown Title'),
+                        composer=row.get('composer', 'Unknown Composer'),
+                        performer=row.get('performer', 'Unknown Performer'),
+                    )
+                except (TypeError, ValueError, OverflowError): continue   # 欠けた行・不正な値の行だけを飛ばす
     except Exception as e: print(f"   [Error] CSV Load Failed: {e}")
+
+    # CSVへ書き戻す前に落ちた放送の再生履歴を、再生ログから取り戻す
+    for sid, played_at in read_play_log(PLAY_LOG_PATH).items():
+        song_db.set_last_played(sid, parse_last_played(played_at))
     return song_db
 
-def scan_music_files(): # 音楽ファイルのスキャン    
-    files_map = {}
-    all_files = glob.glob(os.path.join(MUSIC_FOLDER, "*.mp3"))
-    for path in all_files:
-        match = re.match(r"(\d+)", os.path.basename(path))
-        if match: files_map[int(match.group(1))] = path
-    return files_map
+def scan_music_files(): # 音楽ファイルのスキャン（サブフォルダ込み。前回から変化したフォルダだけを読み直す）
+    return scan_library(MUSIC_FOLDER)
 
 def get_song_info(song_id): # 曲情報の取得
     if song_id in SONG_DB:
-        return SONG_DB[song_id]
+        return SONG_DB.info(song_id)
     if song_id in SONG_FILES:
         fn = os.path.basename(SONG_FILES[song_id])
         return {'title': fn, 'composer': 'Unknown', 'performer': 'Unknown'}
@@ -155,111 +167,128 @@ def get_target_scale(): # 目標スケールの取得
     # 正午（43200秒）との距離に基づき、1.0から9.0の間で変動させる
     return 9.0 - (abs(43200 - seconds) / 43200.0) * 8.0
 
-def select_next_song_weighted(song_db, available_ids): # 選曲エンジン   
-    t_target = get_target_scale()
-    now_ts = get_now_jst().timestamp()
-    
-    candidates, weights = [], []
-    for sid in available_ids:
-        song = song_db.get(sid)
-        if not song or song.get('play_flag', 0) == 0: continue
-        
-        p_logic = BOOST_2 if song.get('play_flag') == 2 else 1.0
-        s_val = song.get('time_scale', 5.0)
-        
-        lp = song.get('last_played', '')
-        try:
-            time_diff = (now_ts - datetime.fromisoformat(lp).timestamp()) if lp else 86400.0
-        except:
-            time_diff = 86400.0
-        
-        if RANDOM_MODE: 
-            w = p_logic * time_diff
-        else:
-            # 指定されたスケールと曲のスケールの距離を算出
-            dist = abs(t_target - s_val)
-            # 距離が近いほど重みを指数関数的に増大させる
-            w = (p_logic / ((dist + 1.0) ** 2)) * time_diff # 2をつけると重みが増える   
-            if dist > 3.0:
-                w *= 0.000001
-        
-        candidates.append(sid)
-        weights.append(w)
-        
-    if not candidates: 
-        return random.choice(available_ids) if available_ids else None # 重み付け選曲ができない場合はランダム選曲
-    return random.choices(candidates, weights=weights, k=1)[0]
+def select_next_song_weighted(rotation): # 選曲エンジン（rotation の未再生曲から、SELECTOR の配列上で一括抽選）
+    if SONG_STORE is not None:   # SQLite版：目標スケール付近の曲だけをSQLで取り出して抽選する
+        return SONG_STORE.select_weighted(rotation, get_target_scale(), get_now_jst().timestamp(), BOOST_2, RANDOM_MODE)
+    return SELECTOR.select(rotation, get_target_scale(), get_now_jst().timestamp(), RANDOM_MODE)
 
 def mark_as_played(song_id):
-    #"""ファイルへの書き込みを排除し、メモリ上のデータベースのみを更新する"""
-    now_str = get_now_jst().isoformat()
-    if song_id in SONG_DB:
-        SONG_DB[song_id]['last_played'] = now_str
+    #"""メモリ上のデータベースを更新し、再生ログへ一行だけ追記する（CSVの全書き換えはしない）"""
+    now = get_now_jst()
+    SONG_DB.set_last_played(song_id, now.timestamp())
+    SELECTOR.mark_played(song_id, now.timestamp())
+    PLAY_LOG.append(song_id, now.isoformat())
+    if SONG_STORE is not None:
+        SONG_STORE.mark_played(song_id, now.isoformat(), now.timestamp())
 
 def save_song_database():
-    #"""蓄積されたメモリ上の情報を、一度だけファイルへ記録する"""
+    #"""再生ログの内容をCSVへ書き戻す（一時ファイル経由で置き換え、書き戻した分のログは捨てる）"""
     if not os.path.exists(CSV_PATH) or not SONG_DB:
+        PLAY_LOG.disable_compaction()   # 書き戻し先が無い。ログは残し、曲ごとに書き戻しを試みない
         return
-    
-    fieldnames = []
-    with open(CSV_PATH, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
-
-    with open(CSV_PATH, 'w', encoding='utf-8-sig', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for sid, info in SONG_DB.items():
-            row = {'id': sid}
-            row.update(info)
-            writer.writerow(row)
+    pos = PLAY_LOG.position()
+    compact_csv(CSV_PATH, read_play_log(PLAY_LOG_PATH))   # ログにある分だけを書き戻す（他の行はそのまま）
+    PLAY_LOG.discard_through(pos)
+    if SONG_STORE is not None:
+        SONG_STORE.mark_csv_synced(CSV_PATH)
 
 # ----------------------------
 
-SONG_DB = load_song_database()
-SONG_FILES = scan_music_files()
+# 曲データ・ファイル一覧・選曲エンジンは起動時に bootstrap() が並列で読み込む
+SONG_DB = SongCatalog()
+SONG_FILES = {}
+SELECTOR = None
+DURATION_INDEX = None   # 曲の長さインデックス（init() で読み込む）
+LOUDNESS_INDEX = None   # 曲ごとのラウドネス（init() で読み込む。解析は dj_loudness.py）
+TTS_CACHE = None        # 合成音声キャッシュ（init() で作成）
+PLAY_LOG = None         # 再生ログ（init() で開く）
+SONG_STORE = None       # SQLite版の曲データベース（USE_SQLITE のとき init() で開く）
+VOICE_CLIPS = VoiceClips() # 音量を揃えたトークの声（デコード済みの配列のまま、再生まで持っておく）
+COMMENT_TAIL = None     # comment.txt の読み取り位置（init() で開き、前回の続きから読む）
 
 # ==========================================
 # 3. AI Script Generation & Voice Synthesis
 # ==========================================
 
+PROMPT_TEMPLATES = { # 指示文のテンプレート（{...} が差し込み口。prompt_templates.json があれば同じキーで上書きできる）
+    "time": "Briefly touch upon the feeling of this hour: {hour} (UTC{utc_offset:+}). Do not mention exact time.",
+    "opening": "Write a program opening. Greet listeners. {time_context} Approx 100 words. Do NOT describe sound effects (e.g. 'music starts'). Write ONLY the spoken {lang} words.",
+    "closing": "Write a program closing. Bid farewell to the day. Approx 100 words. Do NOT describe sound effects. Write ONLY the spoken {lang} words.",
+    "song": "'{title}' by {composer}, performed by {performer}",
+    "comment_block": "\n【Messages from Unpurified Souls】\n{comments}\n",
+    "talk": "Briefly reflect on {current}. {time_context} Then provide a sophisticated introduction for {next}. Approx 150 words. Do NOT include sound effects. Write ONLY the spoken words.",
+    "talk_comments": (
+        "[SPEECH SECTION]\n"
+        "Write a 150-word script. Briefly Reflect on {current}. "
+        "Then, summarize the essence of one listener's message and offer a warm, thoughtful response addressing them by name that provides genuine comfort."
+        "Finally, Briefly introduce {next}.\n"
+        "CRITICAL: Use ONLY {lang}. NO other languages are allowed in this section. Do NOT use numbering, bullet points, separators, or asterisks.\n\n"
+        "[LOG SECTION]\n"
+        "Provide a brief Japanese translation of your response to the listener, prefixed with '[LOG]'.\n\n"
+        "Messages from Unpurified Souls:\n{comments}"
+    ),
+    "batch": (
+        "Write {count} separate between-song talk scripts for a continuous program, one for each transition below.\n"
+        "{items}\n"
+        "Each script: approx 150 words of spoken {lang} only. Do NOT include sound effects or stage directions.\n"
+        "Return ONLY a JSON array of {count} objects in the same order, each like {{\"index\": 1, \"script\": \"...\"}}."
+    ),
+    "batch_item": "{index}. Briefly reflect on {current}. {time_context} Then provide a sophisticated introduction for {next}.",
+    "frame": "{persona}\n\n{comment_part}\n\n[Request]\n{instruction}\n\n*Write in elegant {lang} only (except after [LOG] if requested). Strictly NO sound effects or stage directions.",
+}
+
+DEFAULT_PERSONA = f"You are Silas Requiem, a sophisticated AI DJ for a classical program. Use elegant, philosophical {SPEAK_LANG} only."
+PROMPTS = PromptBook(PROMPT_TEMPLATES, "persona.txt", DEFAULT_PERSONA, PROMPT_TEMPLATES_PATH, constants={'lang': SPEAK_LANG, 'utc_offset': UTC_OFFSET})
+PERSONA_CACHE = PersonaContextCache() if USE_CONTEXT_CACHE else None
+LLM_USAGE = UsageMeter()   # リクエスト数・トークン数の記録
+
 async def generate_script_async(prompt_type, current_info=None, next_info=None, comments=None): #トークスクリプトを生成する
-    persona_setting = load_persona()
     comment_part = ""
 
     is_seasonal = (prompt_type in ["opening", "closing"]) or (random.random() < 0.3) # 30%の確率で季節の挨拶を含める
     now_local = get_now_jst()  # 現在時刻
-    time_context = f"Briefly touch upon the feeling of this hour: {now_local.strftime('%Y-%m-%d %H')} (UTC{UTC_OFFSET:+}). Do not mention exact time." if is_seasonal else ""
-    
-    if prompt_type == "opening":
-        instruction = f"Write a program opening. Greet listeners. {time_context} Approx 100 words. Do NOT describe sound effects (e.g. 'music starts'). Write ONLY the spoken {SPEAK_LANG} words."
-    elif prompt_type == "closing":
-        instruction = f"Write a program closing. Bid farewell to the day. Approx 100 words. Do NOT describe sound effects. Write ONLY the spoken {SPEAK_LANG} words."
+    time_context = PROMPTS.render("time", hour=now_local.strftime('%Y-%m-%d %H')) if is_seasonal else ""
+
+    if prompt_type in ("opening", "closing"):
+        instruction = PROMPTS.render(prompt_type, time_context=time_context)
     else:
-        c_text = f"'{current_info['title']}' by {current_info['composer']}, performed by {current_info['performer']}"
-        n_text = f"'{next_info['title']}' by {next_info['composer']}, performed by {next_info['performer']}"
+        c_text = PROMPTS.render("song", **current_info)
+        n_text = PROMPTS.render("song", **next_info)
         if comments:
-            comment_part = f"\n【Messages from Unpurified Souls】\n{comments}\n"
-            instruction = (
-                f"[SPEECH SECTION]\n"
-                f"Write a 150-word script. Briefly Reflect on {c_text}. "
-                f"Then, summarize the essence of one listener's message and offer a warm, thoughtful response addressing them by name that provides genuine comfort."
-                f"Finally, Briefly introduce {n_text}.\n"
-                f"CRITICAL: Use ONLY {SPEAK_LANG}. NO other languages are allowed in this section. Do NOT use numbering, bullet points, separators, or asterisks.\n\n"
-                f"[LOG SECTION]\n"
-                f"Provide a brief Japanese translation of your response to the listener, prefixed with '[LOG]'.\n\n"
-                f"Messages from Unpurified Souls:\n{comments if comments else 'None'}"
-            )
+            comment_part = PROMPTS.render("comment_block", comments=comments)
+            instruction = PROMPTS.render("talk_comments", current=c_text, next=n_text, comments=comments)
         else:
-            instruction = f"Briefly reflect on {c_text}. {time_context} Then provide a sophisticated introduction for {n_text}. Approx 150 words. Do NOT include sound effects. Write ONLY the spoken words."
-
-    prompt = f"{persona_setting}\n\n{comment_part}\n\n[Request]\n{instruction}\n\n*Write in elegant {SPEAK_LANG} only (except after [LOG] if requested). Strictly NO sound effects or stage directions."
+            instruction = PROMPTS.render("talk", current=c_text, next=n_text, time_context=time_context)
 
     try:
-        response = client.models.generate_content(model=MODEL_NAME, contents=prompt)
-        return response.text.strip()
+        # 非同期クライアントで呼び出し、通信中もイベントループ（再生監視・タイムアウト）を止めない
+        return await generate_text(client, MODEL_NAME, PROMPTS, PERSONA_CACHE, LLM_USAGE,
+                                   comment_part=comment_part, instruction=instruction)
     except Exception as e: return f"System Error: {e}"
 
+async def generate_scripts_batch(pairs): # 先読みした複数のつなぎ目の台本を、一回のリクエストでまとめて生成する
+    now_local = get_now_jst()
+    items = []
+    for i, (current_info, next_info) in enumerate(pairs):
+        is_seasonal = random.random() < 0.3 # 30%の確率で季節の挨拶を含める
+        time_context = PROMPTS.render("time", hour=now_local.strftime('%Y-%m-%d %H')) if is_seasonal else ""
+        items.append(PROMPTS.render("batch_item", index=i + 1, time_context=time_context,
+                                    current=PROMPTS.render("song", **current_info), next=PROMPTS.render("song", **next_info)))
+    instruction = PROMPTS.render("batch", count=len(pairs), items="\n".join(items))
+    try:
+        # 応答が長くなる分、待ち時間の上限は件数に応じて延ばす
+        scripts = await asyncio.wait_for(
+            generate_batch(client, MODEL_NAME, PROMPTS, len(pairs), PERSONA_CACHE, LLM_USAGE,
+                           comment_part="", instruction=instruction),
+            timeout=TIMEOUT_SEC * len(pairs))
+    except Exception as e:
+        print(f"  [Warning] Batch script generation failed: {e}")
+        return [None] * len(pairs)
+    missing = sum(1 for s in scripts if not s)
+    if missing:
+        print(f"  [Warning] Batch returned {len(pairs) - missing}/{len(pairs)} scripts. Generating the rest one by one.")
+    return scripts
+
 async def retry_async(func, *args, **kwargs):
     for i in range(MAX_RETRIES):
         try:
@@ -269,12 +298,34 @@ async def retry_async(func, *args, **kwargs):
                 return None
             await asyncio.sleep(1)
 
-async def prepare_next_talk(prompt_type, current_info, next_info, comments, output_file):
+async def synthesize_to_file(text, output_file): # 音声合成（同じ台本・声・設定ならキャッシュから即座に返す）
+    async def synthesize():
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+        voice = texttospeech.VoiceSelectionParams(language_code=VOICE_CODE_GOOGLE, name=VOICE_NAME_GOOGLE)
+        audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
+        
+        # 同期処理を非同期スレッドで実行
+        response = await asyncio.to_thread(
+            tts_client.synthesize_speech, 
+            input=synthesis_input, 
+            voice=voice, 
+            audio_config=audio_config
+        )
+    
+        with open(output_file, "wb") as out:
+            out.write(response.audio_content)
+    
+        return True
+    return await TTS_CACHE.fetch(output_file, synthesize,
+                                 engine="google", text=text, language=VOICE_CODE_GOOGLE, voice=VOICE_NAME_GOOGLE, audio="MP3")
+
+async def prepare_next_talk(prompt_type, current_info, next_info, comments, output_file, script=None, next_id=None):
     # 台本生成から音声合成までを一括して管理する。
     # 通信失敗時はデフォルトの台本を適用し、番組の停止を回避する。
 
     # 1. 台本生成（リトライとタイムアウトを適用）
-    full_response = await safe_call(generate_script_async, prompt_type, current_info, next_info, comments)
+    # まとめて生成済みの台本（script）があればそれを使う
+    full_response = script or await safe_call(generate_script_async, prompt_type, current_info, next_info, comments)
     
     if not full_response: 
         # 通信全滅時のフォールバック
@@ -292,35 +343,70 @@ async def prepare_next_talk(prompt_type, current_info, next_info, comments, outp
     if log_text:
         print(f"\n[Translation Log]\n{log_text}\n")
 
-    # 2. 音声合成（中身は「実行」のみに集中させる）
-    async def synthesize():
-        synthesis_input = texttospeech.SynthesisInput(text=speech_text)
-        voice = texttospeech.VoiceSelectionParams(language_code=VOICE_CODE_GOOGLE, name=VOICE_NAME_GOOGLE)
-        audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-        
-        # 同期処理を非同期スレッドで実行
-        response = await asyncio.to_thread(
-            tts_client.synthesize_speech, 
-            input=synthesis_input, 
-            voice=voice, 
-            audio_config=audio_config
-        )
-    
-        with open(output_file, "wb") as out:
-            out.write(response.audio_content)
-    
-        return True
+    # ストリーミング再生では、ここでは台本だけを用意し、音声は再生時に合成しながら流す
+    # （ミキサー使用時は、つなぎ目へ重ねて組み立てるため音声ファイルまで作っておく）
+    if STREAM_VOICE and not USE_MIXER:
+        return speech_text
 
-    # 3. 実行（ここでリトライの論理を適用する）
-    success = await retry_async(synthesize)
+    # 2. 音声合成（リトライを適用。同じ台本・声・設定の音声はキャッシュから返す）
+    success = await retry_async(synthesize_to_file, speech_text, output_file)
     
     if not success:
         print(f"  [System Error] Failed to generate audio file: {output_file}")
         if os.path.exists(output_file): os.remove(output_file)
         return None
 
+    # 3. 声の後処理（前後の無音を削り、次の曲のラウドネスに合わせる。デコードした配列のまま再生へ渡す）
+    if VOICE_MATCH_LU is not None and next_id is not None:
+        await VOICE_CLIPS.prepare(output_file, voice_target(next_id))
+
     return speech_text
 
+def _google_stream_responses(text): # Googleのストリーミング合成（Chirp3-HD系の声のみ対応）
+    config = texttospeech.StreamingSynthesizeConfig(
+        voice=texttospeech.VoiceSelectionParams(language_code=VOICE_CODE_GOOGLE, name=VOICE_NAME_GOOGLE),
+        streaming_audio_config=texttospeech.StreamingAudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.PCM,
+            sample_rate_hertz=GOOGLE_STREAM_RATE,
+        ),
+    )
+    requests = [
+        texttospeech.StreamingSynthesizeRequest(streaming_config=config),
+        texttospeech.StreamingSynthesizeRequest(input=texttospeech.StreamingSynthesisInput(text=text)),
+    ]
+    responses = tts_client.streaming_synthesize(iter(requests))
+    try:
+        for response in responses:
+            yield response.audio_content
+    finally:
+        cancel = getattr(responses, "cancel", None)   # 途中で止めた時は、サーバー側の合成も打ち切る
+        if cancel is not None:
+            cancel()
+
+async def speak_streaming(player, text): # 合成を待たずに話し始める。失敗しても番組は止めない
+    try:
+        chunks = iterate_in_thread(lambda: _google_stream_responses(text))
+        return await player.play_pcm(chunks, GOOGLE_STREAM_RATE)
+    except Exception as e:
+        player.stop()
+        if player.first_audio_at is not None:   # 話し始めた後の失敗は、言い直さずに残りを飛ばす
+            print(f"  [System] Streaming voice failed: {e}. Skipping the rest of the talk to maintain flow.")
+            return None
+        print(f"  [System] Streaming voice failed: {e}. Synthesizing to a file instead...")
+    # 話し始める前に失敗した時は、ファイルへ合成してから同じチャンネルで流す
+    fallback_file = "stream_fallback.mp3"
+    try:
+        if not await retry_async(synthesize_to_file, text, fallback_file):
+            print("  [System Error] Fallback synthesis failed. Skipping talk to maintain flow.")
+            return None
+        return await player.play_file(fallback_file)
+    except Exception as e:
+        print(f"  [System] Audio load failed: {e}. Skipping talk to maintain flow.")
+        player.stop()
+        return None
+    finally:
+        remove_quietly(fallback_file)
+
 async def safe_call(func, *args, **kwargs):
     # 指数バックオフを用いたリトライ実行
     for i in range(MAX_RETRIES):
@@ -339,66 +425,155 @@ async def safe_call(func, *args, **kwargs):
 # 4. Graceful Execution Engine
 # ==========================================
 
+def init(): # 実行時の初期化。APIクライアントの作成やキャッシュの読み込みはここでまとめて行う
+    global client, tts_client, DURATION_INDEX, LOUDNESS_INDEX, TTS_CACHE, PLAY_LOG, SONG_STORE, COMMENT_TAIL, USE_MIXER, STREAM_VOICE
+    if OUTPUT_TARGET is not None:
+        # ヘッドレス出力：音声デバイスもディスプレイも無いサーバーで動かす。トークは必ずミキサーで曲に重ねる
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        if OUTPUT_TARGET == "-":
+            claim_stdout()   # 標準出力はPCM専用。ログは標準エラーへ
+        USE_MIXER, STREAM_VOICE = True, False
+    if STREAM_VOICE and "Chirp3-HD" not in VOICE_NAME_GOOGLE:
+        # Googleのストリーミング合成は Chirp3-HD 系の声にしか使えない。他の声では毎回失敗するので、初めから合成して流す
+        print(f"  [Warning] Streaming synthesis needs a Chirp3-HD voice ({VOICE_NAME_GOOGLE} is not). STREAM_VOICE is disabled.")
+        STREAM_VOICE = False
+    if not api_key:
+        print("【Error】APIキーが設定されていません。")
+        exit()
+    client = genai.Client(api_key=api_key)
+    tts_client = texttospeech.TextToSpeechClient()
+    DURATION_INDEX = DurationIndex()
+    LOUDNESS_INDEX = LoudnessIndex()
+    TTS_CACHE = TTSCache()
+    PLAY_LOG = PlayLog(PLAY_LOG_PATH)
+    if USE_SQLITE:
+        SONG_STORE = SQLiteSongStore(SONG_DB_PATH)
+    COMMENT_TAIL = CommentFileTail("comment.txt", max_lines=100)
+
+async def bootstrap(opening_file, final_file):
+    # 起動処理の並列化：ライブラリ走査とCSV読み込みはワーカースレッドで、
+    # オープニングとクロージングの台本生成・音声合成は同時に進める
+    async def load_library():
+        global SONG_DB, SONG_FILES, SELECTOR
+        SONG_DB, SONG_FILES = await asyncio.gather(
+            asyncio.to_thread(load_song_database),
+            asyncio.to_thread(scan_music_files),
+        )
+        DURATION_INDEX.prune(SONG_FILES.values())   # ライブラリから消えた曲の長さの記録を捨てる（次の save() で書き出す）
+        SELECTOR = SelectionEngine(SONG_DB, BOOST_2)
+
+    async def prepare_voice(prompt_type, output_file, synthesize=True):
+        script = await generate_script_async(prompt_type)
+        if synthesize:
+            await synthesize_to_file(script, output_file)
+        return script
+
+    _, op_script, ed_script = await asyncio.gather(
+        load_library(),
+        prepare_voice("opening", opening_file, synthesize=not STREAM_VOICE), # ストリーミング時は再生しながら合成する
+        prepare_voice("closing", final_file),
+    )
+    return op_script, ed_script
+
+async def pop_talk_segment(pipeline, rotation, current_id):
+    # 先読みしたトークを受け取る。選べる曲が無くて先読みが空なら、ローテーションを戻して選び直す（それでも無ければ None）
+    segment = await pipeline.pop_ready()
+    if segment is None:
+        print("  [System] No song could be queued ahead. Resetting the rotation and selecting again...")
+        rotation.reset(keep=[current_id])
+        pipeline.start(current_id)
+        segment = await pipeline.pop_ready()
+    return segment
+
 async def main_loop():
+    started = time.perf_counter() # 起動からの経過時間（最初の音が出るまでを計測する）
     pygame.mixer.pre_init(44100, -16, 2, 4096) 
     pygame.mixer.init()
-
-    # --- チャット取得を「純粋なスレッド」として分離 ---
+    events = PlaybackEvents()   # 再生終了イベントを await できるようにする
+    voice_stream = StreamingVoicePlayer(VOICE_LEVEL) if STREAM_VOICE else None
+    mixer = None
+    if OUTPUT_TARGET is not None:   # ヘッドレス：ミックスしたPCMをパイプ・ファイル・FIFOへ書き出す
+        mixer = StreamMixEngine(OUTPUT_TARGET, OUTPUT_REALTIME, MUSIC_LEVEL, VOICE_LEVEL, CROSSFADE_SEC, CROSSFADE_CURVE, DUCK_LEVEL)
+    elif USE_MIXER:
+        mixer = MixEngine(MUSIC_LEVEL, VOICE_LEVEL, CROSSFADE_SEC, CROSSFADE_CURVE, DUCK_LEVEL)
+
+    # --- チャット取得はイベントループ上のタスクとして動かす（切れても自動で再接続する）---
+    chat_task = None
     if USE_YOUTUBE:
-        print(f"   [System] Connecting to YouTube Live: {VIDEO_ID}")
-        # daemon=True により、メイン終了時にこのスレッドも破棄される
-        threading.Thread(target=fetch_comments_sync, args=(VIDEO_ID,), daemon=True).start()
+        if CHAT_REPLAY_FILE:
+            print(f"   [System] Replaying chat from: {CHAT_REPLAY_FILE}")
+            make_source = lambda: ReplayChatSource(CHAT_REPLAY_FILE)
+        else:
+            print(f"   [System] Connecting to YouTube Live: {VIDEO_ID}")
+            make_source = lambda: YouTubeChatSource(VIDEO_ID)
+        chat_task = asyncio.create_task(ChatPoller(make_source, COMMENT_QUEUE).run())
     # ----------------------------------------------
 
-    available_ids = list(SONG_FILES.keys())
     next_talk_audio = "next_talk.mp3"
     final_audio = "final.mp3"
 
-    played_in_session = []
+    # --- ライブラリの読み込みと、オープニング・クロージングの準備を同時に行う ---
+    print("   [System] Loading library and preparing opening/final scripts in parallel...")
+    op_script, ed_script = await bootstrap(next_talk_audio, final_audio)
+    available_ids = list(SONG_FILES.keys())
+
+    # 一回流した曲を記録するローテーション
+    rotation = SessionRotation(available_ids, SELECTOR)
+    # 先の曲まで選曲を済ませ、曲間トークを先読みで準備しておくパイプライン
+    pipeline = TalkPipeline(rotation, select_next_song_weighted, get_song_info, prepare_next_talk, depth=TALK_LOOKAHEAD,
+                            batch_fn=generate_scripts_batch if TALK_BATCH > 1 else None, batch_size=TALK_BATCH)
     
     if not available_ids:
         print("音楽ファイルが見つかりません。")
         return
 
-    # --- クロージングの言葉を最初に用意し、メモリへ保持する ---
-    print("   [System] Preparing final script in advance...")
-    ed_script = await generate_script_async("closing")
-    s_input = texttospeech.SynthesisInput(text=ed_script)
-    voice = texttospeech.VoiceSelectionParams(language_code=VOICE_CODE_GOOGLE, name=VOICE_NAME_GOOGLE)
-    audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-    response = await asyncio.to_thread(tts_client.synthesize_speech, input=s_input, voice=voice, audio_config=audio_config)
-    with open(final_audio, "wb") as out: out.write(response.audio_content)
+    # --- クロージングの言葉は bootstrap() で用意済み。メモリへ保持する （音楽と重なるときのノイズ回避のため）---
     final_voice_obj = pygame.mixer.Sound(final_audio) 
     # ---------------------------------------------------------  
 
     mode_text = "RANDOM" if RANDOM_MODE else "TIME-SYNC"
     print(f"\n† Silas Requiem Online ({mode_text} / UTC+{UTC_OFFSET}) †\n")
 
+    music_volume = MUSIC_LEVEL  # 今の曲の音量（トラックゲインを掛けたもの）
     try:
         # --- オープニング ---
-        op_script = await generate_script_async("opening")
         print(f"[Opening Script]\n{op_script}\n")
-        s_input = texttospeech.SynthesisInput(text=op_script)
-        voice = texttospeech.VoiceSelectionParams(language_code=VOICE_CODE_GOOGLE, name=VOICE_NAME_GOOGLE)
-        audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-        response = await asyncio.to_thread(tts_client.synthesize_speech, input=s_input, voice=voice, audio_config=audio_config)
-        with open(next_talk_audio, "wb") as out: out.write(response.audio_content)
-        
-        voice = pygame.mixer.Sound(next_talk_audio)
-        voice.set_volume(VOICE_LEVEL)
-        voice.play()
-        while pygame.mixer.get_busy(): await asyncio.sleep(0.5)
-
-        current_id = select_next_song_weighted(SONG_DB, available_ids)
+        if voice_stream:
+            startup_sec = time.perf_counter() - started
+            first = await speak_streaming(voice_stream, op_script)
+            if first is not None:
+                print(f"   [System] Time to first audio: {startup_sec + first:.2f}s")
+        elif mixer is not None:
+            opening_end = await mixer.announce(next_talk_audio)
+            print(f"   [System] Time to first audio: {time.perf_counter() - started:.2f}s")
+            await mixer.wait_until(opening_end)
+        else:
+            voice = pygame.mixer.Sound(next_talk_audio)
+            voice.set_volume(VOICE_LEVEL)
+            channel = voice.play()
+            print(f"   [System] Time to first audio: {time.perf_counter() - started:.2f}s")
+            await events.wait(events.channel_end(channel, voice.get_length()))
+
+        current_id = select_next_song_weighted(rotation)
+        pipeline.start(current_id)
+        if mixer is not None:
+            await mixer.start(SONG_FILES[current_id], MAX_PLAY_TIME, track_gain(current_id))
+            if OUTPUT_SECONDS > 0:
+                mixer.stop_after(OUTPUT_SECONDS, asyncio.current_task())
 
         while True:
             mark_as_played(current_id)
-            played_in_session.append(current_id)
+            if PLAY_LOG.needs_compaction():
+                # 一定数たまったら、再生を止めずに別スレッドでCSVへ書き戻す
+                await asyncio.to_thread(save_song_database)
             current_info = get_song_info(current_id)
-            sound_temp = pygame.mixer.Sound(SONG_FILES[current_id])
-            duration = sound_temp.get_length()
+            # 曲全体をデコードせず、ヘッダーから求めた長さを使う
+            # （初めての曲はファイルを読んで測るので、イベントループを止めないようにワーカースレッドで行う）
+            duration_us = await asyncio.to_thread(DURATION_INDEX.get_us, SONG_FILES[current_id])
+            await asyncio.to_thread(DURATION_INDEX.save)
 
-            print(f"\n♪ Now Playing: {current_info['title']} [{int(duration)//60:02}:{int(duration)%60:02}]")
+            print(f"\n♪ Now Playing: {current_info['title']} [{format_duration(duration_us)}]")
 
             # ▼▼▼ OBSテロップ用のテキストファイル出力 ▼▼▼
             try:
@@ -410,78 +585,112 @@ async def main_loop():
                 print(f"  [Warning] Failed to write now_playing.txt: {e}")
             # ▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲
             
-            pygame.mixer.music.load(SONG_FILES[current_id])
-            pygame.mixer.music.set_volume(MUSIC_LEVEL)
-            pygame.mixer.music.play()
-
-            remaining_ids = [i for i in available_ids if i not in played_in_session]
-        
-            if not remaining_ids:
-                last_played = played_in_session[-1] if played_in_session else None
-                played_in_session.clear()
-                if last_played:
-                    played_in_session.append(last_played)
-                remaining_ids = [i for i in available_ids if i not in played_in_session]
-
-            next_id = select_next_song_weighted(SONG_DB, remaining_ids)
-            next_info = get_song_info(next_id)
-            
-            prep_task = asyncio.create_task(
-                prepare_next_talk("talk", current_info, next_info, get_and_clear_comments(), next_talk_audio)
-            )
-
-            start_time = time.time()
-            while pygame.mixer.music.get_busy():
-                if MAX_PLAY_TIME > 0 and (time.time() - start_time) > MAX_PLAY_TIME:
+            if mixer is None:
+                pygame.mixer.music.load(SONG_FILES[current_id])
+                music_volume = min(1.0, MUSIC_LEVEL * track_gain(current_id))
+                pygame.mixer.music.set_volume(music_volume)
+                pygame.mixer.music.play()
+
+            # 新しいコメントが届いていれば、次のつなぎ目のトークだけを作り直す（その先の準備済みトークはそのまま）
+            # ミキサーでは曲の途中でつなぎ目を組み立てるので、それまでに作り直せない時は次のトークへ回す
+            pipeline.update_comments(rank_comments(get_and_clear_comments(), COMMENT_TOP_K),
+                                     mixer.seconds_left() if mixer is not None else None)
+
+            if mixer is not None:
+                # つなぎ目（曲の終わり + トーク + 次の曲の頭）を曲の再生中に組み立てて積み、次の曲が始まるまで待つ
+                segment = await pop_talk_segment(pipeline, rotation, current_id)
+                if segment is None:
+                    print("  [System] No playable song could be selected. Ending the program.")
+                    await mixer.finish(final_audio, fade_sec=10.0)
                     break
-                await asyncio.sleep(0.5)
+                pipeline.report()
+                talk_audio = segment.output_file
+                has_talk = os.path.exists(talk_audio) and os.path.getsize(talk_audio) > 100
+                if not has_talk:
+                    print("  [System] Audio file missing or empty. Skipping talk to maintain flow.")
+                talk_voice = VOICE_CLIPS.take(talk_audio)   # 整えた声（無ければファイルから読む）
+                if talk_voice is None and has_talk:
+                    talk_voice = talk_audio
+                cue = await mixer.transition(talk_voice, SONG_FILES[segment.next_id], MAX_PLAY_TIME,
+                                             track_gain(segment.next_id))
+                remove_quietly(talk_audio)
+                if cue.voice is not None:
+                    await mixer.wait_until(cue.voice)
+                    print(f"   [Play] Silas Requiem: Speaking over the end of the music...")
+                await mixer.wait_until(cue.next)
+                current_id = segment.next_id
+                continue
+
+            # 曲の終わり（終了イベント）か、MAX_PLAY_TIME のタイマーの早い方まで待つ
+            music_done = events.music_end(duration_us / 1e6 if duration_us else None)
+            await events.wait(music_done, MAX_PLAY_TIME if MAX_PLAY_TIME > 0 else None)
 
             pygame.mixer.music.fadeout(2000)
             await asyncio.sleep(2)
 
-            await prep_task 
-            await asyncio.sleep(0.5)
-
-            if os.path.exists(next_talk_audio) and os.path.getsize(next_talk_audio) > 100:    
+            segment = await pop_talk_segment(pipeline, rotation, current_id) # 先読みしたトークの完了を待つ（通常はすでに準備済み）
+            if segment is None:
+                print("  [System] No playable song could be selected. Ending the program.")
+                break
+            pipeline.report()
+            talk_audio = segment.output_file
+
+            if voice_stream and segment.result():
+                print(f"   [Play] Silas Requiem: Speaking after the music (streaming)...")
+                await speak_streaming(voice_stream, segment.result())
+            elif os.path.exists(talk_audio) and os.path.getsize(talk_audio) > 100:    
                 try: 
                     print(f"   [Play] Silas Requiem: Speaking after the music...")
-                    voice = pygame.mixer.Sound(next_talk_audio) 
+                    talk_voice = VOICE_CLIPS.take(talk_audio)   # 整えた声（無ければファイルから読む）
+                    voice = pygame.mixer.Sound(buffer=talk_voice) if talk_voice is not None else pygame.mixer.Sound(talk_audio)
                     await asyncio.sleep(0.5)
                     voice.set_volume(VOICE_LEVEL)
-                    voice.play(fade_ms=150)
-
-                    while pygame.mixer.get_busy(): 
-                        await asyncio.sleep(0.5)
+                    channel = voice.play(fade_ms=150)
+                    await events.wait(events.channel_end(channel, voice.get_length()))
                 except Exception as e:
                     print(f"  [System] Audio load failed: {e}. Skipping talk to maintain flow.")
             else:
                 print("  [System] Audio file missing or empty. Skipping talk to maintain flow.")
             
+            remove_quietly(talk_audio)
             await asyncio.sleep(POST_TALK_WAIT)
-            current_id = next_id
+            current_id = segment.next_id
 
     except (asyncio.CancelledError, KeyboardInterrupt): 
         print("\n   [System] Finalizing...")
+        if mixer is not None:
+            # 音楽を下げてクロージングの言葉を重ね、話し終えたら10秒かけて消す
+            await mixer.finish(final_audio, fade_sec=10.0)
+        else:
+            for i in range(40):
+                pygame.mixer.music.set_volume(music_volume * (1.0 - i * 0.015))
+                await asyncio.sleep(0.05)
 
-        for i in range(40):
-            pygame.mixer.music.set_volume(MUSIC_LEVEL * (1.0 - i * 0.015))
-            await asyncio.sleep(0.05)
-
-        await asyncio.sleep(1.0)
+            await asyncio.sleep(1.0)
 
-        voice_channel = final_voice_obj.play(fade_ms=300)
-        voice_channel.set_volume(VOICE_LEVEL * 0.9)
+            voice_channel = final_voice_obj.play(fade_ms=300)
+            voice_channel.set_volume(VOICE_LEVEL * 0.9)
 
-        while voice_channel.get_busy():
-            await asyncio.sleep(0.5)
+            await events.wait(events.channel_end(voice_channel, final_voice_obj.get_length()))
 
-        print("   [System] Speech finished. Fading out music...")
-        pygame.mixer.music.fadeout(10000)
+            print("   [System] Speech finished. Fading out music...")
+            pygame.mixer.music.fadeout(10000)
         
-        await asyncio.sleep(10.0)
+            await events.wait(events.music_end(10.0), 11.0)
 
     finally:
+        if chat_task is not None:
+            chat_task.cancel()
         save_song_database()
+        PLAY_LOG.close()
+        if SONG_STORE is not None:
+            SONG_STORE.close()
+        DURATION_INDEX.save()
+        pipeline.close()
+        LLM_USAGE.report()
+        if mixer is not None:
+            mixer.close()
+        events.close()
         pygame.mixer.quit()
         for temp_file in ["next_talk.mp3", "final.mp3"]:
             if os.path.exists(temp_file):
@@ -489,6 +698,7 @@ async def main_loop():
                 except: pass
 
 if __name__ == "__main__":
+    init()
     try:
         asyncio.run(main_loop())
     except KeyboardInterrupt:
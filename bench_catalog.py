@@ -0,0 +1,86 @@
+import sys
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+
+from dj_catalog import SongCatalog, parse_last_played
+
+# ==========================================
+# bench_catalog.py   曲データのメモリ使用量の比較
+# ==========================================
+# 合成した曲データを 1万 / 10万 / 100万曲分作り、
+#   - 従来の辞書の辞書（SONG_DB[id] = {...}、last_played はISO文字列）
+#   - __slots__ 付きのレコード（1曲1オブジェクト）
+#   - SongCatalog（列ごとの配列 + intern した文字列）
+# がそれぞれ何MB使うかを tracemalloc で測る。
+# 使い方: python bench_catalog.py            （1万・10万・100万曲）
+#         python bench_catalog.py 10000      （曲数を指定）
+# ==========================================
+
+SIZES = [10_000, 100_000, 1_000_000]
+COMPOSERS = 500     # 作曲者・演奏者の種類（実際のライブラリと同じく、同じ名前が何度も出てくる）
+PERFORMERS = 2_000
+
+
+class SongRecord:
+    # 比較用：__slots__ で属性辞書をなくした1曲1オブジェクトの表現
+    __slots__ = ('play_flag', 'time_scale', 'last_played', 'title', 'composer', 'performer')
+
+    def __init__(self, play_flag, time_scale, last_played, title, composer, performer):
+        self.play_flag = play_flag
+        self.time_scale = time_scale
+        self.last_played = last_played
+        self.title = title
+        self.composer = composer
+        self.performer = performer
+
+
+def synthetic_rows(n, seed=0): # CSVを読んだ時と同じく、文字列は行ごとに別の実体として作る
+    rng = random.Random(seed)
+    base = datetime(2026, 1, 1)
+    for sid in range(1, n + 1):
+        played = (base + timedelta(seconds=rng.randrange(86400 * 60))).isoformat() if rng.random() < 0.7 else ''
+        yield (sid, rng.choice((0, 1, 1, 2)), round(rng.uniform(1, 9), 1), played,
+               f"Title {sid}", "Composer %d" % rng.randrange(COMPOSERS), "Performer %d" % rng.randrange(PERFORMERS))
+
+
+def build_dicts(rows):
+    return {sid: {'play_flag': flag, 'time_scale': scale, 'last_played': played,
+                  'title': title, 'composer': composer, 'performer': performer}
+            for sid, flag, scale, played, title, composer, performer in rows}
+
+
+def build_records(rows):
+    return {sid: SongRecord(flag, scale, parse_last_played(played), title, sys.intern(composer), sys.intern(performer))
+            for sid, flag, scale, played, title, composer, performer in rows}
+
+
+def build_catalog(rows):
+    catalog = SongCatalog()
+    for sid, flag, scale, played, title, composer, performer in rows:
+        catalog.add(sid, flag, scale, played, title, composer, performer)
+    return catalog
+
+
+def measure(build, n): # 構築後に残っているメモリ（MB）
+    # 行の文字列も計測中に作る（先に作っておくと、intern で捨てられる重複文字列の分が測れない）
+    tracemalloc.start()
+    obj = build(synthetic_rows(n))
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return current / (1024 * 1024)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"{'songs':>10} | {'dict of dicts':>14} | {'__slots__':>14} | {'SongCatalog':>14} | ratio")
+    for n in sizes:
+        d = measure(build_dicts, n)
+        r = measure(build_records, n)
+        c = measure(build_catalog, n)
+        print(f"{n:>10,} | {d:11.1f} MB | {r:11.1f} MB | {c:11.1f} MB | {d / c:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
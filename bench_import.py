@@ -0,0 +1,60 @@
+import os
+import re
+import sys
+import subprocess
+
+# ==========================================
+# bench_import.py   起動時間（インポート時間）の計測
+# ==========================================
+# python -X importtime で各DJスクリプトのインポートにかかる時間を測り、予算を超えていないか確認する。
+# 使い方: python bench_import.py            （予算超過があれば終了コード1）
+#         python bench_import.py --top 10   （重いモジュールの内訳も表示）
+# ==========================================
+
+SCRIPTS = ["ai_dj_en", "ai_dj_en_chat", "ai_dj_en_edge", "ai_dj_en_google"]
+IMPORT_BUDGET_MS = 150.0   # スクリプト1本あたりのインポート時間の上限（ミリ秒）
+RUNS = 3                   # 計測回数（最小値を採用してキャッシュの影響を減らす）
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module): # 1回分の計測。{モジュール名: 累積マイクロ秒} を返す
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            cumulative[m.group(4)] = int(m.group(2))
+    return cumulative
+
+
+def main():
+    top = int(sys.argv[sys.argv.index("--top") + 1]) if "--top" in sys.argv else 0
+    over = False
+    print(f"--- Import time budget: {IMPORT_BUDGET_MS:.0f} ms per script ---")
+    for module in SCRIPTS:
+        try:
+            runs = [measure(module) for _ in range(RUNS)]
+        except RuntimeError as e:
+            print(f"【{module}】 import failed: {e}")
+            over = True
+            continue
+        best = min(runs, key=lambda r: r.get(module, 0))
+        total_ms = best.get(module, 0) / 1000.0
+        status = "OK" if total_ms <= IMPORT_BUDGET_MS else "OVER"
+        over |= status == "OVER"
+        print(f"【{module}】 {total_ms:7.1f} ms  [{status}]")
+        if top:
+            heavy = sorted(((us, name) for name, us in best.items() if name != module), reverse=True)[:top]
+            for us, name in heavy:
+                print(f"    {us / 1000.0:7.1f} ms  {name}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import sys
+import time
+import random
+
+from bench_catalog import synthetic_rows, build_catalog
+from dj_selector import SelectionEngine, SessionRotation
+
+# ==========================================
+# bench_selector.py   選曲1回あたりの所要時間
+# ==========================================
+# 合成した曲データで、TIME-SYNC の選曲を
+#   - 全曲スキャン（全曲の重みを計算してから抽選）
+#   - 時間帯スケール索引（目標スケール前後の曲だけ重みを計算）
+# の両方で繰り返し、1回あたりの平均時間を曲数ごとに比べる。
+# 使い方: python bench_selector.py            （1千・1万・10万・100万曲）
+#         python bench_selector.py 50000      （曲数を指定）
+# ==========================================
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+PICKS = 200     # 1条件あたりの選曲回数
+
+
+def per_pick_ms(engine, rotation, use_index): # 1日の時間帯をまんべんなく巡りながら選曲し、平均を返す
+    now_ts = time.time()
+    targets = [1.0 + 8.0 * i / (PICKS - 1) for i in range(PICKS)]
+    random.seed(0)
+    started = time.perf_counter()
+    for t_target in targets:
+        engine.select(rotation, t_target, now_ts, use_index=use_index)
+    return (time.perf_counter() - started) * 1000.0 / PICKS
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"{'songs':>10} | {'full scan':>12} | {'scale index':>12} | speedup")
+    for n in sizes:
+        catalog = build_catalog(synthetic_rows(n))
+        engine = SelectionEngine(catalog)
+        rotation = SessionRotation(list(catalog), engine)
+        full = per_pick_ms(engine, rotation, use_index=False)
+        indexed = per_pick_ms(engine, rotation, use_index=True)
+        print(f"{n:>10,} | {full:9.3f} ms | {indexed:9.3f} ms | {full / indexed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+# test_voice.py は edge-tts の声を聞き比べるための手動スクリプトなので、pytest では集めない
+collect_ignore = ["test_voice.py"]
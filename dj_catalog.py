@@ -0,0 +1,99 @@
+import sys
+import math
+from array import array
+from datetime import datetime
+
+# ==========================================
+# dj_catalog.py   曲データ（列ごとの配列版）
+# ==========================================
+# 1曲ごとに辞書を作る代わりに、play_flag / time_scale / last_played を型付き配列（array）で持つ。
+# last_played はISO文字列ではなくエポック秒（float、未再生はNaN）で保持する。
+# 作曲者・演奏者は同じ名前が何度も出てくるので、文字列を intern して一つの実体を共有する。
+# 選曲エンジンはこの配列をコピーせずにそのまま NumPy 配列として参照する。
+# ==========================================
+
+PLAY_FLAG_MIN, PLAY_FLAG_MAX = -128, 127   # play_flag の列（array('b')）に入る範囲
+
+
+def parse_last_played(value): # ISO文字列をエポック秒へ（空・不正ならNaN）
+    if not value:
+        return math.nan
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def format_last_played(ts): # エポック秒をISO文字列へ（未再生なら空文字）
+    if ts != ts:
+        return ''
+    return datetime.fromtimestamp(ts).astimezone().isoformat()
+
+
+class SongCatalog:
+    # 曲IDの並びと同じ順に、各列を配列で持つ（pos: 曲ID -> 配列上の位置）
+
+    def __init__(self):
+        self.ids = array('q')
+        self.play_flag = array('b')
+        self.time_scale = array('d')
+        self.last_played = array('d')
+        self.title = []
+        self.composer = []
+        self.performer = []
+        self.pos = {}
+
+    def add(self, song_id, play_flag=0, time_scale=5.0, last_played='', title='', composer='', performer=''):
+        # last_played はISO文字列でもエポック秒でもよい。同じIDが来たら上書きする
+        # 先に全項目を変換・検査してから列へ足す（途中で失敗して列ごとの長さがずれないように）
+        song_id = int(song_id)
+        play_flag = int(play_flag)
+        if not PLAY_FLAG_MIN <= play_flag <= PLAY_FLAG_MAX:
+            raise ValueError(f"play_flag out of range: {play_flag}")
+        time_scale = float(time_scale)
+        ts = parse_last_played(last_played) if isinstance(last_played, str) or last_played is None else float(last_played)
+        title = title or ''
+        composer = sys.intern(composer or '')
+        performer = sys.intern(performer or '')
+        i = self.pos.get(song_id)
+        if i is None:
+            self.pos[song_id] = len(self.ids)
+            self.ids.append(song_id)
+            self.play_flag.append(play_flag)
+            self.time_scale.append(time_scale)
+            self.last_played.append(ts)
+            self.title.append(title)
+            self.composer.append(composer)
+            self.performer.append(performer)
+        else:
+            self.play_flag[i] = play_flag
+            self.time_scale[i] = time_scale
+            self.last_played[i] = ts
+            self.title[i] = title
+            self.composer[i] = composer
+            self.performer[i] = performer
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, song_id):
+        return song_id in self.pos
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def info(self, song_id): # 従来の SONG_DB[song_id] と同じ項目の辞書を返す
+        i = self.pos[song_id]
+        return {
+            'play_flag': self.play_flag[i],
+            'time_scale': self.time_scale[i],
+            'last_played': format_last_played(self.last_played[i]),
+            'title': self.title[i],
+            'composer': self.composer[i],
+            'performer': self.performer[i],
+        }
+
+    def set_last_played(self, song_id, timestamp):
+        i = self.pos.get(song_id)
+        if i is not None:
+            self.last_played[i] = timestamp
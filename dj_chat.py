@@ -0,0 +1,169 @@
+import time
+import random
+import asyncio
+from abc import ABC, abstractmethod
+
+from dj_lazy import lazy_import
+
+pytchat = lazy_import("pytchat")
+
+# ==========================================
+# dj_chat.py   チャットの取り込み（asyncio版）
+# ==========================================
+# 専用スレッドで1秒ごとに pytchat を叩く代わりに、イベントループ上のタスクとしてポーリングする。
+#   - 間隔は可変：コメントが来ていれば詰め、静かな間は延ばす
+#   - 接続が切れたり例外が出たりしたら、ゆらぎ（ジッター）つきの待ち時間をおいて自動で再接続する
+#   - 取得元は差し替え可能：YouTube のほか、記録したファイルを再生する ReplayChatSource も使える
+# 取り込んだコメントは CommentQueue（dj_comments.py）へ積む。
+# ==========================================
+
+POLL_MIN_SEC = 0.5          # 忙しい時のポーリング間隔
+POLL_MAX_SEC = 5.0          # 静かな時のポーリング間隔の上限
+POLL_BACKOFF = 1.5          # コメントが来なかった時に間隔を何倍に延ばすか
+RECONNECT_BASE_SEC = 2.0    # 再接続までの待ち時間（失敗が続くと倍々に延ばす）
+RECONNECT_MAX_SEC = 60.0
+
+
+class ChatSource(ABC):
+    # 取得元の共通インターフェース。fetch() は (投稿者, 本文, 時刻) のリストを返す（取得元ごとに必ず実装する）
+    reconnect = True    # 終わった（切れた）時に作り直して再接続するか
+
+    async def connect(self):
+        pass
+
+    @abstractmethod
+    async def fetch(self):
+        ...
+
+    def is_alive(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class YouTubeChatSource(ChatSource):
+
+    def __init__(self, video_id):
+        self.video_id = video_id
+        self.chat = None
+
+    async def connect(self):
+        # 信号処理（interruptable）をオフにする。メインスレッド以外からも安全に扱える
+        self.chat = await asyncio.to_thread(pytchat.create, self.video_id, interruptable=False)
+
+    async def fetch(self):
+        data = await asyncio.to_thread(self.chat.get)
+        return [(c.author.name, c.message, time.time()) for c in data.items]
+
+    def is_alive(self):
+        return self.chat is not None and self.chat.is_alive()
+
+    def close(self):
+        if self.chat is not None:
+            try: self.chat.terminate()
+            except Exception: pass
+            self.chat = None
+
+
+class ReplayChatSource(ChatSource):
+    # 記録したコメントを再生する（テスト・負荷試験用）。
+    # 一行が「経過秒<TAB>投稿者<TAB>本文」、または「投稿者: 本文」（この場合は interval 秒おきに一件）
+
+    reconnect = False
+
+    def __init__(self, path, speed=1.0, interval=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.interval = interval
+        self.loop = loop
+        self.events = []
+        self.index = 0
+        self.started = None
+
+    def _parse(self, line, n):
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) >= 3:
+            try:
+                return float(parts[0]), parts[1], "\t".join(parts[2:])
+            except ValueError:
+                pass
+        author, sep, message = line.strip().partition(": ")
+        if not sep:
+            author, message = "listener", line.strip()
+        return n * self.interval, author, message
+
+    async def connect(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        self.events = sorted((self._parse(line, n) for n, line in enumerate(lines)), key=lambda e: e[0])
+        self.index = 0
+        self.started = time.monotonic()
+
+    async def fetch(self):
+        elapsed = (time.monotonic() - self.started) * self.speed
+        out = []
+        while self.index < len(self.events) and self.events[self.index][0] <= elapsed:
+            _offset, author, message = self.events[self.index]
+            out.append((author, message, time.time()))
+            self.index += 1
+        if self.loop and self.index >= len(self.events) and self.events:
+            self.index = 0
+            self.started = time.monotonic()
+        return out
+
+    def is_alive(self):
+        return self.loop or self.index < len(self.events)
+
+
+class ChatPoller:
+
+    def __init__(self, make_source, queue, min_interval=POLL_MIN_SEC, max_interval=POLL_MAX_SEC):
+        self.make_source = make_source    # 接続のたびに新しい ChatSource を作る関数
+        self.queue = queue                # CommentQueue
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.polls = 0
+        self.reconnects = 0
+
+    def _adapt(self, count): # 来ていれば間隔を詰め、来ていなければ延ばす
+        if count:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * POLL_BACKOFF)
+
+    async def _session(self, source): # 一回の接続分。取得元が終わるか例外が出たら戻る
+        await source.connect()
+        print("   [Chat] Connected.")
+        while source.is_alive():
+            items = await source.fetch()
+            self.polls += 1
+            for author, message, ts in items:
+                self.queue.push(author, message, ts)
+            self._adapt(len(items))
+            await asyncio.sleep(self.interval)
+
+    async def run(self): # 取り消される（cancel）まで取り込みを続ける
+        failures = 0
+        while True:
+            source = self.make_source()
+            polls_before = self.polls
+            try:
+                await self._session(source)
+                print("   [Chat] Source ended.")
+                if not source.reconnect:
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"   [Chat] Monitor error: {e}")
+            finally:
+                source.close()
+            # 一度でも取得できていれば失敗回数を戻し、続けて失敗するほど待ち時間を延ばす
+            failures = 1 if self.polls > polls_before else failures + 1
+            self.reconnects += 1
+            delay = min(RECONNECT_MAX_SEC, RECONNECT_BASE_SEC * 2 ** (failures - 1))
+            delay = random.uniform(delay / 2, delay)   # ジッター：再接続が一斉に集中しないようにばらす
+            print(f"   [Chat] Reconnecting in {delay:.1f}s...")
+            await asyncio.sleep(delay)
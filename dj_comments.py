@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque, namedtuple
+
+# ==========================================
+# dj_comments.py   コメントの受け口（スレッド安全な有限バッファ）
+# ==========================================
+# チャット取得スレッドが push() し、イベントループ側が drain() でまとめて取り出す。
+#   - 上限（maxlen）を超えたら古いものから捨てる（deque なので O(1)）。捨てた数は数えておく
+#   - 同じ人が短時間に連投した分は受け付けない（投稿者ごとのレート制限）
+#   - drain() はロックを取って一度に丸ごと取り出すので、取りこぼしや二重取得が起きない
+#
+# CommentFileTail はローカルモードの comment.txt を「追記された分だけ」読む。
+# ファイルを移動・削除せず、読み終えた位置（バイトオフセット）を覚えておく。
+# 位置は comment.txt.pos へ保存し、次の起動ではその続きから読む（初回は先頭から。起動前のコメントも拾う）。
+#
+# rank_comments() はプロンプトへ渡す前の下ごしらえ。重複・スパム・絵文字だけの行を落とし、
+# 新しさと投稿者のばらけ具合で点数をつけて上位 k 件だけを残す。
+# ==========================================
+
+COMMENT_BUFFER_MAX = 100     # バッファに保持するコメントの上限
+AUTHOR_RATE_LIMIT = 3        # 同じ投稿者から受け付ける件数（AUTHOR_RATE_WINDOW 秒あたり）
+AUTHOR_RATE_WINDOW = 30.0    # レート制限の窓（秒）
+
+Comment = namedtuple("Comment", ["author", "message", "ts"])
+
+
+class CommentQueue:
+
+    def __init__(self, maxlen=COMMENT_BUFFER_MAX, rate_limit=AUTHOR_RATE_LIMIT, rate_window=AUTHOR_RATE_WINDOW):
+        self.buf = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.recent = {}             # 投稿者 -> 受け付けた時刻（窓の中の分だけ）
+        self.received = 0
+        self.dropped_overflow = 0    # 上限を超えて捨てた数
+        self.dropped_rate = 0        # レート制限で受け付けなかった数
+        self.reported = (0, 0)
+
+    def _allow(self, author, now): # 投稿者ごとのスライディングウィンドウ
+        stamps = self.recent.get(author)
+        if stamps is None:
+            stamps = self.recent[author] = deque()
+        while stamps and now - stamps[0] > self.rate_window:
+            stamps.popleft()
+        if len(stamps) >= self.rate_limit:
+            return False
+        stamps.append(now)
+        return True
+
+    def push(self, author, message, ts=None): # チャット取得スレッドから呼ぶ。受け付けたら True
+        now = time.monotonic()
+        with self.lock:
+            self.received += 1
+            if not self._allow(author, now):
+                self.dropped_rate += 1
+                return False
+            if len(self.buf) == self.buf.maxlen:
+                self.dropped_overflow += 1
+            self.buf.append(Comment(author, message, ts if ts is not None else time.time()))
+            if len(self.recent) > 4 * self.buf.maxlen:
+                self.recent = {a: s for a, s in self.recent.items() if s and now - s[-1] <= self.rate_window}
+            return True
+
+    def drain(self): # 溜まっているコメントを古い順にすべて取り出す（取り出した時点のスナップショット）
+        with self.lock:
+            items = list(self.buf)
+            self.buf.clear()
+            dropped = (self.dropped_overflow, self.dropped_rate)
+        if dropped != self.reported:
+            print(f"   [Chat] Dropped so far: {dropped[0]} over capacity, {dropped[1]} rate-limited "
+                  f"(of {self.received} received)")
+            self.reported = dropped
+        return items
+
+    def drain_text(self): # 「投稿者: 本文」を一行ずつ並べたテキストで取り出す
+        return "\n".join(f"{c.author}: {c.message}" for c in self.drain())
+
+    def __len__(self):
+        return len(self.buf)
+
+    def stats(self):
+        with self.lock:
+            return {'queued': len(self.buf), 'received': self.received,
+                    'dropped_overflow': self.dropped_overflow, 'dropped_rate': self.dropped_rate}
+
+
+TAIL_MAX_LINES = 100             # 一度に渡すコメントの上限（新しいものを優先）
+TAIL_MAX_READ_BYTES = 256 * 1024 # 一度に読む量の上限。これより多く溜まっていたら末尾側だけを読む
+
+
+class CommentFileTail:
+    # 外部ツールが追記していく comment.txt を tail -f のように読む。
+    #   - 前回読み終えた位置から、新しく追記された分だけをまとめて読む
+    #   - 書きかけの最終行（改行で終わっていない行）は次回に回す
+    #   - ファイルが作り直された（ローテーション）・切り詰められた場合は先頭から読み直す
+    #   - 読み終えた位置は state_path へ保存し、起動し直しても続きから読む
+
+    def __init__(self, path, max_lines=TAIL_MAX_LINES, state_path=None):
+        self.path = path
+        self.max_lines = max_lines
+        self.state_path = state_path if state_path is not None else path + ".pos"
+        self.offset = 0
+        self.file_id = None
+        self._load_state()
+
+    def _load_state(self): # 前回読み終えた位置を読み込む（無ければ先頭から）
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.offset = int(state['offset'])
+            self.file_id = tuple(state['file_id']) if state.get('file_id') else None
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"   [Warning] Comment file position load failed, reading from the start: {e}")
+            self.offset, self.file_id = 0, None
+
+    def _save_state(self): # 一時ファイル経由で置き換える
+        tmp = self.state_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({'offset': self.offset, 'file_id': self.file_id}, f)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"   [Warning] Comment file position save failed: {e}")
+
+    def _stat(self):
+        try:
+            return os.stat(self.path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _identity(st): # ファイルの同一性（作り直されたかどうかの判定用。inode が取れない環境では判定しない）
+        return (st.st_dev, st.st_ino) if st.st_ino else None
+
+    def read_lines(self): # 前回から追記された行（最大 max_lines 行、新しいものを優先）
+        st = self._stat()
+        if st is None:
+            self.offset = 0      # 消された。次に現れたら先頭から読む
+            self.file_id = None
+            return []
+        file_id = self._identity(st)
+        if file_id != self.file_id or st.st_size < self.offset:
+            self.offset = 0      # ローテーション・切り詰め
+            self.file_id = file_id
+        if st.st_size == self.offset:
+            return []
+        start = max(self.offset, st.st_size - TAIL_MAX_READ_BYTES)
+        skipped = start > self.offset   # 溜まりすぎていて、末尾側だけを読む
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                data = f.read(st.st_size - start)
+        except OSError as e:
+            print(f"   [System] Comment file read error: {e}")
+            return []
+        end = data.rfind(b"\n")
+        if end < 0:
+            # 改行がまだない。上限いっぱいまで溜まっている時だけは、そのまま読み捨てて先へ進む
+            if skipped:
+                self.offset = st.st_size
+                self._save_state()
+            return []
+        self.offset = start + end + 1
+        self._save_state()
+        lines = data[:end].decode("utf-8", errors="replace").splitlines()
+        if skipped:
+            lines = lines[1:]    # 途中から読み始めた最初の行は欠けているので捨てる
+        lines = [line.strip() for line in lines if line.strip()]
+        return lines[-self.max_lines:]
+
+    def read_text(self):
+        return "\n".join(self.read_lines())
+
+
+COMMENT_TOP_K = 5            # プロンプトへ渡すコメントの件数
+COMMENT_MAX_CHARS = 200      # 一件あたりの長さの上限（超えた分は切る）
+CHARS_PER_TOKEN = 4          # トークン数の概算（英語でおよそ4文字で1トークン）
+AUTHOR_REPEAT_PENALTY = 0.5  # 同じ投稿者の2件目以降は点数をこの倍率ずつ下げる
+
+_EMOTE = re.compile(r":[^:\s]+:")          # YouTube のスタンプ（:face-blue-smiling: など）
+_URL = re.compile(r"https?://|www\.", re.IGNORECASE)
+_REPEAT = re.compile(r"(.)\1{4,}")          # 同じ文字の5連続以上（wwwww、！！！！！ など）
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _normalize(message): # 重複判定用のキー（大文字小文字・記号・空白の違いを無視する）
+    return " ".join("".join(ch for ch in message.casefold() if ch.isalnum() or ch.isspace()).split())
+
+
+def rank_comments(text, top_k=COMMENT_TOP_K, log=True):
+    # 「投稿者: 本文」の行（古い順）を受け取り、残す行だけを古い順に並べて返す
+    lines = [line.strip() for line in (text or "").splitlines() if line.strip()]
+    if not lines:
+        return ""
+    latest = {}   # 正規化した本文 -> (行番号, 投稿者, 本文)。同じ内容は最新の一件だけ残す
+    for i, line in enumerate(lines):
+        author, sep, message = line.partition(": ")
+        if not sep:
+            author, message = "", line
+        message = _REPEAT.sub(r"\1\1\1", message)
+        bare = _EMOTE.sub("", message)
+        if _URL.search(bare) or sum(ch.isalnum() for ch in bare) < 2:
+            continue   # URL（宣伝）と、スタンプ・絵文字・記号だけの行
+        if len(message) > COMMENT_MAX_CHARS:
+            message = message[:COMMENT_MAX_CHARS].rstrip() + "..."
+        latest[_normalize(bare)] = (i, author, message)
+
+    # 新しいほど高く、同じ投稿者が続くほど低くなるように、一件ずつ貪欲に選ぶ
+    candidates = sorted(latest.values())
+    n = len(lines)
+    picked, per_author = [], {}
+    while candidates and len(picked) < top_k:
+        best = max(range(len(candidates)), key=lambda j: (
+            (candidates[j][0] + 1) / n * AUTHOR_REPEAT_PENALTY ** per_author.get(candidates[j][1], 0), candidates[j][0]))
+        i, author, message = candidates.pop(best)
+        per_author[author] = per_author.get(author, 0) + 1
+        picked.append((i, f"{author}: {message}" if author else message))
+    result = "\n".join(line for _i, line in sorted(picked))
+    if log:
+        print(f"   [Comments] {len(lines)} lines (~{estimate_tokens(text)} tokens) -> "
+              f"{len(picked)} lines (~{estimate_tokens(result)} tokens)")
+    return result
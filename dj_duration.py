@@ -0,0 +1,267 @@
+import os
+import json
+import wave
+import struct
+
+# ==========================================
+# dj_duration.py   曲の長さインデックス
+# ==========================================
+# pygame.mixer.Sound で曲全体をデコードせずに、ヘッダーだけから長さを求める（MP3/FLAC/OGG/WAV）。
+# 結果は (パス, mtime, サイズ) をキーに JSON へ保存し、次回起動時は読み込むだけで済ませる。
+# ==========================================
+
+DURATION_INDEX_PATH = "duration_index.json"  # 長さインデックスの保存先
+
+# --- MP3フレームヘッダーの表 ---
+# ビットレート(kbps) [MPEG1/MPEG2系][レイヤー]
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# サンプリング周波数 [バージョンビット]
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG1
+    2: [22050, 24000, 16000],  # MPEG2
+    0: [11025, 12000, 8000],   # MPEG2.5
+}
+# --------------------
+
+
+def _parse_frame_header(header): # 4バイトのフレームヘッダーを解釈する（不正ならNone）
+    if len(header) < 4:
+        return None
+    b = struct.unpack(">I", header)[0]
+    if (b >> 21) & 0x7FF != 0x7FF:
+        return None
+    version_bits = (b >> 19) & 0x3
+    layer_bits = (b >> 17) & 0x3
+    bitrate_idx = (b >> 12) & 0xF
+    rate_idx = (b >> 10) & 0x3
+    if version_bits == 1 or layer_bits == 0 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+
+    layer = 4 - layer_bits
+    family = 1 if version_bits == 3 else 2
+    bitrate = _BITRATES[(family, layer)][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_idx]
+    padding = (b >> 9) & 0x1
+    mono = ((b >> 6) & 0x3) == 3
+
+    if layer == 1:
+        samples = 384
+        frame_len = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or family == 1:
+        samples = 1152
+        frame_len = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        frame_len = 72 * bitrate // sample_rate + padding
+
+    return {
+        'family': family, 'layer': layer, 'bitrate': bitrate, 'sample_rate': sample_rate,
+        'mono': mono, 'samples': samples, 'frame_len': frame_len,
+    }
+
+
+def _skip_id3v2(f): # 先頭のID3v2タグを読み飛ばし、音声データの開始位置を返す
+    f.seek(0)
+    head = f.read(10)
+    if len(head) == 10 and head[:3] == b"ID3":
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        footer = 10 if head[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _find_first_frame(f, start, limit=65536): # 最初の有効なフレームを探す
+    f.seek(start)
+    buf = f.read(limit)
+    for i in range(len(buf) - 3):
+        if buf[i] != 0xFF or (buf[i + 1] & 0xE0) != 0xE0:
+            continue
+        info = _parse_frame_header(buf[i:i + 4])
+        if not info:
+            continue
+        # 偽の同期ワードを避けるため、次のフレームも正しく並んでいるか確かめる
+        nxt = i + info['frame_len']
+        if nxt + 4 <= len(buf) and not _parse_frame_header(buf[nxt:nxt + 4]):
+            continue
+        return start + i, info
+    return None, None
+
+
+def _read_vbr_frames(f, pos, info): # Xing/Info または VBRI ヘッダーから総フレーム数を取得する
+    f.seek(pos)
+    frame = f.read(max(info['frame_len'], 64))
+
+    # Xing/Info はサイド情報の直後に置かれる
+    if info['family'] == 1:
+        side = 17 if info['mono'] else 32
+    else:
+        side = 9 if info['mono'] else 17
+    off = 4 + side
+    tag = frame[off:off + 4]
+    if tag in (b"Xing", b"Info") and len(frame) >= off + 12:
+        flags = struct.unpack(">I", frame[off + 4:off + 8])[0]
+        if flags & 0x1:
+            return struct.unpack(">I", frame[off + 8:off + 12])[0]
+
+    # VBRI はヘッダー直後から32バイトの位置に固定
+    if frame[36:40] == b"VBRI" and len(frame) >= 36 + 18:
+        return struct.unpack(">I", frame[36 + 14:36 + 18])[0]
+    return None
+
+
+def _scan_frames(f, pos): # VBRヘッダーがない場合はフレームを一つずつ辿って総サンプル数を数える（デコードはしない）
+    total_samples = 0
+    sample_rate = None
+    while True:
+        f.seek(pos)
+        info = _parse_frame_header(f.read(4))
+        if not info or info['frame_len'] <= 0:
+            break
+        total_samples += info['samples']
+        sample_rate = sample_rate or info['sample_rate']
+        pos += info['frame_len']
+    return total_samples, sample_rate
+
+
+def mp3_duration_us(path): # MP3の長さをマイクロ秒で返す（解析できなければNone）
+    with open(path, "rb") as f:
+        start = _skip_id3v2(f)
+        pos, info = _find_first_frame(f, start)
+        if pos is None:
+            return None
+
+        frames = _read_vbr_frames(f, pos, info)
+        if frames:
+            return frames * info['samples'] * 1_000_000 // info['sample_rate']
+
+        total_samples, sample_rate = _scan_frames(f, pos)
+        if not sample_rate:
+            return None
+        return total_samples * 1_000_000 // sample_rate
+
+
+def wav_duration_us(path): # WAVはヘッダーのフレーム数から
+    with wave.open(path, "rb") as w:
+        return w.getnframes() * 1_000_000 // w.getframerate()
+
+
+def flac_duration_us(path): # FLACは STREAMINFO ブロックの総サンプル数から
+    with open(path, "rb") as f:
+        if f.read(4) != b"fLaC":
+            return None
+        while True:
+            block = f.read(4)
+            if len(block) < 4:
+                return None
+            block_type = block[0] & 0x7F
+            length = int.from_bytes(block[1:4], "big")
+            if block_type == 0:
+                info = f.read(length)
+                sample_rate = int.from_bytes(info[10:13], "big") >> 4
+                total = ((info[13] & 0x0F) << 32) | int.from_bytes(info[14:18], "big")
+                return total * 1_000_000 // sample_rate if sample_rate and total else None
+            if block[0] & 0x80:
+                return None
+            f.seek(length, os.SEEK_CUR)
+
+
+def ogg_duration_us(path): # Ogg Vorbisは最終ページのグラニュール位置とサンプリング周波数から
+    with open(path, "rb") as f:
+        head = f.read(4096)
+        pos = head.find(b"\x01vorbis")
+        if pos < 0:
+            return None
+        sample_rate = struct.unpack("<I", head[pos + 12:pos + 16])[0]
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+    last = tail.rfind(b"OggS")
+    if last < 0 or not sample_rate:
+        return None
+    granule = struct.unpack("<q", tail[last + 6:last + 14])[0]
+    return granule * 1_000_000 // sample_rate if granule > 0 else None
+
+
+_PROBES = {
+    ".mp3": mp3_duration_us,
+    ".wav": wav_duration_us,
+    ".flac": flac_duration_us,
+    ".ogg": ogg_duration_us,
+}
+
+
+def probe_duration_us(path): # 拡張子に応じて長さを求める
+    probe = _PROBES.get(os.path.splitext(path)[1].lower())
+    return probe(path) if probe else None
+
+
+class DurationIndex:
+    # (パス, mtime, サイズ) をキーにした長さのキャッシュ。
+    # ファイルが差し替えられたら自動的に測り直す。
+
+    def __init__(self, path=DURATION_INDEX_PATH):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            print(f"   [Warning] Duration index load failed: {e}")
+            self.entries = {}
+
+    def save(self): # 変更があった時だけ、一時ファイル経由で置き換える
+        if not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except Exception as e:
+            print(f"   [Warning] Duration index save failed: {e}")
+
+    def get_us(self, path): # 曲の長さ（マイクロ秒）。不明なら0
+        try:
+            st = os.stat(path)
+        except OSError:
+            return 0
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+            return entry['us']
+
+        try:
+            us = probe_duration_us(path) or 0
+        except Exception as e:
+            print(f"   [Warning] Duration probe failed ({os.path.basename(path)}): {e}")
+            us = 0
+        self.entries[key] = {'mtime': st.st_mtime, 'size': st.st_size, 'us': us}
+        self.dirty = True
+        return us
+
+    def prune(self, live_paths): # 存在しなくなった曲の記録を消す
+        live = {os.path.abspath(p) for p in live_paths}
+        for key in [k for k in self.entries if k not in live]:
+            del self.entries[key]
+            self.dirty = True
+
+
+def format_duration(us): # 表示用の mm:ss
+    if not us:
+        return "--:--"
+    sec = us // 1_000_000
+    return f"{sec // 60:02}:{sec % 60:02}"
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+
+from dj_lazy import lazy_import
+
+pygame = lazy_import("pygame")
+
+# ==========================================
+# dj_events.py   再生終了イベントの橋渡し
+# ==========================================
+# pygame の終了イベント（mixer.music.set_endevent / Channel.set_endevent）を asyncio の Future に渡し、
+# main_loop は get_busy() を0.5秒おきに確かめる代わりに、鳴り終わりを直接 await する。
+# pygame のイベントキューは asyncio を起こせないため、専用のスレッドが pygame.event.wait() で眠って待ち、
+# 終了イベントが届いた時だけ call_soon_threadsafe でイベントループを起こす（届くまでは何も読まない）。
+# SDL はイベントの取り出しを、ディスプレイ系を初期化したスレッドでしか認めないので、初期化もそのスレッドで行う。
+#   - 終わる見込みの時刻（曲・声の長さ）は、イベントが来なかった時の保険のタイマーにだけ使う
+#   - 打ち切り（MAX_PLAY_TIME）は wait() の timeout、つまり asyncio のタイマーで行う
+# イベントが使えない環境（ディスプレイ系を初期化できない）では、見込みの時刻から get_busy() で確かめる。
+# ==========================================
+
+EVENT_GRACE_SEC = 0.5   # 見込みをこれだけ過ぎてもイベントが来なければ、get_busy() で判断する
+RECHECK_SEC = 1.0       # 保険の確認でまだ鳴っていた時・見込みが分からない時の、次の確認までの間隔（秒）
+FALLBACK_INTERVAL = 0.05  # イベントが使えない時、見込みの時刻を過ぎてからの確認間隔（秒）
+WATCH_TIMEOUT_MS = 1000 # 監視スレッドが止める合図を確かめる間隔（ミリ秒。close() はイベントを送って即座に起こす）
+WATCH_START_SEC = 5.0   # 監視スレッドがディスプレイ系を初期化し終えるまで待つ上限（秒）
+
+
+class _Waiter:
+
+    __slots__ = ("event_type", "future", "is_done", "timer")
+
+    def __init__(self, event_type, future, is_done):
+        self.event_type = event_type
+        self.future = future
+        self.is_done = is_done    # 本当に鳴り終わっているかを確かめる関数
+        self.timer = None         # 保険の確認タイマー（asyncio の TimerHandle）
+
+
+class PlaybackEvents:
+
+    def __init__(self):
+        self.types = {}
+        for key in ("music", "channel", "wake"):   # 監視スレッドからも読むので、種類は初めに全部決めておく
+            self._event_type(key)
+        self.waiters = []
+        self.loop = asyncio.get_running_loop()
+        self.closing = threading.Event()
+        self.checks = 0             # 鳴り終わりを確かめた回数（起床回数のメトリクス）
+        # 監視スレッドを起こし、そこでディスプレイ系を初期化できたかを待つ（失敗したらタイマーだけで判断する）
+        self.enabled = False
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._watch, name="playback-events", daemon=True)
+        self.thread.start()
+        if not self.started.wait(WATCH_START_SEC):
+            print("   [System] Playback end events unavailable, falling back to timers: display init timed out")
+
+    def _event_type(self, key):
+        if key not in self.types:
+            self.types[key] = pygame.USEREVENT + 1 + len(self.types)
+        return self.types[key]
+
+    def _add(self, event_type, length_sec, is_done):
+        future = self.loop.create_future()
+        waiter = _Waiter(event_type, future, is_done)
+        self.waiters.append(waiter)
+        future.add_done_callback(lambda _f: self._forget(waiter))
+        if self.enabled:
+            delay = length_sec + EVENT_GRACE_SEC if length_sec is not None else RECHECK_SEC
+        else:
+            delay = length_sec if length_sec is not None else RECHECK_SEC
+        waiter.timer = self.loop.call_later(delay, self._on_timer, waiter)
+        return future
+
+    def _forget(self, waiter): # 完了・取り消し（タイムアウト）した待ち合わせを外す
+        if waiter.timer is not None:
+            waiter.timer.cancel()
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+
+    def _check(self, waiter): # 実際に止まっていれば完了させる（イベントと保険のタイマーの両方から呼ばれる）
+        if waiter.future.done():
+            return True
+        self.checks += 1
+        if waiter.is_done():
+            self._complete(waiter)
+            return True
+        return False
+
+    def _complete(self, waiter): # 待ち合わせを完了させる唯一の場所。どちらが先に来ても二重には完了させない
+        if not waiter.future.done():
+            waiter.future.set_result(True)
+
+    # --- イベントループ側 ---
+
+    def _on_event(self, event_type): # 終了イベントが届いた（同じ種類のチャンネルが複数あるので、どれが止まったかを確かめる）
+        for waiter in [w for w in self.waiters if w.event_type == event_type]:
+            self._check(waiter)
+
+    def _on_timer(self, waiter): # 見込みを過ぎてもイベントが来なかった時の保険
+        if self._check(waiter):
+            return
+        interval = RECHECK_SEC if self.enabled else FALLBACK_INTERVAL
+        waiter.timer = self.loop.call_later(interval, self._on_timer, waiter)
+
+    # --- 監視スレッド ---
+
+    def _watch(self): # ディスプレイ系を初期化し、pygame.event.wait() で眠って終了イベントだけをイベントループへ渡す
+        try:
+            pygame.display.init()   # イベントキューを使うため（ウィンドウは開かない）
+        except pygame.error as e:
+            print(f"   [System] Playback end events unavailable, falling back to timers: {e}")
+            self.started.set()
+            return
+        self.enabled = True
+        self.started.set()
+        ends = {self.types["music"], self.types["channel"]}
+        try:
+            while not self.closing.is_set():
+                event = pygame.event.wait(WATCH_TIMEOUT_MS)
+                if event.type not in ends:
+                    continue
+                try:
+                    self.loop.call_soon_threadsafe(self._on_event, event.type)
+                except RuntimeError:    # イベントループが閉じられた
+                    return
+        finally:
+            pygame.display.quit()   # 初期化したスレッドで片付ける
+
+    # --- 公開API ---
+
+    def music_end(self, length_sec=None): # pygame.mixer.music の再生終了で完了する Future（play() の直後に呼ぶ）
+        event_type = self._event_type("music")
+        pygame.mixer.music.set_endevent(event_type)
+        return self._add(event_type, length_sec, lambda: not pygame.mixer.music.get_busy())
+
+    def channel_end(self, channel, length_sec=None): # Sound.play() が返したチャンネルの再生終了で完了する Future
+        if channel is None:     # 空きチャンネルが無く、再生されなかった
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(True)
+            return future
+        event_type = self._event_type("channel")
+        channel.set_endevent(event_type)
+        return self._add(event_type, length_sec, lambda: not channel.get_busy())
+
+    async def wait(self, future, timeout=None): # 鳴り終われば True、timeout 秒で打ち切れば False
+        done, _pending = await asyncio.wait({future}, timeout=timeout)
+        if not done:
+            future.cancel()
+            return False
+        return True
+
+    def close(self):
+        for w in list(self.waiters):
+            w.future.cancel()
+        self.waiters.clear()
+        if self.thread.is_alive():
+            self.closing.set()
+            try:
+                pygame.event.post(pygame.event.Event(self.types["wake"]))   # 眠っている監視スレッドを起こす
+            except pygame.error:
+                pass
+            self.thread.join(timeout=WATCH_TIMEOUT_MS / 1000 + 0.5)
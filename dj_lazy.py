@@ -0,0 +1,31 @@
+import importlib
+
+# ==========================================
+# dj_lazy.py   遅延インポート
+# ==========================================
+# pygame / edge_tts / google.genai などの重いモジュールを、実際に属性へ触れた時点で初めて読み込む。
+# スクリプトのインポートやドライランで、音声デバイスやSDKの初期化まで走らせないためのもの。
+# ==========================================
+
+
+class LazyModule:
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr): # 初回アクセス時にだけ本物のモジュールを読み込む
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
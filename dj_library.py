@@ -0,0 +1,132 @@
+import os
+import re
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================================
+# dj_library.py   音楽ライブラリのスキャナー
+# ==========================================
+# 音楽フォルダを再帰的に走査し、結果をスナップショットとして保存する。
+# 次回起動時は各フォルダの mtime だけを確認し、変化したフォルダのみ os.scandir で読み直す。
+# NAS上の数万曲でも、起動時のディレクトリ一覧取得を最小限に抑えるためのもの。
+# スナップショットが覚えるのはファイル名（と曲ID）だけ。同じ名前のまま中身を差し替えてもフォルダの mtime は
+# 変わらないが、名前と曲IDの対応は変わらないので問題ない。中身に依存する長さ・ラウドネスは、
+# DurationIndex・LoudnessIndex がそれぞれファイルの mtime とサイズで確かめて測り直す。
+# 同じ曲IDのファイルが複数あれば、従来（glob の結果を順に辞書へ入れていた）と同じく後に見つかった方を使う。
+# ==========================================
+
+LIBRARY_SNAPSHOT_PATH = "library_snapshot.json"          # スナップショットの保存先
+AUDIO_EXTENSIONS = (".mp3", ".flac", ".ogg", ".wav")      # 対象とする音声形式
+PARALLEL_THRESHOLD = 32   # 1階層あたりのフォルダ数がこれを超えたら並列で走査する
+SCAN_WORKERS = 8          # 並列走査のスレッド数
+SNAPSHOT_VERSION = 2      # スナップショットの形式（違う形式のものは読み捨てて全体を走査し直す）
+
+_ID_PATTERN = re.compile(r"(\d+)")
+
+
+def parse_song_id(filename): # ファイル名先頭の数字を曲IDとして取り出す
+    match = _ID_PATTERN.match(filename)
+    return int(match.group(1)) if match else None
+
+
+def _read_dir(path): # フォルダ一つ分を読み取り、スナップショット形式で返す
+    files, subdirs = [], []
+    st = os.stat(path)
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                    files.append([entry.name, parse_song_id(entry.name)])
+            except OSError:
+                continue
+    return {'mtime': st.st_mtime, 'files': files, 'subdirs': sorted(subdirs)}
+
+
+def _refresh_dir(path, cached): # フォルダの mtime が変わっていなければ前回の結果を使い回す
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, False
+    if cached and cached.get('mtime') == st.st_mtime:
+        return path, cached, False
+    try:
+        return path, _read_dir(path), True
+    except OSError as e:
+        print(f"   [Warning] Cannot read folder {path}: {e}")
+        return path, None, False
+
+
+def load_snapshot(snapshot_path=LIBRARY_SNAPSHOT_PATH):
+    if not os.path.exists(snapshot_path):
+        return {}
+    try:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get('version') != SNAPSHOT_VERSION:
+            return {}
+        return data.get('dirs', {})
+    except Exception as e:
+        print(f"   [Warning] Library snapshot load failed: {e}")
+        return {}
+
+
+def save_snapshot(dirs, root, snapshot_path=LIBRARY_SNAPSHOT_PATH): # 一時ファイル経由で置き換える
+    tmp = snapshot_path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({'version': SNAPSHOT_VERSION, 'root': root, 'dirs': dirs}, f, ensure_ascii=False)
+        os.replace(tmp, snapshot_path)
+    except Exception as e:
+        print(f"   [Warning] Library snapshot save failed: {e}")
+
+
+def walk_library(root, snapshot_path=LIBRARY_SNAPSHOT_PATH):
+    # ルートから1階層ずつ辿る。フォルダ数が多い階層はスレッドプールで stat/scandir を並列化する
+    old_dirs = load_snapshot(snapshot_path)
+    new_dirs = {}
+    rescanned = 0
+    level = [os.path.normpath(root)]
+
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        while level:
+            if len(level) > PARALLEL_THRESHOLD:
+                results = list(pool.map(lambda p: _refresh_dir(p, old_dirs.get(p)), level))
+            else:
+                results = [_refresh_dir(p, old_dirs.get(p)) for p in level]
+
+            level = []
+            for path, data, changed in results:
+                if data is None:
+                    continue
+                new_dirs[path] = data
+                rescanned += changed
+                level.extend(os.path.join(path, name) for name in data['subdirs'])
+
+    if new_dirs != old_dirs:
+        save_snapshot(new_dirs, root, snapshot_path)
+    return new_dirs, rescanned
+
+
+def scan_library(root, snapshot_path=LIBRARY_SNAPSHOT_PATH): # {曲ID: パス} を返す
+    started = time.perf_counter()
+    files_map = {}
+    if not os.path.isdir(root):
+        print(f"   [Warning] Music folder not found: {root}")
+        return files_map
+
+    dirs, rescanned = walk_library(root, snapshot_path)
+    for path in sorted(dirs):
+        for name, song_id in dirs[path]['files']:
+            if song_id is None:
+                continue
+            if song_id in files_map:
+                print(f"   [Warning] Duplicate song id {song_id}: {name} (replaces {os.path.basename(files_map[song_id])})")
+            files_map[song_id] = os.path.join(path, name)
+
+    elapsed = time.perf_counter() - started
+    print(f"   [System] Library scan: {len(files_map)} songs in {len(dirs)} folders "
+          f"({rescanned} rescanned) in {elapsed:.2f}s")
+    return files_map
@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dj_lazy import lazy_import
+
+np = lazy_import("numpy")
+pygame = lazy_import("pygame")
+
+# ==========================================
+# dj_loudness.py   ラウドネス解析とトラックゲイン
+# ==========================================
+# vol_fix.py のように MP3 をデコードして音量を変え、上書きで再エンコードする（そのたびに音質が落ちる）代わりに、
+# 曲ごとの EBU R128 / ITU-R BS.1770 の統合ラウドネス（LUFS）とトゥルーピーク（dBTP）を測って記録だけしておき、
+# 再生する時にその差の分だけ音量を変える（ReplayGain と同じ考え方）。音声ファイルには一切手を加えない。
+#   - 解析はプロセスプールで並列に行う（デコードと計算はCPUを使うので、スレッドではなくプロセス）
+#   - 結果は (パス, mtime, サイズ) とファイルのハッシュをキーに JSON へ保存し、変わっていない曲は測り直さない
+#     （mtime だけが変わった曲は、ハッシュが同じなら記録を使い回す）
+#   - プレイヤーは LoudnessIndex.gain() で音量の倍率を受け取り、曲の音量に掛ける（記録の無い曲は 1.0）
+# 使い方: python dj_loudness.py D:/Music     （音楽フォルダを解析してインデックスを更新する）
+# ==========================================
+
+LOUDNESS_INDEX_PATH = "loudness_index.json"   # ラウドネスインデックスの保存先
+TARGET_LUFS = -18.0          # 揃える先のラウドネス（ReplayGain 2.0 の基準と同じ）
+MAX_TRUE_PEAK_DB = -1.0      # ゲインを上げる時も、トゥルーピークがこれを超えないようにする（dBTP）
+ANALYSIS_RATE = 44100        # 解析用にデコードする形式（プレイヤーのミキサーと同じ）
+ANALYSIS_CHANNELS = 2
+ANALYSIS_WORKERS = 4         # 解析のプロセス数の上限（CPUの数より多くはしない）。1曲を丸ごとデコードして持つので、メモリが少なければ減らす
+SAVE_EVERY = 50              # この曲数を解析するごとにインデックスを保存する（途中で止めても無駄にしない）
+HASH_BLOCK = 1 << 20         # ファイルのハッシュを求める時の読み込み単位（バイト）
+
+# --- BS.1770 の定数 ---
+GATE_BLOCK_SEC = 0.4         # ゲーティングのブロック長（秒）
+GATE_STEP_SEC = 0.1          # ブロックをずらす間隔（75%の重なり）
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+OVERSAMPLE = 4               # トゥルーピークを求める時のオーバーサンプリング倍率
+OVERSAMPLE_TAPS = 12         # 補間フィルターの、位相あたりのタップ数
+FILTER_FFT = 1 << 16         # K特性フィルターを掛けるFFTの長さ（重畳加算法）
+FILTER_IR = 1 << 13          # K特性フィルターのインパルス応答を打ち切る長さ（38Hz ハイパスが十分に減衰する長さ）
+PEAK_BLOCK = 1 << 18         # トゥルーピークを求める時に一度に扱うフレーム数
+# --------------------
+
+
+# --- 測定 ---
+
+def _biquad(kind, freq): # K特性フィルターの2段（高域シェルフ、ハイパス）の係数。48kHz では BS.1770 の係数表と一致する
+    if kind == "shelf":
+        f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+        k = np.tan(np.pi * f0 / freq)
+        vh = 10.0 ** (gain_db / 20.0)
+        vb = vh ** 0.4996667741545416
+        b = [vh + vb * k / q + k * k, 2.0 * (k * k - vh), vh - vb * k / q + k * k]
+    else:
+        f0, q = 38.13547087602444, 0.5003270373238773
+        k = np.tan(np.pi * f0 / freq)
+        b = [1.0, -2.0, 1.0]
+    den = 1.0 + k / q + k * k
+    a = [1.0, 2.0 * (k * k - 1.0) / den, (1.0 - k / q + k * k) / den]
+    if kind == "shelf":
+        b = [c / den for c in b]
+    return np.array(b), np.array(a)
+
+
+@lru_cache(maxsize=4)
+def _k_filter_spectrum(freq): # K特性フィルターを、打ち切ったインパルス応答のスペクトル（長さ FILTER_FFT）として返す
+    z = np.exp(-1j * np.pi * np.arange(FILTER_FFT // 2 + 1) / (FILTER_FFT // 2))
+    response = np.ones_like(z)
+    for kind in ("shelf", "highpass"):
+        b, a = _biquad(kind, freq)
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    impulse = np.fft.irfft(response, FILTER_FFT)[:FILTER_IR]
+    return np.fft.rfft(impulse, FILTER_FFT)
+
+
+def _k_weighted_steps(samples, freq, step):
+    # K特性を掛けた信号のパワーを、step フレームごとに全チャンネル分合計したもの。
+    # IIR をサンプルごとに回す代わりに重畳加算法で畳み込み、曲全体の浮動小数点のコピーは作らない
+    spectrum = _k_filter_spectrum(freq)
+    hop = FILTER_FFT - FILTER_IR
+    n = len(samples)
+    sums = np.zeros(n // step + 1, dtype=np.float64)
+    for ch in range(samples.shape[1]):
+        carry = np.zeros(FILTER_IR, dtype=np.float64)
+        for start in range(0, n, hop):
+            block = samples[start:start + hop, ch].astype(np.float64) / 32768.0
+            y = np.fft.irfft(np.fft.rfft(block, FILTER_FFT) * spectrum, FILTER_FFT)
+            y[:FILTER_IR] += carry
+            carry = y[hop:]
+            done = y[:len(block)]   # 後の区間からはもう足されない部分
+            first = start // step
+            local = np.bincount(np.arange(start, start + len(block)) // step - first, weights=done * done)
+            sums[first:first + len(local)] += local
+    return sums
+
+
+def integrated_loudness(samples, freq): # 16bit の (フレーム数, チャンネル数) 配列の統合ラウドネス（LUFS）。無音なら -inf
+    step = int(GATE_STEP_SEC * freq)
+    per_block = int(round(GATE_BLOCK_SEC / GATE_STEP_SEC))
+    steps = len(samples) // step
+    if steps < per_block:
+        return float("-inf")
+    # 100ms ごとのパワーを、連続する4つずつ平均して 400ms のブロック（75%重なり）にする。L/R の重みは 1.0
+    sums = _k_weighted_steps(samples, freq, step)[:steps]
+    window = np.convolve(sums, np.ones(per_block), mode="valid") / (per_block * step)
+    with np.errstate(divide="ignore"):
+        blocks = -0.691 + 10.0 * np.log10(window)
+    gated = window[blocks > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return float("-inf")
+    relative = -0.691 + 10.0 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = window[blocks > max(relative, ABSOLUTE_GATE_LUFS)]
+    return float(-0.691 + 10.0 * np.log10(gated.mean()))
+
+
+@lru_cache(maxsize=1)
+def _oversample_taps(): # 4倍オーバーサンプリングの補間フィルター（窓付き sinc）。列ごとに、サンプルの間の一点を補間する
+    taps = OVERSAMPLE * OVERSAMPLE_TAPS
+    t = (np.arange(taps) - taps // 2) / OVERSAMPLE   # 位相 p はサンプルから p/4 だけ後ろの点
+    h = np.sinc(t) * np.kaiser(taps, 8.0)
+    phases = [h[p::OVERSAMPLE][::-1] / h[p::OVERSAMPLE].sum() for p in range(OVERSAMPLE)]
+    return np.stack(phases, axis=1).astype(np.float32)   # (OVERSAMPLE_TAPS, OVERSAMPLE)
+
+
+def true_peak_db(samples): # トゥルーピーク（dBTP）。サンプルの間に生じるピークも、オーバーサンプリングして拾う
+    peak = float(np.abs(samples.astype(np.int32)).max(initial=0)) / 32768.0 if len(samples) else 0.0
+    taps = _oversample_taps()
+    for ch in range(samples.shape[1]):
+        for start in range(0, len(samples), PEAK_BLOCK):
+            # 隣の区間と OVERSAMPLE_TAPS だけ重ね、窓が収まる所だけを補間する（区間の切れ目で偽のピークを作らない）
+            block = samples[max(0, start - OVERSAMPLE_TAPS):start + PEAK_BLOCK, ch].astype(np.float32) / 32768.0
+            if len(block) < OVERSAMPLE_TAPS:
+                continue
+            # 位相ごとの畳み込みを、ずらし窓と係数行列の積一回で計算する
+            windows = np.lib.stride_tricks.sliding_window_view(block, OVERSAMPLE_TAPS)
+            peak = max(peak, float(np.abs(windows @ taps).max()))
+    return 20.0 * np.log10(peak) if peak > 0 else float("-inf")
+
+
+def measure(samples, freq): # 16bit の (フレーム数, チャンネル数) 配列から (統合ラウドネス, トゥルーピーク)
+    return integrated_loudness(samples, freq), true_peak_db(samples)
+
+
+def track_gain_db(lufs, peak_db, target=TARGET_LUFS, max_peak=MAX_TRUE_PEAK_DB):
+    # target に揃えるゲイン（dB）。上げる時はトゥルーピークが max_peak を超えない所で止める
+    if lufs == float("-inf"):
+        return 0.0
+    gain = target - lufs
+    if peak_db != float("-inf"):
+        gain = min(gain, max_peak - peak_db)
+    return gain
+
+
+# --- 解析プロセス ---
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _init_worker(): # 解析プロセスごとに、音を出さないミキサーを用意する（デコードに pygame.mixer.Sound を使うため）
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    pygame.mixer.init(ANALYSIS_RATE, -16, ANALYSIS_CHANNELS)
+
+
+def analyze_file(path, known_hash=None):
+    # 1曲を解析して記録を返す。ハッシュが known_hash と同じなら（中身は変わっていない）デコードせずに unchanged をつけて返す
+    st = os.stat(path)
+    digest = file_hash(path)
+    entry = {'mtime': st.st_mtime, 'size': st.st_size, 'hash': digest}
+    if digest == known_hash:
+        return dict(entry, unchanged=True)
+    raw = pygame.mixer.Sound(path).get_raw()
+    samples = np.frombuffer(raw, dtype=np.int16).reshape(-1, ANALYSIS_CHANNELS)
+    lufs, peak = measure(samples, ANALYSIS_RATE)
+    # JSON に -inf は書けないので、無音の曲は None にする
+    entry['lufs'] = round(lufs, 2) if lufs != float("-inf") else None
+    entry['peak'] = round(peak, 2) if peak != float("-inf") else None
+    return entry
+
+
+# --- インデックス ---
+
+class LoudnessIndex:
+    # (パス, mtime, サイズ) とハッシュをキーにした、曲ごとのラウドネスの記録。
+    # プレイヤーは読むだけで、書き込むのは解析ツール（analyze_library）。
+
+    def __init__(self, path=LOUDNESS_INDEX_PATH):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            print(f"   [Warning] Loudness index load failed: {e}")
+            self.entries = {}
+
+    def save(self): # 変更があった時だけ、一時ファイル経由で置き換える
+        if not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except Exception as e:
+            print(f"   [Warning] Loudness index save failed: {e}")
+
+    def lookup(self, path): # ファイルが変わっていなければ記録を返す（無ければ None）
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = self.entries.get(os.path.abspath(path))
+        if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+            return entry
+        return None
+
+    def gain(self, path, target=TARGET_LUFS): # 再生時に音量へ掛ける倍率（解析していない曲は 1.0）
+        entry = self.lookup(path)
+        if entry is None or entry['lufs'] is None:
+            return 1.0
+        peak = entry['peak'] if entry['peak'] is not None else float("-inf")
+        return 10.0 ** (track_gain_db(entry['lufs'], peak, target) / 20.0)
+
+    def playback_lufs(self, path, target=TARGET_LUFS): # gain() を掛けて再生した時のラウドネス（解析していない曲は target とみなす）
+        entry = self.lookup(path)
+        if entry is None or entry['lufs'] is None:
+            return target
+        peak = entry['peak'] if entry['peak'] is not None else float("-inf")
+        return entry['lufs'] + track_gain_db(entry['lufs'], peak, target)
+
+    def stale(self, paths): # 解析が必要な曲を (パス, 前回のハッシュ) で返す
+        todo = []
+        for path in paths:
+            if self.lookup(path) is None:
+                entry = self.entries.get(os.path.abspath(path))
+                todo.append((path, entry.get('hash') if entry else None))
+        return todo
+
+    def update(self, path, entry):
+        key = os.path.abspath(path)
+        if entry.pop('unchanged', False):   # 中身が同じだった：測定値は前回のものを使う
+            entry = dict(self.entries[key], mtime=entry['mtime'], size=entry['size'])
+        self.entries[key] = entry
+        self.dirty = True
+
+    def prune(self, live_paths): # 存在しなくなった曲の記録を消す
+        live = {os.path.abspath(p) for p in live_paths}
+        for key in [k for k in self.entries if k not in live]:
+            del self.entries[key]
+            self.dirty = True
+
+
+def analyze_library(paths, index, workers=ANALYSIS_WORKERS, target=TARGET_LUFS):
+    # 変わった曲だけをプロセスプールで解析し、インデックスを更新する。解析した曲数を返す
+    todo = index.stale(paths)
+    index.prune(paths)
+    print(f"--- Loudness analysis: {len(todo)} of {len(paths)} tracks need measuring (target {target} LUFS) ---")
+    if not todo:
+        index.save()
+        return 0
+    started = time.perf_counter()
+    done = 0
+    workers = max(1, min(workers or ANALYSIS_WORKERS, os.cpu_count() or 1, len(todo)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(analyze_file, path, known_hash): path for path, known_hash in todo}
+        for future in as_completed(futures):
+            path = futures[future]
+            done += 1
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"   [Warning] Loudness analysis failed ({os.path.basename(path)}): {e}")
+                continue
+            index.update(path, entry)
+            entry = index.entries[os.path.abspath(path)]
+            if entry['lufs'] is None:
+                print(f"  [{done}/{len(todo)}] {os.path.basename(path)}: silent")
+            else:
+                peak = entry['peak'] if entry['peak'] is not None else float("-inf")
+                print(f"  [{done}/{len(todo)}] {os.path.basename(path)}: {entry['lufs']:.1f} LUFS, "
+                      f"peak {peak:.1f} dBTP, gain {track_gain_db(entry['lufs'], peak, target):+.1f} dB")
+            if done % SAVE_EVERY == 0:
+                index.save()
+    index.save()
+    print(f"--- Analyzed {done} tracks in {time.perf_counter() - started:.1f}s ---")
+    return done
+
+
+def main(argv):
+    from dj_library import scan_library
+    if len(argv) < 2:
+        print("Usage: python dj_loudness.py <music folder> [index path] [workers]")
+        return
+    folder = argv[1]
+    if not os.path.isdir(folder):
+        print(f"エラー: フォルダ '{folder}' が見つかりません。")
+        return
+    index = LoudnessIndex(argv[2] if len(argv) > 2 else LOUDNESS_INDEX_PATH)
+    workers = int(argv[3]) if len(argv) > 3 else ANALYSIS_WORKERS
+    analyze_library(list(scan_library(folder).values()), index, workers=workers)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
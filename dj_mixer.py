@@ -0,0 +1,375 @@
+import time
+import asyncio
+import threading
+from collections import deque, namedtuple
+
+from dj_lazy import lazy_import
+
+np = lazy_import("numpy")
+pygame = lazy_import("pygame")
+
+# ==========================================
+# dj_mixer.py   クロスフェードとダッキングのミキサー
+# ==========================================
+# fadeout → sleep → 声 → sleep という「時計まかせ」のつなぎの代わりに、曲と声をメモリ上にデコードし、
+# つなぎ目をサンプル単位で組み立てて、途切れのない一本の流れとして再生する。
+#   - 次の曲は、今の曲を再生している間に先にデコードしておく
+#   - 曲と曲はクロスフェードでつなぐ（カーブは linear / equal_power / s_curve / exponential）
+#   - DJの声は、音量を下げた（ダッキングした）今の曲の終わりに重ね、話し終えたら次の曲をフェードインする
+#   - つなぎ目ごとに無音（デッドエア）の長さを測って表示する
+# 再生は予約したチャンネルへ短いチャンクを順に queue() していく。チャンク同士は隙間なくつながる。
+# チャンクの長さは分かっているので、次のチャンクを渡す時刻まで眠り、ポーリングはしない。
+# 出力先は差し替えられる（dj_sink.py の StreamMixEngine は、音声デバイスの代わりにPCMを書き出す）。
+# ==========================================
+
+MIX_CHANNEL = 1            # 予約するミキサーチャンネル番号（0 はストリーミング音声用）
+MIX_CHUNK_SEC = 1.0        # 一度にチャンネルへ渡す長さ（秒）
+PUMP_SLACK_SEC = 0.05      # 待ち枠のチャンクが鳴り始めてから、その次を渡すまでの余裕（秒）
+WAIT_MIN_SEC = 0.02        # wait_until() が一度に眠る最短の時間（秒）
+DUCK_RAMP_SEC = 1.0        # 声が始まる前に、音楽を下げきるまでの時間（秒）
+TALK_GAP_SEC = 0.5         # 話し終えてから、次の曲のフェードインを始めるまで（秒）
+DEAD_AIR_DBFS = -50.0      # これより小さい区間を無音とみなす
+DEAD_AIR_BLOCK_MS = 10     # 無音判定の単位（ミリ秒）
+CURVES = ("linear", "equal_power", "s_curve", "exponential")
+
+# つなぎ目の予定。位置はすべて出ていく曲の先頭からのフレーム数
+#   cut: ここから先を組み立てた音に置き換える / voice_at: 声の開始 / fade_at: クロスフェードの開始
+#   length: 組み立てる長さ（cut から、次の曲が通常の音量になるまで）/ crossfade: クロスフェードの長さ
+Transition = namedtuple("Transition", ["cut", "voice_at", "fade_at", "length", "crossfade"])
+# 組み立てたつなぎ目の、再生の通し番号（フレーム）での位置
+Cue = namedtuple("Cue", ["voice", "next", "end"])
+
+
+def fade_curves(kind, n): # 長さ n のフェードの音量カーブ（出ていく側, 入ってくる側）
+    t = (np.arange(n, dtype=np.float32) + 0.5) / max(n, 1)
+    if kind == "linear":
+        fade_in = t
+    elif kind == "equal_power":     # 二つを足した音の大きさ（パワー）が一定になる
+        fade_in = np.sin(t * (np.pi / 2))
+    elif kind == "s_curve":
+        fade_in = 0.5 - 0.5 * np.cos(t * np.pi)
+    elif kind == "exponential":     # デシベルで直線（-60dB から 0dB）
+        fade_in = 10.0 ** (-3.0 * (1.0 - t))
+    else:
+        raise ValueError(f"Unknown crossfade curve: {kind} (choose from {', '.join(CURVES)})")
+    fade_in = fade_in.astype(np.float32)
+    return fade_in[::-1].copy(), fade_in
+
+
+def plan_transition(start, end, voice_len, next_len, crossfade, duck_ramp, talk_gap):
+    # start: すでに再生へ回した位置（ここより前は変えられない） / end: 出ていく曲を終えたい位置
+    x = max(0, crossfade)
+    if next_len:
+        x = min(x, next_len // 2)
+    if voice_len:
+        # 声が終わって talk_gap おいたところで、ちょうどクロスフェードが始まるように逆算する
+        voice_at = max(start + duck_ramp, end - x - talk_gap - voice_len)
+        cut = voice_at - duck_ramp
+        fade_at = max(voice_at + voice_len + talk_gap, end - x)
+    else:
+        cut = voice_at = fade_at = max(start, end - x)
+    return Transition(cut, voice_at, fade_at, fade_at + x - cut, x)
+
+
+def dead_air_frames(samples, freq): # 無音（DEAD_AIR_DBFS 未満）のブロックの合計フレーム数
+    block = max(1, freq * DEAD_AIR_BLOCK_MS // 1000)
+    usable = len(samples) // block * block
+    if not usable:
+        return 0
+    peaks = np.abs(samples[:usable].reshape(usable // block, -1).astype(np.int32)).max(axis=1)
+    threshold = 32768 * 10.0 ** (DEAD_AIR_DBFS / 20.0)
+    return int(np.count_nonzero(peaks < threshold)) * block
+
+
+class _Piece:
+    # 再生する区間ひとつ（曲の本体、または組み立てたつなぎ目）
+
+    __slots__ = ("samples", "first", "pos", "stop", "gain", "frame")
+
+    def __init__(self, samples, first, stop, gain, frame):
+        self.samples = samples
+        self.first = first      # この区間の先頭（samples 内の位置）
+        self.pos = first        # 次にチャンネルへ渡す位置
+        self.stop = stop        # ここまで渡す（曲の本体は、つなぎ目が決まるまで仮の位置）
+        self.gain = gain
+        self.frame = frame      # samples[first] の、再生の通し番号（フレーム）
+
+
+class MixEngine:
+
+    def __init__(self, music_level=1.0, voice_level=1.0, crossfade_sec=4.0, curve="equal_power", duck_level=0.35):
+        freq, size, channels = pygame.mixer.get_init()
+        if size != -16:
+            raise ValueError("MixEngine needs a 16-bit signed mixer (pygame.mixer.pre_init(..., -16, ...))")
+        fade_curves(curve, 1)   # カーブ名の確認
+        self.freq = freq
+        self.channels = channels
+        self.music_level = music_level
+        self.voice_level = voice_level
+        self.crossfade = int(crossfade_sec * freq)
+        self.curve = curve
+        self.duck_level = duck_level
+        self.duck_ramp = int(DUCK_RAMP_SEC * freq)
+        self.talk_gap = int(TALK_GAP_SEC * freq)
+        self.chunk = int(MIX_CHUNK_SEC * freq)
+        self.pieces = deque()
+        self.lock = threading.Lock()  # pieces と本体の stop を、出力側（別スレッドの場合もある）と取り合わないように
+        self.body = None        # 今の曲の本体
+        self.end = 0            # 今の曲を終える位置（曲の終わり、または MAX_PLAY_TIME）
+        self.tail = 0           # 次に積む区間が始まる通し番号（本体が無い時だけ意味を持つ）
+        self.underrun_sec = 0.0 # 渡すチャンクが間に合わずに止まっていた時間
+        self.reported_underrun = 0.0
+        self.transitions = 0
+        self.dead_air_total = 0.0
+        self.stop_task = None
+        self._open_output()
+
+    def _open_output(self): # 予約したチャンネルへ出す
+        pygame.mixer.set_reserved(MIX_CHANNEL + 1)
+        self.channel = pygame.mixer.Channel(MIX_CHANNEL)
+        self.queued = 0         # チャンネルへ渡し終えたフレーム数（通し番号）
+        self.playing = None     # 鳴っているチャンク（先頭フレーム, フレーム数, 鳴り始めた時刻）
+        self.next_up = None     # queue() 済みでまだ鳴っていないチャンク（先頭フレーム, フレーム数）
+        self.ends_at = None     # 渡し終えた分がすべて鳴り終わる見込みの時刻
+        self.task = None
+        self.kick = asyncio.Event()   # 新しい区間が積まれたら、眠っている補充タスクを起こす
+
+    # --- デコード ---
+
+    def _decode(self, path): # ミキサーの形式（16bit, freq, channels）の (フレーム数, チャンネル数) 配列
+        # get_raw() はデコードした音をもう一度 bytes へ写すので、Sound の中身をそのまま配列として見る
+        return pygame.sndarray.samples(pygame.mixer.Sound(path)).reshape(-1, self.channels)
+
+    async def decode(self, path):
+        return await asyncio.to_thread(self._decode, path)
+
+    async def _decode_voice(self, path): # 声のファイル名、またはデコード済みの配列（dj_voice_level.py で整えたもの）
+        if path is None or isinstance(path, str) and not path:
+            return None
+        if not isinstance(path, str):
+            return path
+        try:
+            return await self.decode(path)
+        except Exception as e:
+            print(f"  [System] Audio load failed: {e}. Skipping talk to maintain flow.")
+            return None
+
+    def _track_end(self, samples, max_play):
+        end = len(samples)
+        if max_play > 0:
+            end = min(end, int(max_play * self.freq))
+        return end
+
+    def _hold(self, start, end): # つなぎ目が決まるまでに、先に渡してよい位置
+        return max(start, end - self.crossfade - self.duck_ramp - self.talk_gap)
+
+    # --- 再生キュー ---
+
+    def _take(self, limit): # 次に出す区間（配列の一部, 音量）を最大 limit フレーム。出せるものが無ければ None
+        with self.lock:
+            while self.pieces:
+                p = self.pieces[0]
+                n = min(limit, p.stop - p.pos)
+                if n > 0:
+                    data = p.samples[p.pos:p.pos + n]
+                    p.pos += n
+                    return data, p.gain
+                if p is self.body:
+                    return None   # 曲の本体の残りは、つなぎ目が決まるまで出さない
+                self.pieces.popleft()
+            return None
+
+    def _next_chunk(self):
+        taken = self._take(self.chunk)
+        if taken is None:
+            return None
+        data, gain = taken
+        if gain != 1.0:
+            data = data * np.float32(gain)
+            np.clip(data, -32768, 32767, out=data)   # 1.0 を超えるゲインでも、int16 へ戻す時に折り返さないように
+            data = data.astype(np.int16)
+        return pygame.mixer.Sound(buffer=np.ascontiguousarray(data)), len(data)
+
+    def _pump(self):
+        now = time.perf_counter()
+        if not self.channel.get_busy():
+            chunk = self._next_chunk()
+            if chunk is None:
+                return
+            if self.ends_at is not None:   # 渡すチャンクが間に合わず、止まっていた
+                self.underrun_sec += max(0.0, now - self.ends_at)
+            sound, n = chunk
+            self.channel.play(sound)
+            self.playing = (self.queued, n, now)
+            self.next_up = None
+            self.queued += n
+            self.ends_at = now + n / self.freq
+        if self.channel.get_queue() is None:
+            if self.next_up is not None:   # queue() しておいたチャンクが鳴り始めた
+                start, n = self.next_up
+                _prev_start, prev_n, prev_at = self.playing
+                self.playing = (start, n, prev_at + prev_n / self.freq)
+                self.next_up = None
+            chunk = self._next_chunk()
+            if chunk is not None:
+                sound, n = chunk
+                self.channel.queue(sound)
+                self.next_up = (self.queued, n)
+                self.queued += n
+                self.ends_at += n / self.freq
+
+    def _next_wake(self): # 次に補充が必要になるまでの秒数（None なら新しい区間が積まれるまで眠る）
+        if self.ends_at is None:
+            return None
+        remaining = self.ends_at - time.perf_counter()
+        if self.next_up is not None:   # 待ち枠のチャンクが鳴り始めた直後に、その次を渡す
+            remaining -= self.next_up[1] / self.freq
+        elif remaining < 0 and not self.channel.get_busy():
+            return None                # 鳴り終えて、渡せるものも無い
+        return max(0.0, remaining) + PUMP_SLACK_SEC
+
+    async def _run(self):
+        while True:
+            self._pump()
+            self.kick.clear()
+            try:
+                await asyncio.wait_for(self.kick.wait(), self._next_wake())
+            except asyncio.TimeoutError:
+                pass
+
+    def _ensure_pump(self):
+        self.kick.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def played_frames(self): # 今どこまで鳴ったか（通し番号のフレーム）
+        if self.playing is None or not self.channel.get_busy():
+            return self.queued
+        start, n, started_at = self.playing
+        return min(start + int((time.perf_counter() - started_at) * self.freq), start + n)
+
+    def seconds_left(self): # 今の曲で、つなぎ目を組み立てずに流せる残り（秒）。これを過ぎると音が止まる
+        with self.lock:
+            body = self.body
+            if body is None:
+                return 0.0
+            hold = body.frame + body.stop - body.first
+        return max(0.0, (hold - self.played_frames()) / self.freq)
+
+    async def wait_until(self, frame): # 通し番号 frame の音が鳴るまで待つ
+        self._ensure_pump()
+        while True:
+            ahead = frame - self.played_frames()
+            if ahead <= 0:
+                return
+            await asyncio.sleep(max(ahead / self.freq, WAIT_MIN_SEC))
+
+    # --- つなぎ目 ---
+
+    def _render(self, samples, plan, voice, nxt, out_level, in_level):
+        n = plan.length
+        fade = plan.fade_at - plan.cut
+        fade_out, fade_in = fade_curves(self.curve, plan.crossfade)
+        env = np.full(n, out_level, dtype=np.float32)   # 出ていく曲の音量
+        if voice is not None:
+            ramp = plan.voice_at - plan.cut
+            env[:ramp] *= np.linspace(1.0, self.duck_level, ramp, dtype=np.float32)
+            env[ramp:] *= self.duck_level
+        env[fade:] *= fade_out
+        out = np.zeros((n, self.channels), dtype=np.float32)
+        tail = samples[plan.cut:plan.cut + n]
+        out[:len(tail)] += tail * env[:len(tail), None]
+        if voice is not None:
+            at = plan.voice_at - plan.cut
+            out[at:at + len(voice)] += voice * np.float32(self.voice_level)
+        if nxt is not None:
+            out[fade:] += nxt[:plan.crossfade] * (fade_in * np.float32(in_level))[:, None]
+        np.clip(out, -32768, 32767, out=out)
+        return out.astype(np.int16)
+
+    async def _splice(self, voice, nxt, crossfade, max_play=0, end=None, gain=1.0):
+        body = self.body
+        level = self.music_level * gain   # 次の曲の音量（トラックゲインを掛けたもの）
+        with self.lock:
+            plan = plan_transition(body.pos, self.end if end is None else end, len(voice) if voice is not None else 0,
+                                   len(nxt) if nxt is not None else 0, crossfade, self.duck_ramp, self.talk_gap)
+            body.stop = plan.cut   # 組み立てている間に、置き換える部分を渡してしまわないように先に止める
+        mix = await asyncio.to_thread(self._render, body.samples, plan, voice, nxt, body.gain, level)
+        frame = body.frame + plan.cut - body.first
+        with self.lock:
+            self.pieces.append(_Piece(mix, 0, len(mix), 1.0, frame))
+            self.tail = frame + len(mix)
+            if nxt is not None:
+                self.end = self._track_end(nxt, max_play)
+                self.body = _Piece(nxt, plan.crossfade, self._hold(plan.crossfade, self.end), level, self.tail)
+                self.pieces.append(self.body)
+            else:
+                self.body = None
+        self._ensure_pump()
+        self._report(plan, voice, mix)
+        voice_frame = frame + plan.voice_at - plan.cut if voice is not None else None
+        return Cue(voice_frame, frame + plan.fade_at - plan.cut, frame + len(mix))
+
+    def _report(self, plan, voice, mix):
+        dead = dead_air_frames(mix, self.freq) / self.freq
+        underrun = self.underrun_sec - self.reported_underrun
+        self.reported_underrun = self.underrun_sec
+        self.transitions += 1
+        self.dead_air_total += dead + underrun
+        talk = f", voice {len(voice) / self.freq:.1f}s over ducked tail" if voice is not None else ""
+        stall = f" + {underrun:.2f}s playback stall" if underrun > 0 else ""
+        print(f"   [Mix] Transition: {plan.crossfade / self.freq:.1f}s {self.curve} crossfade{talk}; "
+              f"dead air {dead:.2f}s{stall} (avg {self.dead_air_total / self.transitions:.2f}s)")
+
+    # --- 公開API ---
+
+    @property
+    def running(self):
+        return self.body is not None
+
+    async def start(self, path, max_play=0, gain=1.0): # 最初の曲を頭から流し始める（gain は曲ごとの音量補正の倍率）
+        samples = await self.decode(path)
+        with self.lock:
+            self.end = self._track_end(samples, max_play)
+            self.body = _Piece(samples, 0, self._hold(0, self.end), self.music_level * gain, self.tail)
+            self.pieces.append(self.body)
+        self._ensure_pump()
+
+    async def announce(self, path): # 音楽の無いところで声だけを流す（オープニング）。鳴り終わる通し番号を返す
+        voice = await self._decode_voice(path)
+        with self.lock:
+            if voice is not None:
+                self.pieces.append(_Piece(voice, 0, len(voice), self.voice_level, self.tail))
+                self.tail += len(voice)
+            end = self.tail
+        self._ensure_pump()
+        return end
+
+    async def transition(self, voice_path, next_path, max_play=0, gain=1.0):
+        # 声（無ければ None）と次の曲をデコードし、今の曲の終わりにつなぎ目を組み立てて積む（gain は次の曲の音量補正）
+        voice, nxt = await asyncio.gather(self._decode_voice(voice_path), self.decode(next_path))
+        return await self._splice(voice, nxt, self.crossfade, max_play, gain=gain)
+
+    async def finish(self, voice_path, fade_sec=10.0):
+        # 今すぐ音楽を下げて声を重ね、話し終えたら fade_sec かけて消す。鳴り終わるまで待つ
+        if self.body is None:   # まだ曲が始まっていない
+            await self.wait_until(await self.announce(voice_path))
+            return
+        voice = await self._decode_voice(voice_path)
+        cue = await self._splice(voice, None, int(fade_sec * self.freq), end=self.body.pos)
+        await self.wait_until(cue.end)
+
+    def stop_after(self, seconds, task): # 番組が seconds 秒ぶん流れたら task を取り消す（クロージングへ進ませる）
+        async def cancel_at(frame):
+            await self.wait_until(frame)
+            task.cancel()
+        self.stop_task = asyncio.create_task(cancel_at(int(seconds * self.freq)))
+
+    def close(self):
+        if self.stop_task is not None:
+            self.stop_task.cancel()
+        if self.task is not None:
+            self.task.cancel()
+        self.pieces.clear()
+        self.body = None
+        self.channel.stop()
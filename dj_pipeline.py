@@ -0,0 +1,209 @@
+import os
+import glob
+import time
+import asyncio
+
+# ==========================================
+# dj_pipeline.py   トークの先読みパイプライン
+# ==========================================
+# 次の曲だけでなく、その先 N 曲分まで選曲を済ませ、曲間トーク（台本 + 音声）を先に用意しておく。
+# 短い曲や MAX_PLAY_TIME での打ち切りでも、準備が間に合わずに無音になるのを防ぐ。
+# 入力（コメント）が変わったトークだけを作り直し、他の準備済みトークはそのまま使う。
+# batch_fn を渡すと、残りが少なくなった時に batch_size 件分の台本を一回のリクエストでまとめて作る。
+# コメントで作り直す時は、つなぎ目までの残り時間（time_left）に作り直しが収まらなければ、次のトークへ回す。
+# ==========================================
+
+REBUILD_DEFAULT_SEC = 30.0  # 準備時間の実績が無い時に見込む、トーク一件の作り直しにかかる時間（秒）
+REBUILD_MARGIN_SEC = 20.0   # 作り直しの見込みに足す余裕（声の長さと、つなぎ目を組み立てる分）
+
+
+class TalkSegment:
+    # 曲と曲のつなぎ目ひとつ分のトーク
+
+    def __init__(self, seq, current_id, next_id, comments, output_file):
+        self.seq = seq
+        self.current_id = current_id
+        self.next_id = next_id
+        self.comments = comments
+        self.output_file = output_file
+        self.task = None
+        self.started = time.perf_counter()
+        self.ready_at = None
+
+    def is_ready(self):
+        return self.task is not None and self.task.done()
+
+    def result(self): # 準備の結果（台本テキスト）。失敗・取り消し時はNone
+        if not self.is_ready() or self.task.cancelled() or self.task.exception():
+            return None
+        return self.task.result()
+
+    def time_to_ready(self):
+        return (self.ready_at - self.started) if self.ready_at else None
+
+
+class TalkPipeline:
+
+    def __init__(self, rotation, select_fn, info_fn, prepare_fn, depth=2, prefix="talk", batch_fn=None, batch_size=1):
+        self.rotation = rotation        # SessionRotation（先読みした曲もここで再生済み扱いにして予約する）
+        self.select_fn = select_fn      # select_next_song_weighted
+        self.info_fn = info_fn          # get_song_info
+        self.prepare_fn = prepare_fn    # prepare_next_talk
+        self.batch_fn = batch_fn        # generate_scripts_batch（[(今の曲, 次の曲), ...] -> [台本 or None, ...]）
+        self.batch_size = max(1, batch_size) if batch_fn else 1
+        # 常に depth 件は先読みしておき、まとめて生成する時はその分（batch_size - 1 件）だけ余分に持つ
+        self.depth = max(1, depth) + self.batch_size - 1
+        self.prefix = prefix
+        self.playing_id = None
+        self.segments = []
+        self.seq = 0
+        self.ready_times = []           # 各トークの準備完了までの秒数（メトリクス用）
+        self.pending_comments = ""      # 作り直しが間に合わず、まだどのトークにも入れていないコメント
+
+    # --- 内部処理 ---
+
+    def _output_file(self):
+        self.seq += 1
+        return f"{self.prefix}_{self.seq}.mp3"
+
+    def _launch(self, segment, batch=None, index=0): # 台本生成と音声合成をバックグラウンドで開始する
+        async def run():
+            try:
+                script = None
+                if batch is not None:
+                    # まとめて生成した台本を受け取る。この分が得られなかったら、個別に生成し直す
+                    # （shield：このトークだけが作り直しで取り消されても、共有のリクエストは他のトークのために続ける）
+                    try:
+                        script = (await asyncio.shield(batch))[index]
+                    except Exception as e:
+                        print(f"  [System Error] Batch script generation failed: {e}")
+                return await self.prepare_fn("talk", self.info_fn(segment.current_id), self.info_fn(segment.next_id),
+                                             segment.comments, segment.output_file, script=script, next_id=segment.next_id)
+            finally:
+                # 作り直しで取り消された古い実行の終了時刻は記録しない
+                if segment.task is asyncio.current_task():
+                    segment.ready_at = time.perf_counter()
+        segment.started = time.perf_counter()
+        segment.ready_at = None
+        segment.task = asyncio.create_task(run())
+
+    def _discard(self, segment): # 不要になったトークを止め、音声ファイルを片付ける
+        if segment.task and not segment.task.done():
+            segment.task.cancel()
+        remove_quietly(segment.output_file)
+
+    def _reserve_next(self): # 次の曲を選び、ローテーション上で予約する
+        if self.rotation.exhausted():
+            self.rotation.reset(keep=[self.playing_id] + self.upcoming_ids())
+        next_id = self.select_fn(self.rotation)
+        if next_id is not None:
+            self.rotation.mark(next_id)
+        return next_id
+
+    # --- 公開API ---
+
+    def upcoming_ids(self): # 先読み済みの曲ID（再生順）
+        return [seg.next_id for seg in self.segments]
+
+    def start(self, first_id): # 最初の曲を決めて、先読みを開始する
+        self.playing_id = first_id
+        self.rotation.mark(first_id)
+        self.fill()
+
+    def fill(self): # キューが depth に満たなければ、その先の曲を選んでトークを用意する
+        if len(self.segments) > self.depth - self.batch_size:
+            return   # まとめて生成する時は、batch_size 件分の空きができるまで待つ
+        added = []
+        while len(self.segments) < self.depth:
+            current_id = self.segments[-1].next_id if self.segments else self.playing_id
+            next_id = self._reserve_next()
+            if next_id is None:
+                break
+            segment = TalkSegment(self.seq, current_id, next_id, self.pending_comments, self._output_file())
+            self.pending_comments = ""
+            self.segments.append(segment)
+            added.append(segment)
+        if not added:
+            return
+        batch = None
+        if len(added) > 1 and self.batch_fn is not None:
+            pairs = [(self.info_fn(seg.current_id), self.info_fn(seg.next_id)) for seg in added]
+            batch = asyncio.ensure_future(self.batch_fn(pairs))
+        for index, segment in enumerate(added):
+            self._launch(segment, batch, index)
+
+    def _rebuild(self, segment, comments): # コメントを加えてトークを作り直す
+        self._discard(segment)
+        segment.comments = f"{segment.comments}\n{comments}".strip() if segment.comments else comments
+        segment.output_file = self._output_file()
+        self._launch(segment)
+
+    def rebuild_estimate(self): # トーク一件を作り直すのにかかる見込み（秒）
+        if not self.ready_times:
+            return REBUILD_DEFAULT_SEC
+        return max(self.ready_times[-1], sum(self.ready_times) / len(self.ready_times))
+
+    def update_comments(self, comments, time_left=None):
+        # 新しいコメントが届いたら、次のつなぎ目のトークだけを作り直す
+        # time_left（次のつなぎ目までの秒数）に作り直しが収まらなければ、今のトークはそのまま使い、その次のトークへ回す
+        if not comments:
+            return
+        if time_left is not None and time_left < self.rebuild_estimate() + REBUILD_MARGIN_SEC:
+            print(f"  [System] Not enough time to rebuild the next talk ({time_left:.0f}s left). "
+                  f"Carrying comments over to the following talk.")
+            if len(self.segments) > 1:
+                self._rebuild(self.segments[1], comments)
+            else:
+                self.pending_comments = f"{self.pending_comments}\n{comments}".strip()
+            return
+        if not self.segments:
+            self.pending_comments = f"{self.pending_comments}\n{comments}".strip()
+            return
+        self._rebuild(self.segments[0], comments)
+
+    async def pop_ready(self): # 次のつなぎ目のトークが仕上がるのを待って取り出す
+        if not self.segments:
+            self.fill()
+            if not self.segments:
+                return None
+        head = self.segments.pop(0)
+        # asyncio.wait は準備の失敗・取り消しを送出しない（番組自体の取り消しだけがここから伝わる）
+        await asyncio.wait({head.task})
+        if head.task.cancelled():
+            print("  [System] Talk preparation was cancelled. Preparing it again...")
+            self._launch(head)
+            await asyncio.wait({head.task})
+        if not head.task.cancelled() and head.task.exception() is not None:
+            print(f"  [System Error] Talk preparation failed: {head.task.exception()}")
+        if head.time_to_ready() is not None:
+            self.ready_times.append(head.time_to_ready())
+        self.playing_id = head.next_id
+        self.fill()
+        return head
+
+    def metrics(self): # キューの深さと準備時間
+        ready = sum(1 for seg in self.segments if seg.is_ready())
+        last = self.ready_times[-1] if self.ready_times else None
+        avg = sum(self.ready_times) / len(self.ready_times) if self.ready_times else None
+        return {'depth': self.depth, 'queued': len(self.segments), 'ready': ready,
+                'last_time_to_ready': last, 'avg_time_to_ready': avg}
+
+    def report(self):
+        m = self.metrics()
+        last = f"{m['last_time_to_ready']:.1f}s" if m['last_time_to_ready'] is not None else "-"
+        avg = f"{m['avg_time_to_ready']:.1f}s" if m['avg_time_to_ready'] is not None else "-"
+        print(f"   [Pipeline] Talk queue: {m['ready']}/{m['queued']} ready (depth {m['depth']}), "
+              f"time-to-ready last {last} / avg {avg}")
+
+    def close(self): # 終了時の後片付け（取り消し後に書き出された音声ファイルも含めて消す）
+        for seg in self.segments:
+            self._discard(seg)
+        self.segments.clear()
+        for path in glob.glob(f"{self.prefix}_*.mp3"):
+            remove_quietly(path)
+
+
+def remove_quietly(path):
+    if path and os.path.exists(path):
+        try: os.remove(path)
+        except OSError: pass
@@ -0,0 +1,135 @@
+import os
+import csv
+import math
+import time
+import threading
+
+from dj_catalog import parse_last_played
+
+# ==========================================
+# dj_playlog.py   再生ログ（先行書き込みログ）
+# ==========================================
+# 曲を流すたびに「id,last_played」の一行だけを play_log.csv へ追記する。
+# 放送中に落ちても履歴は残り、次回の load_song_database() で読み直して反映する。
+# musicdata.csv への書き戻しは、一時ファイルへ書いてから置き換える（途中で落ちても壊れない）。
+# ==========================================
+
+PLAY_LOG_PATH = "play_log.csv"   # 再生ログの保存先
+FSYNC_BATCH = 4                  # この件数たまったらディスクへ同期する
+FSYNC_INTERVAL_SEC = 60.0        # 最後の同期からこの秒数が経っていたら、件数に関係なく同期する
+COMPACT_EVERY = 20               # この件数の再生ごとに musicdata.csv へ書き戻す
+
+
+def read_play_log(path=PLAY_LOG_PATH): # {曲ID: 最後に流した時刻(ISO)} を返す（後の行ほど新しい）
+    latest = {}
+    if not os.path.exists(path):
+        return latest
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            # 一行は改行まで一度に書くので、改行で終わっていない行は書きかけとして捨てる
+            for row in csv.reader(line for line in f if line.endswith("\n")):
+                # 列が足りない・時刻として読めない行も捨てる
+                if len(row) < 2 or math.isnan(parse_last_played(row[1])):
+                    continue
+                try:
+                    latest[int(row[0])] = row[1]
+                except ValueError:
+                    continue
+    except Exception as e:
+        print(f"   [Warning] Play log replay failed: {e}")
+    return latest
+
+
+def compact_csv(csv_path, last_played): # 既存の列はそのままに last_played だけを差し替え、原子的に置き換える
+    tmp = csv_path + ".tmp"
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as src, \
+         open(tmp, "w", encoding="utf-8-sig", newline="") as dst:
+        reader = csv.DictReader(src)
+        writer = csv.DictWriter(dst, fieldnames=reader.fieldnames, lineterminator="\n")
+        writer.writeheader()
+        for row in reader:
+            try:
+                sid = int(row['id'])
+            except (KeyError, TypeError, ValueError):
+                sid = None
+            if sid in last_played:
+                row['last_played'] = last_played[sid]
+            writer.writerow(row)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp, csv_path)
+
+
+class PlayLog:
+
+    def __init__(self, path=PLAY_LOG_PATH, fsync_batch=FSYNC_BATCH, fsync_interval=FSYNC_INTERVAL_SEC):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        self._drop_partial_line()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.since_compact = 0
+        self.compact_enabled = True
+
+    def _drop_partial_line(self): # 前回落ちた時の書きかけの行があれば切り捨てる（次の追記がその行につながらないように）
+        size = self.f.tell()
+        if size == 0:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(max(0, size - 4096))
+            tail = f.read()
+        if tail.endswith(b"\n"):
+            return
+        cut = tail.rfind(b"\n")
+        keep = size - len(tail) + cut + 1 if cut >= 0 else (0 if size <= 4096 else size)
+        self.f.truncate(keep)
+        self.f.seek(keep)
+
+    def append(self, song_id, played_at): # 一行追記。プロセスが落ちても残るよう毎回 flush し、fsync はまとめて行う
+        with self.lock:
+            self.f.write(f"{song_id},{played_at}\n")
+            self.f.flush()
+            self.unsynced += 1
+            self.since_compact += 1
+            if self.unsynced >= self.fsync_batch or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.f.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def needs_compaction(self, every=COMPACT_EVERY):
+        return self.compact_enabled and self.since_compact >= every
+
+    def disable_compaction(self): # 書き戻し先（musicdata.csv）が無い時は、以後 needs_compaction() を偽にする
+        self.compact_enabled = False
+
+    def position(self): # 書き戻しに含めた位置（この位置までのログは書き戻し後に捨ててよい）
+        with self.lock:
+            return self.f.tell()
+
+    def discard_through(self, pos): # 書き戻し済みの部分を捨て、それ以降に追記された行だけを残す
+        with self.lock:
+            self.f.close()
+            with open(self.path, "r", encoding="utf-8", newline="") as f:
+                f.seek(pos)
+                rest = f.read()
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(rest)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.f = open(self.path, "a", encoding="utf-8", newline="")
+            self.unsynced = 0
+            self.since_compact = rest.count("\n")
+
+    def close(self):
+        with self.lock:
+            if not self.f.closed:
+                self._sync()
+                self.f.close()
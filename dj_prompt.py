@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import hashlib
+from string import Formatter
+
+from dj_lazy import lazy_import
+
+types = lazy_import("google.genai.types")
+
+# ==========================================
+# dj_prompt.py   ペルソナとプロンプトのテンプレート
+# ==========================================
+# persona.txt と指示文のテンプレートは一度だけ読み込み、ファイルの更新時刻（mtime）が変わった時だけ読み直す。
+# テンプレートは読み込み時に「固定の文字列」と「差し込み口（曲名・コメント・時刻など）」に分解しておき、
+# 呼び出しごとには差し込み口を埋めて連結するだけにする。
+# SPEAK_LANG のように放送中に変わらない定数は、分解の時点で埋め込んでしまう。
+# ペルソナは埋め込まず、呼び出しごとに {persona} の差し込み口へ渡す（キャッシュを使う時は空にするため）。
+#
+# オプションで、ペルソナ部分を Gemini のコンテキストキャッシュに置き、毎回の入力トークンを減らせる。
+# generate_batch() は先読みした複数のつなぎ目の台本を、JSON形式の一回のリクエストでまとめて生成する。
+# UsageMeter は一回ずつの生成とまとめての生成それぞれの、リクエスト数とトークン数を記録する。
+# ==========================================
+
+RELOAD_CHECK_SEC = 2.0          # ファイルの更新確認の間隔（秒）
+CONTEXT_CACHE_TTL_SEC = 3600    # コンテキストキャッシュの有効期間（秒）
+CONTEXT_CACHE_RETRY_SEC = 600   # キャッシュを作れなかった時に、次に試すまでの間隔（秒）
+USAGE_REPORT_EVERY = 10         # この回数のリクエストごとに使用量を表示する
+
+
+class CompiledTemplate:
+    # str.format と同じ書式のテンプレートを、固定部分と差し込み口の列に分解して持つ
+
+    def __init__(self, text, **constants):
+        self.parts = []   # (固定の文字列, 差し込み口の名前, 書式指定)
+        pending = ""
+        for literal, field, spec, conversion in Formatter().parse(text):
+            pending += literal
+            if field is None:
+                continue
+            if field in constants:
+                pending += format(constants[field], spec or "")
+                continue
+            self.parts.append((pending, field, spec or ""))
+            pending = ""
+        self.tail = pending
+        self.fields = {field for _literal, field, _spec in self.parts}
+
+    def render(self, **slots):
+        out = []
+        for literal, field, spec in self.parts:
+            out.append(literal)
+            out.append(format(slots.get(field, ""), spec))
+        out.append(self.tail)
+        return "".join(out)
+
+
+class PromptBook:
+
+    def __init__(self, templates, persona_path="persona.txt", default_persona="",
+                 templates_path=None, constants=None):
+        self.defaults = dict(templates)         # スクリプトに書かれた既定のテンプレート
+        self.persona_path = persona_path
+        self.default_persona = default_persona
+        self.templates_path = templates_path    # 指定があれば、このJSONのキーで既定を上書きする
+        self.constants = dict(constants or {})
+        self.persona_text = None
+        self.compiled = {}
+        self.mtimes = None
+        self.checked_at = 0.0
+        self.reloads = 0
+
+    # --- 読み込み ---
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path) if path else None
+        except OSError:
+            return None
+
+    def _refresh(self): # 一定間隔でファイルの更新時刻を確かめ、変わっていれば読み直す
+        now = time.monotonic()
+        if self.mtimes is not None and now - self.checked_at < RELOAD_CHECK_SEC:
+            return
+        self.checked_at = now
+        mtimes = (self._mtime(self.persona_path), self._mtime(self.templates_path))
+        if mtimes == self.mtimes:
+            return
+        self.mtimes = mtimes
+        self._load()
+
+    def _load(self):
+        persona = self.default_persona
+        if self.mtimes[0] is not None:
+            with open(self.persona_path, "r", encoding="utf-8") as f:
+                persona = f.read().strip()
+        templates = dict(self.defaults)
+        if self.mtimes[1] is not None:
+            try:
+                with open(self.templates_path, "r", encoding="utf-8") as f:
+                    templates.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"   [Warning] Prompt template load failed: {e}")
+        self.persona_text = persona
+        self.compiled = {name: CompiledTemplate(text, **self.constants) for name, text in templates.items()}
+        if self.reloads:
+            print("   [System] Persona / prompt templates reloaded.")
+        self.reloads += 1
+
+    # --- 公開API ---
+
+    def persona(self):
+        self._refresh()
+        return self.persona_text
+
+    def render(self, name, **slots):
+        self._refresh()
+        return self.compiled[name].render(**slots)
+
+    def frame(self, with_persona=True, **slots): # プロンプト全体（"frame" テンプレート）を組み立てる
+        self._refresh()
+        text = self.compiled["frame"].render(persona=self.persona_text if with_persona else "", **slots)
+        return text if with_persona else text.lstrip("\n")
+
+
+class PersonaContextCache:
+    # ペルソナ（プロンプト先頭の固定部分）を Gemini のコンテキストキャッシュに置く。
+    # ペルソナが変わったら作り直す。作れなかった場合（短すぎる・非対応のモデルなど）はしばらく通常の呼び出しに戻す
+
+    def __init__(self, ttl_sec=CONTEXT_CACHE_TTL_SEC):
+        self.ttl_sec = ttl_sec
+        self.name = None
+        self.key = None
+        self.expires_at = 0.0
+        self.retry_at = 0.0
+
+    async def get(self, client, model, persona):
+        key = hashlib.sha256(f"{model}\n{persona}".encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        if self.name and self.key == key and now < self.expires_at - 60:
+            return self.name
+        if now < self.retry_at:
+            return None
+        try:
+            cache = await client.aio.caches.create(model=model, config=types.CreateCachedContentConfig(
+                system_instruction=persona, display_name="dj-persona", ttl=f"{self.ttl_sec}s"))
+        except Exception as e:
+            print(f"   [Warning] Context cache unavailable, sending the full prompt: {e}")
+            self.retry_at = now + CONTEXT_CACHE_RETRY_SEC
+            return None
+        if self.name:
+            try: await client.aio.caches.delete(name=self.name)
+            except Exception: pass
+        self.name, self.key, self.expires_at = cache.name, key, now + self.ttl_sec
+        return self.name
+
+
+class UsageMeter:
+    # LLMへのリクエスト数とトークン数を、一回ずつ（single）とまとめて（batch）に分けて数える
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stats = {kind: {'requests': 0, 'segments': 0, 'tokens': 0} for kind in ("single", "batch")}
+
+    def record(self, kind, response, segments=1):
+        usage = getattr(response, "usage_metadata", None)
+        entry = self.stats[kind]
+        entry['requests'] += 1
+        entry['segments'] += segments
+        entry['tokens'] += (getattr(usage, "total_token_count", None) or 0) if usage else 0
+        if sum(e['requests'] for e in self.stats.values()) % USAGE_REPORT_EVERY == 0:
+            self.report()
+
+    def report(self):
+        hours = max((time.monotonic() - self.started) / 3600.0, 1e-9)
+        parts = []
+        for kind, e in self.stats.items():
+            if not e['requests']:
+                continue
+            per_segment = e['tokens'] / e['segments'] if e['segments'] else 0
+            parts.append(f"{kind}: {e['requests']} req for {e['segments']} talks "
+                         f"({e['requests'] / hours:.1f} req/h, ~{per_segment:.0f} tokens/talk)")
+        if not parts:
+            return
+        batch = self.stats['batch']
+        saved = batch['segments'] - batch['requests']
+        print(f"   [LLM] {'; '.join(parts)}; batching saved {saved} requests")
+
+
+async def _generate(client, model, book, context_cache, config=None, **slots):
+    # frame テンプレートを組み立てて生成する。context_cache があれば、ペルソナ部分はキャッシュを参照させる
+    config = dict(config or {})
+    contents = None
+    if context_cache is not None:
+        name = await context_cache.get(client, model, book.persona())
+        if name:
+            config['cached_content'] = name
+            contents = book.frame(with_persona=False, **slots)
+    if contents is None:
+        contents = book.frame(**slots)
+    return await client.aio.models.generate_content(
+        model=model, contents=contents, config=types.GenerateContentConfig(**config) if config else None)
+
+
+async def generate_text(client, model, book, context_cache=None, meter=None, **slots):
+    response = await _generate(client, model, book, context_cache, **slots)
+    if meter is not None:
+        meter.record("single", response)
+    return response.text.strip()
+
+
+def parse_batch(text, count): # JSONの応答を count 件の台本へ。読めなかった分は None（その分だけ個別に生成し直す）
+    scripts = [None] * count
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return scripts
+    if isinstance(data, dict):
+        data = data.get("scripts", [])
+    if not isinstance(data, list):
+        return scripts
+    for n, item in enumerate(data):
+        index, script = n + 1, item
+        if isinstance(item, dict):
+            index, script = item.get("index", n + 1), item.get("script")
+        if isinstance(index, int) and 1 <= index <= count and isinstance(script, str) and script.strip():
+            scripts[index - 1] = script.strip()
+    return scripts
+
+
+async def generate_batch(client, model, book, count, context_cache=None, meter=None, **slots):
+    # count 件の台本を一回のリクエストで生成する（応答はJSON配列で受け取る）
+    response = await _generate(client, model, book, context_cache,
+                               config={'response_mime_type': "application/json"}, **slots)
+    scripts = parse_batch(response.text, count)
+    if meter is not None:
+        meter.record("batch", response, segments=sum(1 for s in scripts if s))
+    return scripts
@@ -0,0 +1,206 @@
+import random
+
+from dj_lazy import lazy_import
+from dj_catalog import SongCatalog, parse_last_played
+
+np = lazy_import("numpy")
+
+# ==========================================
+# dj_selector.py   選曲エンジン（ベクトル化版）
+# ==========================================
+# play_flag / time_scale / last_played（エポック秒）を NumPy 配列で保持し、
+# 全曲の重みを一度の式で計算する。抽選は累積和 + searchsorted で O(log n)。
+# TIME-SYNC では time_scale の昇順索引から目標スケール前後の曲だけを切り出して重みを計算する。
+# 重みの式は従来の select_next_song_weighted と同一なので、選ばれ方の分布は変わらない。
+# 全曲を対象に抽選する時（RANDOM モード・範囲内に候補がない時）は、候補を従来と同じライブラリの並びで数えるので、
+# 同じ乱数の種なら従来と同じ曲が選ばれる。範囲索引を使う時は time_scale の並びで数えるため、選ばれる曲そのものは変わる。
+# 放送中に流した曲は SessionRotation が管理し、候補リストを毎回作り直さずに済ませる。
+# ==========================================
+
+NEVER_PLAYED_DIFF = 86400.0   # 再生履歴がない曲の経過秒数として扱う値
+FAR_PENALTY = 0.000001        # 目標スケールから3.0以上離れた曲への減衰
+FAR_DISTANCE = 3.0
+
+
+class SelectionEngine:
+
+    def __init__(self, song_db, boost_2=3.0):
+        self.boost_2 = boost_2
+        if isinstance(song_db, SongCatalog):
+            self._attach(song_db)
+        else:
+            self._build(song_db)
+        # play_flag に応じた倍率はスケールに依存しないので先に計算しておく
+        self.p_logic = np.where(self.play_flag == 2, boost_2, 1.0)
+        # 時間帯スケールの索引：time_scale の昇順に並べ替えた列を別に持ち、目標スケール前後の範囲を二分探索で切り出す。
+        # 範囲が連続したスライスになるので、重みの計算は配列のコピーなしで済む
+        self.scale_order = np.argsort(self.time_scale, kind='stable')
+        self.scale_rank = np.empty_like(self.scale_order)
+        self.scale_rank[self.scale_order] = np.arange(len(self.scale_order))
+        self.sorted_scale = self.time_scale[self.scale_order]
+        self.sorted_p_logic = np.where(self.play_flag[self.scale_order] != 0, self.p_logic[self.scale_order], 0.0)
+        self.sorted_last_played = self.last_played[self.scale_order]
+
+    def _attach(self, catalog): # SongCatalog の配列をコピーせずに参照する（再生時刻の更新も共有される）
+        self.ids = np.frombuffer(catalog.ids, dtype=np.int64)
+        self.pos = catalog.pos
+        self.play_flag = np.frombuffer(catalog.play_flag, dtype=np.int8)
+        self.time_scale = np.frombuffer(catalog.time_scale, dtype=np.float64)
+        self.last_played = np.frombuffer(catalog.last_played, dtype=np.float64)
+
+    def _build(self, song_db): # 辞書形式の曲データから配列を作る
+        self.ids = np.array(sorted(song_db), dtype=np.int64)
+        self.pos = {int(sid): i for i, sid in enumerate(self.ids)}
+        self.play_flag = np.array([song_db[sid].get('play_flag', 0) for sid in self.ids], dtype=np.int8)
+        self.time_scale = np.array([song_db[sid].get('time_scale', 5.0) for sid in self.ids], dtype=np.float64)
+        self.last_played = np.array([parse_last_played(song_db[sid].get('last_played', '')) for sid in self.ids],
+                                    dtype=np.float64)
+
+    def mark_played(self, song_id, timestamp): # 再生時刻の更新
+        i = self.pos.get(song_id)
+        if i is not None:
+            self.last_played[i] = timestamp
+            self.sorted_last_played[self.scale_rank[i]] = timestamp
+
+    def mask_for(self, available_ids): # 候補IDの集合を配列上のマスクへ変換する
+        mask = np.zeros(len(self.ids), dtype=bool)
+        idx = [self.pos[sid] for sid in available_ids if sid in self.pos]
+        mask[idx] = True
+        return mask
+
+    def weights(self, t_target, now_ts, random_mode=False): # 全曲分の重みを一括計算
+        time_diff = now_ts - self.last_played
+        time_diff = np.where(np.isnan(time_diff), NEVER_PLAYED_DIFF, time_diff)
+        if random_mode:
+            return self.p_logic * time_diff
+        dist = np.abs(t_target - self.time_scale)
+        w = (self.p_logic / ((dist + 1.0) ** 2)) * time_diff
+        return np.where(dist > FAR_DISTANCE, w * FAR_PENALTY, w)
+
+    def window(self, t_target, radius=FAR_DISTANCE): # 目標スケールから radius 以内の範囲（並べ替えた列の上での slice）
+        lo = int(np.searchsorted(self.sorted_scale, t_target - radius, side='left'))
+        hi = int(np.searchsorted(self.sorted_scale, t_target + radius, side='right'))
+        return slice(lo, hi)
+
+    def window_weights(self, span, t_target, now_ts): # 範囲内の曲だけ重みを計算する（範囲内なので減衰はかからない。play_flag=0 は0）
+        w = now_ts - self.sorted_last_played[span]
+        np.nan_to_num(w, copy=False, nan=NEVER_PLAYED_DIFF)
+        dist = t_target - self.sorted_scale[span]
+        np.abs(dist, out=dist)
+        dist += 1.0
+        np.square(dist, out=dist)
+        w *= self.sorted_p_logic[span]
+        w /= dist
+        return w
+
+    def sample(self, weights, candidates): # 累積和 + searchsorted による抽選（random.choices と同じ二分探索）
+        # candidates は配列上の位置を抽選の並び順に並べたもの
+        cand = candidates[self.play_flag[candidates] != 0]
+        if len(cand) == 0:
+            return None
+        cum = np.cumsum(weights[cand])
+        total = cum[-1]
+        if not total > 0:
+            return int(self.ids[cand[random.randrange(len(cand))]])
+        k = int(np.searchsorted(cum, random.random() * total, side='right'))
+        return int(self.ids[cand[min(k, len(cand) - 1)]])
+
+    def select(self, rotation, t_target, now_ts, random_mode=False, use_index=True): # ローテーション上の未再生曲から選ぶ
+        chosen = None
+        if use_index and not random_mode:
+            # 目標スケールの前後 FAR_DISTANCE の範囲だけを見る。
+            # 範囲外の曲は重みが FAR_PENALTY 倍（実質ゼロ）なので、範囲内に候補がある限り計算しない
+            span = self.window(t_target)
+            w = self.window_weights(span, t_target, now_ts)
+            w *= rotation.remaining_in(span)
+            cum = np.cumsum(w, out=w)
+            if len(cum) and cum[-1] > 0:
+                k = int(np.searchsorted(cum, random.random() * cum[-1], side='right'))
+                chosen = int(self.ids[self.scale_order[span.start + min(k, len(cum) - 1)]])
+        if chosen is None:
+            # 範囲内に候補がなければ全曲を対象にする
+            chosen = self.sample(self.weights(t_target, now_ts, random_mode), rotation.remaining_index())
+        if chosen is None:
+            # 重み付け選曲ができない場合はランダム選曲
+            remaining = rotation.remaining_ids()
+            return random.choice(remaining) if remaining else None
+        return chosen
+
+
+class SessionRotation:
+    # 一回の放送で流した曲を記録する。
+    # 世代番号方式のビットマップなので、記録・取り消しは O(1)、全曲を流し終えた時のリセットも O(1)。
+    # （played_gen[i] == gen の曲が「今の周回で再生済み」）
+
+    def __init__(self, available_ids, engine):
+        self.engine = engine
+        self.available_ids = list(available_ids)
+        self.gen = 1
+        self.played_count = 0
+        # エンジンの配列と同じ並びの世代番号。ライブラリにない曲は常に対象外
+        self.in_library = engine.mask_for(self.available_ids)
+        # ライブラリの並びでの配列上の位置（全曲から抽選する時に、従来の候補リストと同じ順に数えるため）
+        self.library_order = np.array([engine.pos[sid] for sid in self.available_ids if sid in engine.pos], dtype=np.int64)
+        self.played_gen = np.zeros(len(engine.ids), dtype=np.int64)
+        # 同じ内容を時間帯スケール索引の並びでも持つ（範囲の切り出しをスライスで済ませるため）
+        self.sorted_in_library = self.in_library[engine.scale_order]
+        self.sorted_gen = np.zeros(len(engine.ids), dtype=np.int64)
+        # CSVに載っていない曲はエンジンの配列外なので辞書で持つ
+        self.extra_gen = {sid: 0 for sid in self.available_ids if sid not in engine.pos}
+        self.last_played = None
+
+    def __len__(self):
+        return len(self.available_ids)
+
+    def is_played(self, song_id):
+        i = self.engine.pos.get(song_id)
+        if i is not None and self.in_library[i]:
+            return self.played_gen[i] == self.gen
+        return self.extra_gen.get(song_id) == self.gen
+
+    def is_remaining(self, song_id): # ライブラリにあり、今の周回でまだ流していないか
+        i = self.engine.pos.get(song_id)
+        if i is not None and self.in_library[i]:
+            return self.played_gen[i] != self.gen
+        return song_id in self.extra_gen and self.extra_gen[song_id] != self.gen
+
+    def _set_gen(self, song_id, value):
+        i = self.engine.pos.get(song_id)
+        if i is not None and self.in_library[i]:
+            self.played_gen[i] = value
+            self.sorted_gen[self.engine.scale_rank[i]] = value
+        elif song_id in self.extra_gen:
+            self.extra_gen[song_id] = value
+        else:
+            return False
+        return True
+
+    def mark(self, song_id): # 再生済みにする
+        if not self.is_played(song_id) and self._set_gen(song_id, self.gen):
+            self.played_count += 1
+        self.last_played = song_id
+
+    def unmark(self, song_id): # 再生済みを取り消す
+        if self.is_played(song_id) and self._set_gen(song_id, 0):
+            self.played_count -= 1
+
+    def exhausted(self): # 全曲を流し尽くしたか
+        return self.played_count >= len(self.available_ids)
+
+    def reset(self, keep=()): # 記憶をリセットする。最後に流した曲（と先読みで予約済みの曲）は続けて選ばれないよう残しておく
+        last = self.last_played
+        self.gen += 1
+        self.played_count = 0
+        for song_id in keep:
+            self.mark(song_id)
+        if last is not None:
+            self.mark(last)
+
+    def remaining_index(self): # 未再生の曲の、エンジンの配列上の位置（ライブラリの並び）
+        return self.library_order[self.played_gen[self.library_order] != self.gen]
+
+    def remaining_in(self, span): # エンジンの時間帯スケール索引の範囲（slice）について、未再生マスクを返す
+        return self.sorted_in_library[span] & (self.sorted_gen[span] != self.gen)
+
+    def remaining_ids(self): # 未再生のIDを列挙（重み付けできない時のフォールバック用）
+        return [sid for sid in self.available_ids if not self.is_played(sid)]
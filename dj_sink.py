@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import struct
+import asyncio
+import threading
+
+from dj_lazy import lazy_import
+from dj_mixer import MixEngine
+
+np = lazy_import("numpy")
+
+# ==========================================
+# dj_sink.py   ヘッドレス出力（PCMストリーム）
+# ==========================================
+# サウンドデバイス（pygame のチャンネル）で鳴らす代わりに、曲と声をミックスした途切れのない16bit PCMを
+# パイプ・ファイル・FIFOへ書き出す。サウンドカードもデスクトップも無いサーバーで番組を回し、
+# 例えば標準出力を ffmpeg に渡して配信用にエンコードできる。
+#   python ai_dj_en_edge.py | ffmpeg -f s16le -ar 44100 -ac 2 -i - -c:a aac -f flv rtmp://...
+#   - 書き出しは専用スレッドで行う。ブロックは起動時に確保したものを使い回し、memoryview のままOSへ渡す
+#   - realtime=True なら実時間のペースで書き、トークの準備が間に合わない時は無音で埋めて流し続ける
+#   - realtime=False なら待たずに書けるだけ書く（1時間分を WAV にレンダリングして確かめる用途）
+# 出力先の名前が .wav で終わる時だけ WAV ヘッダーをつける。それ以外は生のPCM（s16le）。
+# ==========================================
+
+SINK_BLOCK_SEC = 0.1        # 一度に書き出す長さ（秒）
+SINK_LEAD_SEC = 0.5         # realtime のとき、実時間よりどこまで先に書いてよいか（秒）
+SINK_PROGRESS_SEC = 600     # この長さの番組を書き出すごとに進み具合を表示する（秒）
+WAV_STREAM_SIZE = 0xFFFFFFFF - 36   # 長さが分からないWAV（パイプ・FIFO）のヘッダーに書く値
+
+_stdout_fd = None   # claim_stdout() で取り分けた、PCM専用の標準出力
+
+
+def claim_stdout(): # 標準出力をPCM専用にする。以後の print() の表示（pygame の起動メッセージも含む）は標準エラーへ回る
+    global _stdout_fd
+    if _stdout_fd is None:
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        sys.stdout.flush()
+        _stdout_fd = os.dup(1)
+        os.dup2(2, 1)
+    return _stdout_fd
+
+
+class PCMSink:
+
+    def __init__(self, target, freq, channels):
+        self.target = target
+        self.freq = freq
+        self.channels = channels
+        self.wav = target.lower().endswith(".wav")
+        self.written = 0        # 書き出したPCMのバイト数（ヘッダーを除く）
+        if target == "-":
+            self.fd = claim_stdout()
+        else:
+            # FIFO の場合、読み手（ffmpeg など）がつながるまでここで待つ
+            self.fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+        self.seekable = target != "-" and os.path.isfile(target)
+        if self.wav:
+            self._write_all(memoryview(self._wav_header(WAV_STREAM_SIZE)))
+
+    def _wav_header(self, data_bytes):
+        block_align = self.channels * 2
+        return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_bytes, b"WAVE", b"fmt ", 16, 1,
+                           self.channels, self.freq, self.freq * block_align, block_align, 16,
+                           b"data", data_bytes)
+
+    def _write_all(self, view): # パイプでは一度に一部しか書けないことがあるので、残りを書き続ける
+        while len(view):
+            n = os.write(self.fd, view)
+            view = view[n:]
+
+    def write(self, view): # memoryview をコピーせずにそのまま書く
+        self._write_all(view)
+        self.written += len(view)
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            if self.wav and self.seekable:   # ファイルなら、確定した長さをヘッダーへ書き戻す
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                self._write_all(memoryview(self._wav_header(min(self.written, WAV_STREAM_SIZE))))
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+
+class StreamMixEngine(MixEngine):
+    # MixEngine の出力先を、チャンネルの代わりに PCMSink にしたもの。つなぎ目の組み立て方は同じ
+
+    def __init__(self, target, realtime=True, *args, **kwargs):
+        self.target = target
+        self.realtime = realtime
+        super().__init__(*args, **kwargs)
+
+    def _open_output(self):
+        self.sink = PCMSink(self.target, self.freq, self.channels)
+        self.block = int(SINK_BLOCK_SEC * self.freq)
+        self.buffer = np.zeros((self.block, self.channels), dtype=np.int16)   # 使い回す書き出しブロック
+        self.view = memoryview(self.buffer).cast("B")
+        self.bytes_per_frame = self.channels * 2
+        self.program = 0        # 書き出した番組のフレーム数（通し番号。穴埋めの無音は数えない）
+        self.cond = threading.Condition(self.lock)
+        self.version = 0        # 区間が積まれるたびに増える（待つ直前に積まれた分を取りこぼさないため）
+        self.waiters = []       # (通し番号, Future, イベントループ)
+        self.error = None
+        self.closed = False
+        self.thread = None
+        print(f"   [Sink] Writing {self.freq} Hz / {self.channels} ch / 16-bit PCM to "
+              f"{'stdout' if self.target == '-' else self.target}{' (realtime)' if self.realtime else ''}")
+
+    # --- 書き出しスレッド ---
+
+    def _fill(self): # ブロックを番組の音で埋め、埋めたフレーム数を返す
+        filled = 0
+        while filled < self.block:
+            taken = self._take(self.block - filled)
+            if taken is None:
+                break
+            data, gain = taken
+            out = self.buffer[filled:filled + len(data)]
+            if gain > 1.0:   # 振り切れる分は、int16 へ戻す前に切り詰める（折り返さないように）
+                out[...] = np.clip(data * np.float32(gain), -32768, 32767)
+            elif gain != 1.0:
+                np.multiply(data, np.float32(gain), out=out, casting="unsafe")
+            else:
+                out[...] = data
+            filled += len(data)
+        return filled
+
+    def _writer(self):
+        started = time.perf_counter()
+        sent = 0                # 無音も含めて書き出したフレーム数（実時間ペースの基準）
+        next_progress = SINK_PROGRESS_SEC * self.freq
+        try:
+            while True:
+                version = self.version
+                filled = self._fill()
+                if filled == 0:
+                    with self.cond:
+                        if self.closed:
+                            return
+                        if not self.realtime:
+                            if version == self.version:
+                                self.cond.wait()   # 番組の続きが積まれるまで待つ
+                            continue
+                    # 実時間で流しているので、止めずに無音で埋める（番組が始まってからの分はデッドエアとして数える）
+                    self.buffer[:] = 0
+                    filled = self.block
+                    if self.program:
+                        self.underrun_sec += filled / self.freq
+                else:
+                    self.program += filled
+                self.sink.write(self.view[:filled * self.bytes_per_frame])
+                sent += filled
+                self._wake_waiters()
+                if self.program >= next_progress:
+                    minutes = self.program / self.freq / 60
+                    print(f"   [Sink] {minutes:.0f} min of program written "
+                          f"({minutes * 60 / (time.perf_counter() - started):.1f}x realtime)")
+                    next_progress += SINK_PROGRESS_SEC * self.freq
+                if self.realtime:
+                    ahead = started + sent / self.freq - SINK_LEAD_SEC - time.perf_counter()
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except Exception as e:
+            print(f"   [Sink] Output stopped: {e}")
+            self.error = e
+            self._wake_waiters()
+
+    def _wake_waiters(self):
+        with self.lock:
+            ready = [w for w in self.waiters if w[0] <= self.program or self.error]
+            if not ready:
+                return
+            self.waiters = [w for w in self.waiters if w not in ready]
+        for _frame, future, loop in ready:
+            loop.call_soon_threadsafe(self._resolve, future)
+
+    def _resolve(self, future):
+        if future.done():
+            return
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(True)
+
+    # --- MixEngine の出力部分の差し替え ---
+
+    def _ensure_pump(self):
+        with self.cond:
+            self.version += 1
+            self.cond.notify()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._writer, name="pcm-sink", daemon=True)
+            self.thread.start()
+
+    def played_frames(self):
+        return self.program
+
+    async def wait_until(self, frame): # 通し番号 frame まで書き出されるまで待つ
+        self._ensure_pump()
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+            if self.program >= frame:
+                return
+            future = loop.create_future()
+            self.waiters.append((frame, future, loop))
+        await future
+
+    def close(self):
+        if self.stop_task is not None:
+            self.stop_task.cancel()
+        with self.cond:
+            self.closed = True
+            self.pieces.clear()
+            self.body = None
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+        self.sink.close()
+        print(f"   [Sink] Closed: {self.program / self.freq / 60:.1f} min of program, "
+              f"{self.underrun_sec:.1f}s filled with silence")
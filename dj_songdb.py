@@ -0,0 +1,219 @@
+import os
+import csv
+import math
+import random
+import sqlite3
+import threading
+
+from dj_catalog import SongCatalog, parse_last_played
+from dj_selector import NEVER_PLAYED_DIFF, FAR_DISTANCE
+
+# ==========================================
+# dj_songdb.py   SQLite版の曲データベース
+# ==========================================
+# musicdata.csv の代わりに（あるいは並行して）SQLiteで曲情報を持つための保存先。
+# play_flag / time_scale / last_played に索引を張り、
+# 「play_flag=2 で time_scale が 6〜8 の曲」のような絞り込みをSQLで行えるようにする。
+# CSVは人が編集する台帳としてそのまま残し、更新があれば取り込み直す。
+# ==========================================
+
+SONG_DB_PATH = "musicdata.db"   # SQLiteファイルの保存先
+
+# CSVの列（この順でエクスポートする）
+CSV_COLUMNS = [
+    'id', 'play_flag', 'time_scale', 'last_played',
+    'title', 'title_reading', 'composer', 'composer_reading',
+    'performer', 'performer_reading', 'copyright', 'source', 'remarks',
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id                INTEGER PRIMARY KEY,
+    play_flag         INTEGER NOT NULL DEFAULT 0,
+    time_scale        REAL    NOT NULL DEFAULT 5,
+    last_played       TEXT    NOT NULL DEFAULT '',
+    last_played_ts    REAL,
+    title             TEXT    NOT NULL DEFAULT '',
+    title_reading     TEXT    NOT NULL DEFAULT '',
+    composer          TEXT    NOT NULL DEFAULT '',
+    composer_reading  TEXT    NOT NULL DEFAULT '',
+    performer         TEXT    NOT NULL DEFAULT '',
+    performer_reading TEXT    NOT NULL DEFAULT '',
+    copyright         TEXT    NOT NULL DEFAULT '',
+    source            TEXT    NOT NULL DEFAULT '',
+    remarks           TEXT    NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_songs_play_flag ON songs(play_flag);
+CREATE INDEX IF NOT EXISTS idx_songs_time_scale ON songs(time_scale);
+CREATE INDEX IF NOT EXISTS idx_songs_last_played ON songs(last_played_ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteSongStore:
+
+    def __init__(self, path=SONG_DB_PATH):
+        self.path = path
+        # 起動時の読み込みはワーカースレッド、再生記録はイベントループから行うので、接続はロックで守って共有する
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(_SCHEMA)
+
+    # --- CSVとの相互変換 ---
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def import_csv(self, csv_path): # CSVの全列を取り込む（id が数字でない行は読み飛ばす）
+        rows = []
+        with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    sid = int(row['id'])
+                    play_flag = int(row.get('play_flag') or 0)
+                    time_scale = float(row.get('time_scale') or 5)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                last_played = row.get('last_played') or ''
+                ts = parse_last_played(last_played)
+                rows.append((
+                    sid, play_flag, time_scale, last_played, None if ts != ts else ts,
+                    *[(row.get(col) or '') for col in CSV_COLUMNS[4:]],
+                ))
+        placeholders = ", ".join("?" * (len(CSV_COLUMNS) + 1))
+        columns = ", ".join(CSV_COLUMNS[:4] + ['last_played_ts'] + CSV_COLUMNS[4:])
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM songs")
+            self.conn.executemany(f"INSERT INTO songs ({columns}) VALUES ({placeholders})", rows)
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('csv_mtime', ?)", (str(os.path.getmtime(csv_path)),))
+        return len(rows)
+
+    def sync_from_csv(self, csv_path): # CSVが前回の取り込みより新しければ取り込み直す
+        if not os.path.exists(csv_path):
+            return False
+        with self.lock:
+            imported = self._get_meta('csv_mtime')
+        if imported is not None and float(imported) >= os.path.getmtime(csv_path):
+            return False
+        count = self.import_csv(csv_path)
+        print(f"   [System] Imported {count} songs from {csv_path} into {self.path}")
+        return True
+
+    def export_csv(self, csv_path): # 一時ファイルへ書き出してから置き換える
+        tmp = csv_path + ".tmp"
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {', '.join(CSV_COLUMNS)} FROM songs ORDER BY id").fetchall()
+        with open(tmp, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(CSV_COLUMNS)
+            for row in rows:
+                writer.writerow(list(row))
+        os.replace(tmp, csv_path)
+        self.mark_csv_synced(csv_path)
+
+    def mark_csv_synced(self, csv_path): # CSVとDBの内容がそろっている（次回起動時に取り込み直さなくてよい）と記録する
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('csv_mtime', ?)", (str(os.path.getmtime(csv_path)),))
+
+    # --- 曲情報 ---
+
+    def load_song_db(self): # load_song_database() と同じ形（SongCatalog）で返す
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, play_flag, time_scale, last_played_ts, title, composer, performer FROM songs ORDER BY id").fetchall()
+        catalog = SongCatalog()
+        for row in rows:
+            try:
+                catalog.add(row['id'], row['play_flag'], row['time_scale'],
+                            row['last_played_ts'] if row['last_played_ts'] is not None else math.nan,
+                            row['title'] or 'Unknown Title', row['composer'] or 'Unknown Composer',
+                            row['performer'] or 'Unknown Performer')
+            except (TypeError, ValueError, OverflowError):
+                continue   # 不正な値の行だけを飛ばす
+        return catalog
+
+    def get_song_info(self, song_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM songs WHERE id = ?", (song_id,)).fetchone()
+        return dict(row) if row else None
+
+    def mark_played(self, song_id, played_at, timestamp):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE songs SET last_played = ?, last_played_ts = ? WHERE id = ?",
+                              (played_at, timestamp, song_id))
+
+    def apply_play_log(self, latest): # 再生ログ {曲ID: ISO時刻} をまとめて反映する
+        rows = []
+        for sid, played_at in latest.items():
+            ts = parse_last_played(played_at)
+            rows.append((played_at, None if ts != ts else ts, sid))
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE songs SET last_played = ?, last_played_ts = ? WHERE id = ?", rows)
+
+    # --- 絞り込み ---
+
+    def query(self, play_flag=None, scale_min=None, scale_max=None, played_before=None):
+        # 例: query(play_flag=2, scale_min=6, scale_max=8)
+        where, params = ["1 = 1"], []
+        if play_flag is not None:
+            where.append("play_flag = ?"); params.append(play_flag)
+        if scale_min is not None:
+            where.append("time_scale >= ?"); params.append(scale_min)
+        if scale_max is not None:
+            where.append("time_scale <= ?"); params.append(scale_max)
+        if played_before is not None:
+            where.append("(last_played_ts IS NULL OR last_played_ts < ?)"); params.append(played_before)
+        with self.lock:
+            return [dict(r) for r in self.conn.execute(
+                f"SELECT * FROM songs WHERE {' AND '.join(where)} ORDER BY id", params).fetchall()]
+
+    def window_candidates(self, t_target=None, radius=FAR_DISTANCE):
+        # 選曲候補（play_flag != 0）を取り出す。t_target を渡すと、time_scale の窓による絞り込みをSQL側で行う
+        sql = "SELECT id, play_flag, time_scale, last_played_ts FROM songs WHERE play_flag != 0"
+        params = []
+        if t_target is not None:
+            sql += " AND time_scale BETWEEN ? AND ?"
+            params = [t_target - radius, t_target + radius]
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def select_weighted(self, rotation, t_target, now_ts, boost_2=3.0, random_mode=False):
+        # SQLで窓内の曲だけを取り出し、従来と同じ式で重み付け抽選する。
+        # 窓の外（距離3.0超）の曲は重みが百万分の一なので、窓内に候補がある限り対象から外す。
+        # 窓内に候補がなければ全曲を対象にする（その場合は距離による減衰も従来どおり掛ける）。
+        rows = [] if random_mode else self.window_candidates(t_target)
+        rows = [r for r in rows if rotation.is_remaining(r['id'])]
+        if not rows:
+            rows = [r for r in self.window_candidates() if rotation.is_remaining(r['id'])]
+        if not rows:
+            remaining = rotation.remaining_ids()
+            return random.choice(remaining) if remaining else None
+
+        ids, weights = [], []
+        for r in rows:
+            p_logic = boost_2 if r['play_flag'] == 2 else 1.0
+            ts = r['last_played_ts']
+            time_diff = (now_ts - ts) if ts is not None else NEVER_PLAYED_DIFF
+            if random_mode:
+                w = p_logic * time_diff
+            else:
+                dist = abs(t_target - r['time_scale'])
+                w = (p_logic / ((dist + 1.0) ** 2)) * time_diff
+                if dist > FAR_DISTANCE:
+                    w *= 0.000001
+            ids.append(r['id'])
+            weights.append(w)
+        if not sum(weights) > 0:
+            return random.choice(ids)
+        return random.choices(ids, weights=weights, k=1)[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
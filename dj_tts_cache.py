@@ -0,0 +1,96 @@
+import os
+import json
+import shutil
+import hashlib
+from collections import OrderedDict
+
+# ==========================================
+# dj_tts_cache.py   合成音声のキャッシュ
+# ==========================================
+# (台本, 声, 話速, エンジン, 音声設定) のハッシュをファイル名にして、合成済みの音声を保存しておく。
+# DEFAULT_SCRIPT などの決まり文句やリトライは、通信せずにキャッシュから即座に返す。
+# 合計サイズが上限を超えたら、最後に使われたのが古いものから消す（LRU）。
+# ==========================================
+
+TTS_CACHE_DIR = "tts_cache"     # キャッシュの保存先フォルダ
+TTS_CACHE_MAX_MB = 200          # キャッシュの上限サイズ（MB）
+
+
+class TTSCache:
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_mb=TTS_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entries = OrderedDict()   # キー -> サイズ（古い順）
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self): # 既存のキャッシュを最終使用時刻（mtime）順に並べる
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".mp3"):
+                st = entry.stat()
+                files.append((st.st_mtime, entry.name[:-4], st.st_size))
+        for _mtime, key, size in sorted(files):
+            self.entries[key] = size
+            self.total += size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    @staticmethod
+    def make_key(**parts): # 合成結果を左右する要素をすべて含めてハッシュ化する
+        blob = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def lookup(self, key): # ヒットしたらキャッシュファイルのパスを返し、最近使った扱いにする
+        if key not in self.entries:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.total -= self.entries.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        try: os.utime(path)
+        except OSError: pass
+        return path
+
+    def store(self, key, src): # 合成済みファイルをキャッシュへ取り込み、上限を超えた分を捨てる
+        size = os.path.getsize(src)
+        if size > self.max_bytes:
+            return
+        tmp = self._path(key) + ".tmp"
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, self._path(key))
+        if key in self.entries:
+            self.total -= self.entries.pop(key)
+        self.entries[key] = size
+        self.total += size
+        self._evict()
+
+    def _evict(self):
+        while self.total > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total -= size
+            try: os.remove(self._path(key))
+            except OSError: pass
+
+    async def fetch(self, output_file, synthesize, **key_parts):
+        # キャッシュにあればコピーするだけ。なければ synthesize()（output_file へ書き出す）を実行して保存する
+        key = self.make_key(**key_parts)
+        cached = self.lookup(key)
+        if cached:
+            self.hits += 1
+            shutil.copyfile(cached, output_file)
+            return True
+        self.misses += 1
+        ok = await synthesize()
+        if ok and os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+            try:
+                self.store(key, output_file)
+            except OSError as e:
+                print(f"   [Warning] TTS cache store failed: {e}")
+        return ok
@@ -0,0 +1,86 @@
+import asyncio
+from collections import OrderedDict
+
+from dj_lazy import lazy_import
+from dj_loudness import integrated_loudness, true_peak_db, MAX_TRUE_PEAK_DB
+
+np = lazy_import("numpy")
+pygame = lazy_import("pygame")
+
+# ==========================================
+# dj_voice_level.py   合成音声の後処理（無音の切り詰めとラウドネス合わせ）
+# ==========================================
+# edge-tts や Google の声は、声の種類や文ごとに音量がばらばらで、VOICE_LEVEL を固定したままだと
+# 曲に埋もれたり、割れたりする。合成した音声をデコードした配列のまま、
+#   - 前後の無音を削る（つなぎ目の「間」はミキサー側の TALK_GAP_SEC などで決める）
+#   - 統合ラウドネス（dj_loudness.py と同じ BS.1770）を測り、次の曲のラウドネスを基準にした目標へゲインを掛ける
+# という処理をして、再生側（ミキサー・pygame.mixer.Sound）へ配列のまま渡す。ディスクへは書き戻さない。
+# ==========================================
+
+TRIM_DBFS = -45.0        # これより小さいブロックを、前後の無音とみなす
+TRIM_BLOCK_MS = 10       # 無音判定の単位（ミリ秒）
+TRIM_PAD_MS = 60         # 削った後に残す前後の余白（ミリ秒。子音の立ち上がり・余韻を切らないため）
+MAX_VOICE_GAIN_DB = 18.0 # 声を持ち上げる上限（ほとんど無音の失敗音声でノイズを持ち上げないため）
+KEEP_CLIPS = 8           # 保持しておく整えた声の数（先読みの深さより多めに。取り出されなかった古いものから捨てる）
+
+
+def trim_silence(samples, freq, threshold_db=TRIM_DBFS, pad_ms=TRIM_PAD_MS): # 前後の無音を削った配列（ビュー）を返す
+    block = max(1, freq * TRIM_BLOCK_MS // 1000)
+    usable = len(samples) // block * block
+    if not usable:
+        return samples
+    peaks = np.abs(samples[:usable].reshape(usable // block, -1).astype(np.int32)).max(axis=1)
+    loud = np.flatnonzero(peaks >= 32768 * 10.0 ** (threshold_db / 20.0))
+    if not len(loud):
+        return samples[:0]
+    pad = freq * pad_ms // 1000
+    start = max(0, loud[0] * block - pad)
+    end = min(len(samples), (loud[-1] + 1) * block + pad)
+    return samples[start:end]
+
+
+def level_voice(samples, freq, target_lufs): # ラウドネスを target_lufs に合わせた配列と、掛けたゲイン（dB）を返す
+    lufs = integrated_loudness(samples, freq)
+    if lufs == float("-inf"):   # 短すぎる・無音で測れない時はそのまま
+        return samples, 0.0
+    gain_db = min(target_lufs - lufs, MAX_VOICE_GAIN_DB, MAX_TRUE_PEAK_DB - true_peak_db(samples))
+    out = samples.astype(np.float32)
+    out *= np.float32(10.0 ** (gain_db / 20.0))
+    np.clip(out, -32768, 32767, out=out)
+    return out.astype(np.int16), gain_db
+
+
+class VoiceClips:
+    # 整えた声を、合成した音声ファイル名をキーにして再生まで持っておく
+
+    def __init__(self, keep=KEEP_CLIPS):
+        self.keep = keep
+        self.clips = OrderedDict()
+
+    def _process(self, path, target_lufs):
+        freq, _size, channels = pygame.mixer.get_init()
+        raw = pygame.mixer.Sound(path).get_raw()
+        samples = np.frombuffer(raw, dtype=np.int16).reshape(-1, channels)
+        trimmed = trim_silence(samples, freq)
+        if not len(trimmed):
+            print("  [Warning] Synthesized voice is silent; using the raw clip.")
+            return None
+        leveled, gain_db = level_voice(trimmed, freq, target_lufs)
+        print(f"   [Voice] Trimmed {(len(samples) - len(trimmed)) / freq:.2f}s of silence, "
+              f"gain {gain_db:+.1f} dB toward {target_lufs:.1f} LUFS")
+        return np.ascontiguousarray(leveled)
+
+    async def prepare(self, path, target_lufs): # 合成した音声をデコードして整え、取っておく。失敗したら元のファイルを使う
+        try:
+            clip = await asyncio.to_thread(self._process, path, target_lufs)
+        except Exception as e:
+            print(f"  [Warning] Voice leveling failed, using the raw clip: {e}")
+            return
+        if clip is None:
+            return
+        self.clips[path] = clip
+        while len(self.clips) > self.keep:
+            self.clips.popitem(last=False)
+
+    def take(self, path): # 整えた声（デコード済みの配列）を取り出す。無ければ None
+        return self.clips.pop(path, None)
@@ -0,0 +1,195 @@
+import io
+import re
+import time
+import asyncio
+import threading
+from collections import deque
+
+from dj_lazy import lazy_import
+
+np = lazy_import("numpy")
+pygame = lazy_import("pygame")
+
+# ==========================================
+# dj_voice_stream.py   ストリーミング音声再生
+# ==========================================
+# TTSの音声を全部そろうまで待たず、届いた分からメモリ上でデコードして再生キューへ積む。
+# next_talk.mp3 を書いて読み直す往復がなくなり、話し始めまでの時間が短くなる。
+#   - MP3（edge-tts）：台本を文ごとに分けて合成し、一文そろうごとにまるごとデコードして流す。
+#     次の文は今の文を流している間に合成しておく。一文ずつ独立したMP3なので、つなぎ目で位置を合わせる必要がない。
+#   - PCM（Google streaming）：そのままミキサーの形式へ変換して流す。
+# ==========================================
+
+STREAM_CHUNK_SEC = 0.5     # この長さがたまるごとにデコードして再生キューへ積む
+PUMP_INTERVAL = 0.02       # 再生キューの補充間隔（秒）
+STREAM_CHANNEL = 0         # 予約するミキサーチャンネル番号（Sound.play() には使わせない）
+
+
+class StreamingVoicePlayer:
+
+    def __init__(self, volume=1.0):
+        freq, size, channels = pygame.mixer.get_init()
+        self.freq = freq
+        self.channels = channels
+        self.bytes_per_frame = abs(size) // 8 * channels
+        pygame.mixer.set_reserved(STREAM_CHANNEL + 1)
+        self.channel = pygame.mixer.Channel(STREAM_CHANNEL)
+        self.volume = volume
+        self.pending = deque()
+        self.first_audio_at = None
+
+    # --- 再生キュー ---
+
+    def _enqueue(self, raw): # ミキサー形式の生データを Sound にして積む
+        usable = len(raw) - len(raw) % self.bytes_per_frame
+        if usable <= 0:
+            return
+        self.pending.append(pygame.mixer.Sound(buffer=bytes(raw[:usable])))
+
+    def _pump(self): # チャンネルの再生・待ち枠が空いていれば次を送り込む
+        if not self.pending:
+            return
+        if not self.channel.get_busy():
+            self.channel.set_volume(self.volume)
+            self.channel.play(self.pending.popleft())
+            if self.first_audio_at is None:
+                self.first_audio_at = time.perf_counter()
+        elif self.channel.get_queue() is None:
+            self.channel.queue(self.pending.popleft())
+
+    async def _drain(self, feeder):
+        # 受信（feeder）と再生キューの補充を並行して進め、最後の音が鳴り終わるまで待つ
+        feed_task = asyncio.create_task(feeder)
+        try:
+            while not feed_task.done() or self.pending or self.channel.get_busy():
+                self._pump()
+                await asyncio.sleep(PUMP_INTERVAL)
+            await feed_task
+        finally:
+            if not feed_task.done():
+                feed_task.cancel()
+
+    # --- MP3（edge-tts） ---
+
+    def _decode_mp3(self, data): # 一文分のMP3をデコードし、ミキサー形式の生データを返す
+        return pygame.mixer.Sound(file=io.BytesIO(data)).get_raw()
+
+    async def _feed_mp3(self, clips):
+        async for data in clips:
+            if data:
+                self._enqueue(self._decode_mp3(data))
+
+    async def play_mp3(self, clips): # 一文ずつのMP3（bytes）の非同期イテレーターを受け取り、話し終わるまで待つ
+        return await self._play(self._feed_mp3(clips))
+
+    # --- PCM（Google streaming） ---
+
+    def _convert_pcm(self, data, sample_rate, channels): # 16bit PCM をミキサーの周波数・チャンネル数へ合わせる
+        samples = np.frombuffer(data, dtype=np.int16)
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1)
+        if sample_rate != self.freq and len(samples):
+            n_out = int(len(samples) * self.freq / sample_rate)
+            samples = np.interp(np.linspace(0, len(samples) - 1, n_out), np.arange(len(samples)), samples)
+        out = np.repeat(np.asarray(samples, dtype=np.int16)[:, None], self.channels, axis=1)
+        return out.tobytes()
+
+    async def _feed_pcm(self, chunks, sample_rate, channels):
+        pending = bytearray()
+        step = int(STREAM_CHUNK_SEC * sample_rate) * 2 * channels
+        async for chunk in chunks:
+            pending.extend(chunk)
+            if len(pending) >= step:
+                usable = len(pending) - len(pending) % (2 * channels)
+                self._enqueue(self._convert_pcm(bytes(pending[:usable]), sample_rate, channels))
+                del pending[:usable]
+        if pending:
+            usable = len(pending) - len(pending) % (2 * channels)
+            self._enqueue(self._convert_pcm(bytes(pending[:usable]), sample_rate, channels))
+
+    async def play_pcm(self, chunks, sample_rate, channels=1):
+        return await self._play(self._feed_pcm(chunks, sample_rate, channels))
+
+    # --- ファイル（ストリーミングに失敗した時の代わり） ---
+
+    async def _feed_file(self, path):
+        self.pending.append(pygame.mixer.Sound(path))
+
+    async def play_file(self, path): # 合成済みの音声ファイルを同じチャンネルで流し、話し終わるまで待つ
+        return await self._play(self._feed_file(path))
+
+    # --- 共通 ---
+
+    async def _play(self, feeder):
+        started = time.perf_counter()
+        self.first_audio_at = None
+        await self._drain(feeder)
+        if self.first_audio_at is None:
+            print("   [Voice] Streaming produced no audio.")
+            return None
+        first = self.first_audio_at - started
+        print(f"   [Voice] Streaming: first word after {first:.2f}s, finished after {time.perf_counter() - started:.1f}s")
+        return first
+
+    def stop(self):
+        self.pending.clear()
+        self.channel.stop()
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+")
+
+
+def split_sentences(text): # 台本を文ごとに分ける（文ごとに合成して、そろった文から流すため）
+    return [part.strip() for part in _SENTENCE_END.split(text) if part.strip()]
+
+
+async def prefetch_each(items, fetch): # items を順に fetch して返す。返した分を流している間に次の分を取りに行く
+    items = list(items)
+    if not items:
+        return
+    task = asyncio.ensure_future(fetch(items[0]))
+    try:
+        for item in items[1:]:
+            result = await task
+            task = asyncio.ensure_future(fetch(item))
+            yield result
+        yield await task
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def iterate_in_thread(make_iter): # 同期イテレーター（ブロッキングなSDK呼び出し）を別スレッドで回し、非同期に受け取る
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()   # 受け取る側が止めたら、スレッドも次の項目の前で止める
+
+    def worker():
+        it = make_iter()
+        try:
+            for item in it:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    loop.run_in_executor(None, worker)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,110 @@
+import os
+
+from dj_comments import CommentQueue, CommentFileTail, rank_comments, COMMENT_MAX_CHARS
+
+# ==========================================
+# test_dj_comments.py   コメントの受け口・comment.txt の追記読み・コメントの選別のテスト
+# ==========================================
+
+
+def append(path, text):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_queue_rate_limit_and_overflow():
+    queue = CommentQueue(maxlen=3, rate_limit=2, rate_window=60.0)
+    assert queue.push("a", "1") and queue.push("a", "2")
+    assert not queue.push("a", "3")                       # 同じ投稿者の3件目は受け付けない
+    assert queue.push("b", "4") and queue.push("c", "5")  # 上限3件を超えた分は古いものから捨てる
+    assert [c.message for c in queue.drain()] == ["2", "4", "5"]
+    assert queue.stats() == {'queued': 0, 'received': 5, 'dropped_overflow': 1, 'dropped_rate': 1}
+
+
+def test_tail_reads_existing_lines_and_defers_partial_line(tmp_path):
+    path = str(tmp_path / "comment.txt")
+    append(path, "before start\nsecond\nhalf")
+    tail = CommentFileTail(path)
+    assert tail.read_lines() == ["before start", "second"]   # 起動前のコメントも拾う
+    assert tail.read_lines() == []
+    append(path, " line\n")
+    assert tail.read_lines() == ["half line"]
+
+
+def test_tail_resumes_from_saved_position(tmp_path):
+    path = str(tmp_path / "comment.txt")
+    append(path, "old\n")
+    assert CommentFileTail(path).read_lines() == ["old"]
+    append(path, "new\n")
+    assert CommentFileTail(path).read_lines() == ["new"]    # 起動し直しても、読んだ分は読み直さない
+
+
+def test_tail_rereads_truncated_file(tmp_path):
+    path = str(tmp_path / "comment.txt")
+    append(path, "one long comment\ntwo\n")
+    tail = CommentFileTail(path)
+    tail.read_lines()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("x\n")
+    assert tail.read_lines() == ["x"]
+
+
+def test_tail_rereads_rotated_file(tmp_path):
+    path = str(tmp_path / "comment.txt")
+    append(path, "first file\n")
+    tail = CommentFileTail(path)
+    tail.read_lines()
+    rotated = str(tmp_path / "comment.new")
+    append(rotated, "second file, much longer than the first one\n")
+    os.replace(rotated, path)                             # 同じ名前で作り直された（大きさは前より大きい）
+    assert tail.read_lines() == ["second file, much longer than the first one"]
+
+
+def test_tail_handles_deleted_file(tmp_path):
+    path = str(tmp_path / "comment.txt")
+    append(path, "a\n")
+    tail = CommentFileTail(path)
+    tail.read_lines()
+    os.remove(path)
+    assert tail.read_lines() == []
+    append(path, "b\n")
+    assert tail.read_lines() == ["b"]
+
+
+def test_tail_keeps_newest_lines(tmp_path):
+    path = str(tmp_path / "comment.txt")
+    append(path, "".join(f"line {i}\n" for i in range(10)))
+    assert CommentFileTail(path, max_lines=3).read_lines() == ["line 7", "line 8", "line 9"]
+
+
+def test_rank_drops_spam_and_duplicates():
+    text = "\n".join([
+        "alice: Hello Silas!",
+        "bob: check https://spam.example",
+        "carol: :face-blue-smiling: :heart:",
+        "dave: !!!",
+        "erin: hello silas",                              # 大文字小文字・記号違いの重複は最新の一件だけ
+    ])
+    assert rank_comments(text, top_k=5, log=False) == "erin: hello silas"
+
+
+def test_rank_prefers_recent_and_different_authors():
+    text = "\n".join([
+        "alice: an old comment",
+        "bob: bob says hi",
+        "alice: alice again",
+        "alice: alice once more",
+    ])
+    # 新しい順なら alice が二件だが、同じ投稿者の二件目は点数が下がるので bob が入る。並びは古い順
+    assert rank_comments(text, top_k=2, log=False) == "bob: bob says hi\nalice: alice once more"
+
+
+def test_rank_shortens_repeats_and_long_messages():
+    assert rank_comments("fan: great wwwwwwww", log=False) == "fan: great www"
+    long_line = rank_comments("fan: " + "a b " * COMMENT_MAX_CHARS, log=False)
+    assert long_line.endswith("...") and len(long_line) <= len("fan: ") + COMMENT_MAX_CHARS + 3
+
+
+def test_rank_empty_input():
+    assert rank_comments("", log=False) == ""
+    assert rank_comments(None, log=False) == ""
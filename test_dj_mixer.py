@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from dj_mixer import plan_transition, fade_curves, dead_air_frames, CURVES
+
+# ==========================================
+# test_dj_mixer.py   つなぎ目の計画とフェードカーブのテスト
+# ==========================================
+# 位置はすべてフレーム数。わかりやすいように 1秒 = 100 フレームとして数える。
+# ==========================================
+
+X, RAMP, GAP = 400, 100, 50      # クロスフェード 4秒、ダッキング 1秒、話し終えてから 0.5秒
+
+
+def test_voice_fits_before_the_end():
+    plan = plan_transition(0, 10000, 1000, 20000, X, RAMP, GAP)
+    assert plan.crossfade == X
+    assert plan.fade_at == 10000 - X                      # 曲の終わりでちょうどクロスフェードが終わる
+    assert plan.voice_at == plan.fade_at - GAP - 1000     # 声の後に talk_gap おいてフェードが始まる
+    assert plan.cut == plan.voice_at - RAMP
+    assert plan.cut + plan.length == plan.fade_at + X
+
+
+def test_voice_longer_than_what_is_left_pushes_the_fade_later():
+    start = 9500                                          # すでに曲の終わり近くまで再生へ回している
+    plan = plan_transition(start, 10000, 1000, 20000, X, RAMP, GAP)
+    assert plan.cut == start                              # 渡し済みの部分は変えない
+    assert plan.voice_at == start + RAMP
+    assert plan.fade_at == plan.voice_at + 1000 + GAP     # 声を切らずに、曲の終わりより後ろでフェードする
+    assert plan.fade_at > 10000 - X
+
+
+def test_no_voice_crossfades_at_the_end():
+    plan = plan_transition(0, 10000, 0, 20000, X, RAMP, GAP)
+    assert plan.cut == plan.voice_at == plan.fade_at == 10000 - X
+    assert plan.length == X
+
+
+def test_no_voice_after_fade_point_starts_right_away():
+    plan = plan_transition(9900, 10000, 0, 20000, X, RAMP, GAP)
+    assert plan.cut == plan.fade_at == 9900
+    assert plan.length == X
+
+
+def test_short_next_track_limits_the_crossfade():
+    plan = plan_transition(0, 10000, 0, 300, X, RAMP, GAP)
+    assert plan.crossfade == 150                          # 次の曲の半分まで
+    assert plan.fade_at == 10000 - 150
+
+
+def test_finish_without_next_track_keeps_the_fade_length():
+    plan = plan_transition(5000, 5000, 200, 0, 1000, RAMP, GAP)   # MixEngine.finish()：今すぐ声を重ねて消す
+    assert plan.crossfade == 1000
+    assert plan.cut == 5000 and plan.voice_at == 5000 + RAMP
+    assert plan.fade_at == plan.voice_at + 200 + GAP
+
+
+def test_negative_crossfade_is_treated_as_zero():
+    plan = plan_transition(0, 10000, 0, 20000, -5, RAMP, GAP)
+    assert plan.crossfade == 0
+    assert plan.cut == plan.fade_at == 10000 and plan.length == 0
+
+
+@pytest.mark.parametrize("kind", CURVES)
+def test_fade_curves_are_mirrored_ramps(kind):
+    fade_out, fade_in = fade_curves(kind, 64)
+    assert len(fade_out) == len(fade_in) == 64
+    assert np.all(np.diff(fade_in) > 0)
+    assert np.allclose(fade_out, fade_in[::-1])
+
+
+def test_equal_power_keeps_power_constant():
+    fade_out, fade_in = fade_curves("equal_power", 128)
+    assert np.allclose(fade_out ** 2 + fade_in ** 2, 1.0, atol=1e-5)
+
+
+def test_unknown_curve_is_rejected():
+    with pytest.raises(ValueError):
+        fade_curves("cosine", 10)
+
+
+def test_dead_air_frames_counts_silent_blocks():
+    freq = 1000                                           # 1ブロック = 10 フレーム
+    samples = np.zeros((100, 2), dtype=np.int16)
+    samples[30:60] = 10000
+    assert dead_air_frames(samples, freq) == 70
+    assert dead_air_frames(samples[:5], freq) == 0        # 1ブロックに満たない
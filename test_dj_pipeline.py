@@ -0,0 +1,129 @@
+import asyncio
+
+from dj_selector import SelectionEngine, SessionRotation
+from dj_pipeline import TalkPipeline, REBUILD_MARGIN_SEC
+
+# ==========================================
+# test_dj_pipeline.py   トークの先読みパイプラインのテスト
+# ==========================================
+# 台本生成・音声合成の代わりに、呼ばれた内容を記録するだけの prepare_fn を渡す。
+# ==========================================
+
+
+def make_rotation(n=10):
+    db = {sid: {'play_flag': 1, 'time_scale': 5.0, 'last_played': ''} for sid in range(1, n + 1)}
+    return SessionRotation(list(db), SelectionEngine(db))
+
+
+def first_remaining(rotation): # 未再生の曲のうち先頭を選ぶ（順番を決めて確かめやすくする）
+    remaining = rotation.remaining_ids()
+    return remaining[0] if remaining else None
+
+
+class Recorder:
+    # prepare_fn / batch_fn の呼び出しを記録する
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.batches = []
+
+    async def prepare(self, kind, cur_info, next_info, comments, output_file, script=None, next_id=None):
+        self.calls.append({'next_id': next_id, 'comments': comments, 'output_file': output_file, 'script': script})
+        await asyncio.sleep(self.delay)
+        return script or f"talk to {next_id}"
+
+    async def batch(self, pairs):
+        self.batches.append(pairs)
+        return [f"batch {cur} -> {nxt}" for cur, nxt in pairs]
+
+
+def make_pipeline(tmp_path, recorder, depth=2, **kwargs):
+    rotation = make_rotation()
+    pipeline = TalkPipeline(rotation, first_remaining, lambda sid: sid, recorder.prepare, depth=depth,
+                            prefix=str(tmp_path / "talk"), **kwargs)
+    return pipeline, rotation
+
+
+def test_start_fills_lookahead_and_reserves_songs(tmp_path):
+    async def run():
+        recorder = Recorder()
+        pipeline, rotation = make_pipeline(tmp_path, recorder, depth=3)
+        pipeline.start(1)
+        assert pipeline.upcoming_ids() == [2, 3, 4]
+        assert [(seg.current_id, seg.next_id) for seg in pipeline.segments] == [(1, 2), (2, 3), (3, 4)]
+        assert all(rotation.is_played(sid) for sid in (1, 2, 3, 4))
+        head = await pipeline.pop_ready()
+        assert head.next_id == 2 and head.result() == "talk to 2"
+        assert pipeline.playing_id == 2
+        assert pipeline.upcoming_ids() == [3, 4, 5]    # 取り出した分だけ先へ足される
+        pipeline.close()
+    asyncio.run(run())
+
+
+def test_batch_fn_prepares_scripts_in_one_request(tmp_path):
+    async def run():
+        recorder = Recorder()
+        pipeline, _rotation = make_pipeline(tmp_path, recorder, depth=1, batch_fn=recorder.batch, batch_size=3)
+        pipeline.start(1)
+        assert len(pipeline.segments) == 3
+        head = await pipeline.pop_ready()
+        assert recorder.batches == [[(1, 2), (2, 3), (3, 4)]]
+        assert head.result() == "batch 1 -> 2"
+        assert len(pipeline.segments) == 2      # batch_size 件分の空きができるまで足さない
+        pipeline.close()
+    asyncio.run(run())
+
+
+def test_update_comments_rebuilds_only_the_head(tmp_path):
+    async def run():
+        recorder = Recorder(delay=0.05)
+        pipeline, _rotation = make_pipeline(tmp_path, recorder)
+        pipeline.start(1)
+        head, second = pipeline.segments
+        old_task, old_file, second_task = head.task, head.output_file, second.task
+        await asyncio.sleep(0)
+        pipeline.update_comments("first")
+        pipeline.update_comments("second")
+        assert head.comments == "first\nsecond"
+        assert head.output_file != old_file
+        assert second.task is second_task and second.comments == ""
+        await asyncio.sleep(0)
+        assert old_task.cancelled()
+        popped = await pipeline.pop_ready()
+        assert popped is head
+        assert popped.result() == "talk to 2"
+        assert any(c['comments'] == "first\nsecond" and c['output_file'] == head.output_file for c in recorder.calls)
+        pipeline.close()
+    asyncio.run(run())
+
+
+def test_update_comments_carries_over_when_time_is_short(tmp_path):
+    async def run():
+        recorder = Recorder()
+        pipeline, _rotation = make_pipeline(tmp_path, recorder)
+        pipeline.start(1)
+        head, second = pipeline.segments
+        head_task = head.task
+        pipeline.update_comments("late", time_left=1.0)
+        assert head.task is head_task and head.comments == ""
+        assert second.comments == "late"
+        # 次のつなぎ目まで余裕があれば、いつも通り先頭を作り直す
+        pipeline.update_comments("early", time_left=pipeline.rebuild_estimate() + REBUILD_MARGIN_SEC + 1)
+        assert head.comments == "early"
+        pipeline.close()
+    asyncio.run(run())
+
+
+def test_comments_wait_for_the_next_segment(tmp_path):
+    async def run():
+        recorder = Recorder()
+        pipeline, _rotation = make_pipeline(tmp_path, recorder, depth=1)
+        pipeline.start(1)
+        pipeline.update_comments("hello", time_left=0.0)   # 先読みが一件だけで、作り直す時間も無い
+        assert pipeline.pending_comments == "hello"
+        await pipeline.pop_ready()
+        assert pipeline.segments[0].comments == "hello"
+        assert pipeline.pending_comments == ""
+        pipeline.close()
+    asyncio.run(run())
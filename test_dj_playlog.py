@@ -0,0 +1,76 @@
+from dj_playlog import PlayLog, read_play_log, compact_csv
+
+# ==========================================
+# test_dj_playlog.py   再生ログと musicdata.csv への書き戻しのテスト
+# ==========================================
+
+T1 = "2026-10-17T10:00:00+09:00"
+T2 = "2026-10-17T11:30:00+09:00"
+
+
+def write(path, text, encoding="utf-8"):
+    with open(path, "w", encoding=encoding, newline="") as f:
+        f.write(text)
+
+
+def read(path, encoding="utf-8"):
+    with open(path, "r", encoding=encoding, newline="") as f:
+        return f.read()
+
+
+def test_read_play_log_keeps_latest_complete_rows(tmp_path):
+    path = str(tmp_path / "play_log.csv")
+    write(path, f"1,{T1}\n2,{T1}\nx,{T1}\n3\n4,not a time\n1,{T2}\n5,2026-10-17T1")
+    # 後の行ほど新しい。列が足りない・読めない行と、書きかけの最終行は捨てる
+    assert read_play_log(path) == {1: T2, 2: T1}
+
+
+def test_read_play_log_missing_file(tmp_path):
+    assert read_play_log(str(tmp_path / "missing.csv")) == {}
+
+
+def test_compact_csv_replaces_only_logged_rows(tmp_path):
+    path = str(tmp_path / "musicdata.csv")
+    write(path, "id,title,play_flag,time_scale,last_played\n"
+                "1,Nocturne,1,3.0,\n"
+                "2,\"Prelude, Op. 28\",2,5.0,2026-01-01T00:00:00+09:00\n"
+                "bad,Broken,1,5.0,\n", encoding="utf-8-sig")
+    compact_csv(path, {1: T1, 2: T2, 9: T1})
+    assert read(path, encoding="utf-8-sig") == (
+        "id,title,play_flag,time_scale,last_played\n"
+        f"1,Nocturne,1,3.0,{T1}\n"
+        f"2,\"Prelude, Op. 28\",2,5.0,{T2}\n"
+        "bad,Broken,1,5.0,\n")
+    assert not (tmp_path / "musicdata.csv.tmp").exists()
+
+
+def test_play_log_drops_partial_line_on_open(tmp_path):
+    path = str(tmp_path / "play_log.csv")
+    write(path, f"1,{T1}\n2,2026-10-17T1")
+    log = PlayLog(path)
+    log.append(3, T2)
+    log.close()
+    assert read(path) == f"1,{T1}\n3,{T2}\n"
+
+
+def test_play_log_discard_through_keeps_later_rows(tmp_path):
+    path = str(tmp_path / "play_log.csv")
+    log = PlayLog(path)
+    log.append(1, T1)
+    log.append(2, T1)
+    pos = log.position()
+    log.append(3, T2)
+    log.discard_through(pos)
+    assert log.since_compact == 1
+    log.close()
+    assert read_play_log(path) == {3: T2}
+
+
+def test_play_log_compaction_switch(tmp_path):
+    log = PlayLog(str(tmp_path / "play_log.csv"))
+    for sid in range(3):
+        log.append(sid, T1)
+    assert log.needs_compaction(every=3)
+    log.disable_compaction()
+    assert not log.needs_compaction(every=3)
+    log.close()
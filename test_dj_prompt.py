@@ -0,0 +1,44 @@
+from dj_prompt import CompiledTemplate, parse_batch
+
+# ==========================================
+# test_dj_prompt.py   プロンプトのテンプレートと、まとめて生成した応答の読み取りのテスト
+# ==========================================
+
+
+def test_parse_batch_reads_list_of_objects():
+    text = '[{"index": 2, "script": " second "}, {"index": 1, "script": "first"}]'
+    assert parse_batch(text, 2) == ["first", "second"]
+
+
+def test_parse_batch_reads_plain_strings_and_wrapped_object():
+    assert parse_batch('["a", "b", "c"]', 3) == ["a", "b", "c"]
+    assert parse_batch('{"scripts": [{"index": 1, "script": "only"}]}', 2) == ["only", None]
+
+
+def test_parse_batch_strips_code_fence():
+    text = '```json\n[{"index": 1, "script": "fenced"}]\n```'
+    assert parse_batch(text, 1) == ["fenced"]
+
+
+def test_parse_batch_malformed_output_gives_none():
+    for text in (None, "", "not json", '[{"index": 1, "script": "cut off', '{"scripts": "oops"}', '42', 'null'):
+        assert parse_batch(text, 2) == [None, None]
+
+
+def test_parse_batch_skips_bad_items_only():
+    text = ('[{"index": 1, "script": ""}, {"index": 7, "script": "out of range"}, '
+            '{"index": "3", "script": "string index"}, {"index": 2, "script": 5}, '
+            '{"index": 3, "script": "kept"}, null]')
+    assert parse_batch(text, 3) == [None, None, "kept"]
+
+
+def test_parse_batch_ignores_extra_items():
+    assert parse_batch('["a", "b", "c"]', 2) == ["a", "b"]
+
+
+def test_compiled_template_embeds_constants_and_fills_slots():
+    template = CompiledTemplate("{persona}\nLang: {lang}. Song: {title}. Scale: {scale:.1f}", lang="English")
+    assert template.fields == {"persona", "title", "scale"}
+    assert template.render(persona="Silas", title="Nocturne", scale=4.25) == \
+        "Silas\nLang: English. Song: Nocturne. Scale: 4.2"
+    assert template.render(title="Nocturne", scale=1.0) == "\nLang: English. Song: Nocturne. Scale: 1.0"
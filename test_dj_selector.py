@@ -0,0 +1,157 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from dj_selector import SelectionEngine, SessionRotation, FAR_DISTANCE
+
+# ==========================================
+# test_dj_selector.py   選曲エンジンとローテーションのテスト
+# ==========================================
+# 従来の select_next_song_weighted（1曲ずつ重みを計算して random.choices で抽選）を
+# ここに写しておき、同じ乱数の種なら全曲スキャンで同じ曲が選ばれることを確かめる。
+# ==========================================
+
+BOOST_2 = 3.0
+NOW = datetime(2026, 10, 17, 12, 0, 0).astimezone()
+
+
+def old_select(song_db, available_ids, t_target, now_ts, random_mode=False, boost_2=BOOST_2): # 従来の抽選
+    candidates, weights = [], []
+    for sid in available_ids:
+        song = song_db.get(sid)
+        if not song or song.get('play_flag', 0) == 0:
+            continue
+        p_logic = boost_2 if song.get('play_flag') == 2 else 1.0
+        s_val = song.get('time_scale', 5.0)
+        lp = song.get('last_played', '')
+        try:
+            time_diff = (now_ts - datetime.fromisoformat(lp).timestamp()) if lp else 86400.0
+        except ValueError:
+            time_diff = 86400.0
+        if random_mode:
+            w = p_logic * time_diff
+        else:
+            dist = abs(t_target - s_val)
+            w = (p_logic / ((dist + 1.0) ** 2)) * time_diff
+            if dist > 3.0:
+                w *= 0.000001
+        candidates.append(sid)
+        weights.append(w)
+    if not candidates:
+        return random.choice(available_ids) if available_ids else None
+    return random.choices(candidates, weights=weights, k=1)[0]
+
+
+def make_db(n=200, seed=1): # play_flag 0/1/2、スケール 1〜9、未再生・再生済みが混ざった曲データ
+    rng = random.Random(seed)
+    db = {}
+    for sid in range(1, n + 1):
+        played = rng.random() < 0.7
+        db[sid] = {
+            'play_flag': rng.choice([0, 1, 1, 2]),
+            'time_scale': round(rng.uniform(1.0, 9.0), 1),
+            'last_played': (NOW - timedelta(hours=rng.uniform(1, 500))).isoformat() if played else '',
+        }
+    return db
+
+
+def test_full_scan_matches_old_weighted_draw():
+    db = make_db()
+    ids = list(db)
+    random.Random(2).shuffle(ids)     # ライブラリの並びは曲ID順とは限らない
+    engine = SelectionEngine(db, BOOST_2)
+    rotation = SessionRotation(ids, engine)
+    now_ts = NOW.timestamp()
+    for random_mode in (False, True):
+        for seed in range(50):
+            t_target = 1.0 + (seed % 9)
+            random.seed(seed)
+            expected = old_select(db, ids, t_target, now_ts, random_mode)
+            random.seed(seed)
+            assert engine.select(rotation, t_target, now_ts, random_mode, use_index=False) == expected
+
+
+def test_full_scan_skips_played_songs_like_old_candidate_list():
+    db = make_db()
+    ids = list(db)
+    engine = SelectionEngine(db, BOOST_2)
+    rotation = SessionRotation(ids, engine)
+    for sid in ids[::3]:
+        rotation.mark(sid)
+    remaining = [sid for sid in ids if not rotation.is_played(sid)]
+    now_ts = NOW.timestamp()
+    for seed in range(30):
+        random.seed(seed)
+        expected = old_select(db, remaining, 5.0, now_ts)
+        random.seed(seed)
+        assert engine.select(rotation, 5.0, now_ts, use_index=False) == expected
+
+
+def test_window_weights_match_full_weights():
+    db = make_db()
+    engine = SelectionEngine(db, BOOST_2)
+    now_ts = NOW.timestamp()
+    for t_target in (1.0, 4.5, 9.0):
+        span = engine.window(t_target)
+        full = engine.weights(t_target, now_ts)[engine.scale_order[span]]
+        full = np.where(engine.play_flag[engine.scale_order[span]] != 0, full, 0.0)
+        assert np.allclose(engine.window_weights(span, t_target, now_ts), full)
+        assert np.all(np.abs(engine.sorted_scale[span] - t_target) <= FAR_DISTANCE)
+
+
+def test_indexed_select_only_picks_unplayed_songs_in_window():
+    db = make_db()
+    ids = list(db)
+    engine = SelectionEngine(db, BOOST_2)
+    rotation = SessionRotation(ids, engine)
+    random.seed(0)
+    for _ in range(100):
+        chosen = engine.select(rotation, 5.0, NOW.timestamp())
+        if chosen is None:
+            break
+        assert not rotation.is_played(chosen)
+        assert db[chosen]['play_flag'] != 0
+        if abs(db[chosen]['time_scale'] - 5.0) > FAR_DISTANCE:
+            # 範囲外の曲は、範囲内の候補が尽きてからしか選ばれない
+            span = engine.window(5.0)
+            assert not np.any(rotation.remaining_in(span) & (engine.sorted_p_logic[span] > 0))
+        rotation.mark(chosen)
+
+
+def test_rotation_reset_starts_new_generation():
+    db = make_db(20)
+    ids = list(db) + [999]            # CSVに載っていない曲も混ぜる
+    engine = SelectionEngine(db, BOOST_2)
+    rotation = SessionRotation(ids, engine)
+    for sid in ids:
+        rotation.mark(sid)
+    assert rotation.exhausted()
+    assert rotation.remaining_ids() == []
+    assert len(rotation.remaining_index()) == 0
+
+    gen = rotation.gen
+    rotation.reset(keep=[3, 4])       # 最後に流した曲（999）と予約済みの曲は残る
+    assert rotation.gen == gen + 1
+    assert not rotation.exhausted()
+    assert rotation.played_count == 3
+    assert set(ids) - set(rotation.remaining_ids()) == {3, 4, 999}
+    assert set(engine.ids[rotation.remaining_index()]) == set(ids) - {3, 4, 999}
+    # 範囲索引の並びでも同じ内容になっている
+    everything = slice(0, len(engine.ids))
+    assert set(engine.ids[engine.scale_order[rotation.remaining_in(everything)]]) == set(ids) - {3, 4, 999}
+
+
+def test_rotation_mark_and_unmark_keep_count():
+    db = make_db(10)
+    engine = SelectionEngine(db, BOOST_2)
+    rotation = SessionRotation(list(db), engine)
+    rotation.mark(1)
+    rotation.mark(1)
+    assert rotation.played_count == 1
+    rotation.unmark(1)
+    rotation.unmark(1)
+    assert rotation.played_count == 0
+    assert rotation.is_remaining(1)
+    rotation.mark(12345)              # ライブラリにない曲は数えない
+    assert rotation.played_count == 0
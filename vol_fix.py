@@ -1,55 +1,26 @@
-# --- Python 3.13/3.14 救済パッチ ---
-try:
-    import audioop
-except ImportError:
-    import sys
-    from audioop_lts import audioop
-    sys.modules["audioop"] = audioop
-# --------------------------------
-
-from pydub import AudioSegment
 import os
 
-AudioSegment.converter = r"C:/ffmpeg/bin/ffmpeg.exe"
-AudioSegment.ffprobe = r"C:/ffmpeg/bin/ffprobe.exe"
+from dj_library import scan_library
+from dj_loudness import LoudnessIndex, analyze_library, TARGET_LUFS
+
+# 以前はフォルダ内のMP3を目標の dBFS に揃えて上書き保存していたが、保存のたびに再エンコードで音質が落ちるため、
+# 今は dj_loudness.py で曲ごとのラウドネス（LUFS）を測って loudness_index.json に記録するだけにしている。
+# 音量の補正はプレイヤーが再生する時に行う（LOUDNESS_TARGET）。音声ファイルは書き換えない。
 
-def normalize_with_report(folder_path, target_dbfs=-20.0):
+def normalize_with_report(folder_path, target_lufs=TARGET_LUFS):
     """
-    フォルダ内のMP3の音量を報告し、一定に揃えて上書きする
+    フォルダ内の曲のラウドネスを測って報告し、再生時の音量補正のために記録する
     """
     # フォルダが存在するか確認
     if not os.path.exists(folder_path):
         print(f"エラー: フォルダ '{folder_path}' が見つかりません。")
         return
 
-    print(f"--- 音量調整ミッション開始（目標: {target_dbfs} dBFS） ---")
-
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".mp3"):
-            file_path = os.path.join(folder_path, filename)
-            
-            # 1. 音声ファイルを読み込む
-            song = AudioSegment.from_file(file_path, format="mp3")
-            
-            # 2. 現在の音量を取得（組み込みポイント！）
-            before_dbfs = song.dBFS
-            
-            # 3. 目標値との差分を計算して調整
-            change_in_dbfs = target_dbfs - before_dbfs
-            normalized_song = song.apply_gain(change_in_dbfs)
-            
-            # 4. 上書き保存
-            normalized_song.export(file_path, format="mp3")
-            
-            # 5. 結果を報告
-            print(f"【{filename}】")
-            print(f"  調整前: {before_dbfs:.2f} dB")
-            print(f"  調整後: {normalized_song.dBFS:.2f} dB (差分: {change_in_dbfs:+.2f} dB)")
-            print("-" * 30)
-
-    print("--- すべての曲の調整が完了しました！ ---")
+    # 前回から変わった曲だけを、並列に解析する（プロセス数は dj_loudness.ANALYSIS_WORKERS まで）
+    analyze_library(list(scan_library(folder_path).values()), LoudnessIndex(), target=target_lufs)
 
 # --- 実行セクション ---
 # あなたの音楽フォルダのパスに書き換えてください
-music_folder = "D:/Music" 
-normalize_with_report(music_folder, target_dbfs=-20.0)
\ No newline at end of file
+if __name__ == "__main__":
+    music_folder = "D:/Music"
+    normalize_with_report(music_folder, target_lufs=TARGET_LUFS)